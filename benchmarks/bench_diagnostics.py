@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmarks of the convergence diagnostics, the parameter pool and the return
+levels, which run on the full Markov chains after sampling
+"""
+
+import numpy as np
+
+from sspipeline.acf import ACF
+from sspipeline.acf import bulk_ess
+from sspipeline.core import diagnostic_plots
+from sspipeline.core import final_params_pool
+from sspipeline.core import gof_diagnostics
+from sspipeline.gelman_rubin import GR_diag
+from sspipeline.gelman_rubin import psrf
+
+from .common import TRUE_PARAMS
+from .common import annual_maxima
+from .common import chains
+
+
+class Convergence:
+    params = [1000, 10000, 100000]
+    param_names = ["n_iter"]
+    timeout = 300
+
+    def setup(self, n_iter):
+        self.chains = chains(3, n_iter)
+        # The sequences of the shape parameter, as passed to the diagnostics
+        self.sequences = [chain[2] for chain in self.chains]
+
+    def time_psrf(self, n_iter):
+        psrf(self.sequences)
+
+    def time_GR_diag(self, n_iter):
+        GR_diag(self.sequences, 1.1, interval=max(n_iter // 100, 100))
+
+    def time_ACF(self, n_iter):
+        ACF(self.sequences[0], 0.05, 100)
+
+    def time_bulk_ess(self, n_iter):
+        bulk_ess(self.sequences)
+
+
+class ReturnLevels:
+    params = [1000, 10000, 100000]
+    param_names = ["pool_size"]
+    timeout = 300
+
+    def setup(self, pool_size):
+        self.data = annual_maxima(50)
+        self.chains = chains(3, pool_size // 3 + 1, rho=0)
+        self.pool, _ = final_params_pool(self.chains, 0, [1, 1, 1])
+
+    def time_final_params_pool(self, pool_size):
+        final_params_pool(self.chains, 0, [1, 1, 1])
+
+    def time_return_levels(self, pool_size):
+        diagnostic_plots(self.data, TRUE_PARAMS, self.pool, plot=False)
+
+    def peakmem_return_levels(self, pool_size):
+        diagnostic_plots(self.data, TRUE_PARAMS, self.pool, plot=False)
+
+    def time_gof_diagnostics(self, pool_size):
+        gof_diagnostics(self.data, TRUE_PARAMS)
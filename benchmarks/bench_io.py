@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmarks of reading and cleaning the hourly tide gauge records
+"""
+
+import logging
+import os
+import tempfile
+
+from sspipeline.gaugefile import convert_gauge
+from sspipeline.utils import read_and_clean
+
+from .common import write_gauge
+
+
+class ReadAndClean:
+    params = [10, 40]
+    param_names = ["n_years"]
+    timeout = 600
+
+    def setup_cache(self):
+        # The gauges are written once, and shared by every repeat
+        directory = tempfile.mkdtemp()
+        paths = {}
+        for n_years in self.params:
+            paths[n_years] = os.path.join(directory, str(n_years) + ".csv")
+            write_gauge(paths[n_years], n_years)
+            convert_gauge(paths[n_years], paths[n_years][:-4] + ".gauge")
+        return paths
+
+    def setup(self, paths, n_years):
+        self.logger = logging.getLogger("sspipeline.benchmarks")
+
+    def time_read_and_clean(self, paths, n_years):
+        read_and_clean(paths[n_years], 0.9, logger=self.logger)
+
+    def peakmem_read_and_clean(self, paths, n_years):
+        read_and_clean(paths[n_years], 0.9, logger=self.logger)
+
+    def time_read_and_clean_binary(self, paths, n_years):
+        read_and_clean(paths[n_years][:-4] + ".gauge", 0.9, logger=self.logger)
+
+    def peakmem_read_and_clean_binary(self, paths, n_years):
+        read_and_clean(paths[n_years][:-4] + ".gauge", 0.9, logger=self.logger)
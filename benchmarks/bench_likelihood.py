@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmarks of the GEV log-posterior, which is evaluated once per iteration of
+every Markov chain
+"""
+
+import numpy as np
+
+from sspipeline.gev_utils import batch_logpost
+from sspipeline.gev_utils import logpost
+from sspipeline.gev_utils import prepare_data
+from sspipeline.kernels import make_logpost
+from sspipeline.priors import compile_prior
+
+from .common import TRUE_PARAMS
+from .common import annual_maxima
+
+
+class LogPost:
+    params = [25, 100, 1000]
+    param_names = ["n_years"]
+
+    def setup(self, n_years):
+        self.data = prepare_data(annual_maxima(n_years))
+        self.prior = compile_prior()
+        self.kernel = make_logpost(self.prior.table)
+        rng = np.random.RandomState(0)
+        self.batch = TRUE_PARAMS * (1 + 0.05 * rng.normal(size=(100, 3)))
+
+    def time_logpost(self, n_years):
+        logpost(TRUE_PARAMS, self.data, self.prior)
+
+    def time_logpost_outside_support(self, n_years):
+        logpost([3000.0, 150.0, 0.5], self.data, self.prior)
+
+    def time_kernel_logpost(self, n_years):
+        self.kernel(np.array(TRUE_PARAMS), self.data.sorted)
+
+    def time_batch_logpost(self, n_years):
+        batch_logpost(self.batch, self.data, self.prior)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmarks of the adaptive Metropolis-Hastings sampler. The proposal and
+covariance updates (formerly `random_move` and `update_cov`) are fused into
+the block kernel `kernels.adaptive_block`, so they are timed through it.
+"""
+
+from functools import partial
+
+import numpy as np
+
+from sspipeline.core import adaptivemcmc
+from sspipeline.gev_utils import logpost
+from sspipeline.gev_utils import prepare_data
+from sspipeline.kernels import HAVE_NUMBA
+from sspipeline.kernels import adaptive_block
+from sspipeline.kernels import make_logpost
+from sspipeline.priors import compile_prior
+
+from .common import TRUE_PARAMS
+from .common import annual_maxima
+
+if HAVE_NUMBA:
+    from sspipeline.kernels import jit_adaptive_block
+
+
+class AdaptiveBlock:
+    params = (["numpy", "numba"], [False, True])
+    param_names = ["backend", "adapted"]
+    n_iter = 1000
+
+    def setup(self, backend, adapted):
+        if backend == "numba" and not HAVE_NUMBA:
+            raise NotImplementedError("Numba is not installed")
+        self.data = prepare_data(annual_maxima(50)).sorted
+        table = compile_prior().table
+        if backend == "numba":
+            self.kernel = jit_adaptive_block
+            self.logpost = make_logpost(table, jit=True)
+        else:
+            self.kernel = adaptive_block
+            self.logpost = make_logpost(table)
+        rng = np.random.RandomState(0)
+        self.z = rng.normal(size=(self.n_iter, 3))
+        self.u = rng.uniform(size=self.n_iter)
+        # Past the adaptation, every iteration factors the running covariance
+        self.t0 = -1 if adapted else self.n_iter
+        self.run()
+
+    def run(self):
+        state = np.array(TRUE_PARAMS)
+        M2 = np.diag([100.0, 10.0, 0.0001]) * 100
+        out = np.empty((4, self.n_iter + 1))
+        self.kernel(
+            state,
+            self.logpost(state, self.data),
+            state.copy(),
+            M2,
+            101,
+            self.data,
+            self.z,
+            self.u,
+            0,
+            self.t0,
+            np.array([10.0, 2.0, 0.01]),
+            2.4 ** 2 / 3,
+            out,
+            self.logpost,
+        )
+
+    def time_adaptive_block(self, backend, adapted):
+        self.run()
+
+
+class AdaptiveMCMC:
+    params = ["numpy", "numba"]
+    param_names = ["backend"]
+    timeout = 300
+
+    def setup(self, backend):
+        if backend == "numba" and not HAVE_NUMBA:
+            raise NotImplementedError("Numba is not installed")
+        self.data = prepare_data(annual_maxima(50))
+        self.prior = compile_prior()
+        self.logpost = partial(logpost, prior=self.prior)
+        # Compile the kernels outside of the timings
+        self.run(backend, 10)
+
+    def run(self, backend, n_iter):
+        np.random.seed(0)
+        adaptivemcmc(
+            TRUE_PARAMS,
+            n_iter,
+            [10, 2, 0.01],
+            self.data,
+            self.logpost,
+            n_iter // 10,
+            backend,
+            prior=self.prior,
+        )
+
+    def time_adaptivemcmc(self, backend):
+        self.run(backend, 500)
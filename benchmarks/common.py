@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Deterministic synthetic data sets and Markov chains shared by the benchmarks
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+# GEV parameters of the synthetic gauges (mm, mm, unitless)
+TRUE_PARAMS = [900.0, 150.0, 0.1]
+
+
+def annual_maxima(n_years, seed=0):
+    """
+    `n_years` annual maxima drawn from the GEV distribution with `TRUE_PARAMS`
+    """
+    mu, sigma, xi = TRUE_PARAMS
+    return stats.genextreme.rvs(
+        c=-xi, loc=mu, scale=sigma, size=n_years, random_state=seed
+    )
+
+
+def chains(m, n, seed=0, rho=0.9):
+    """
+    `m` synthetic Markov chains of length `n` in the format returned by
+    `core.runner`: AR(1) processes with autocorrelation `rho` about
+    `TRUE_PARAMS`, with the scale of a typical posterior.
+    """
+    rng = np.random.RandomState(seed)
+    scale = np.array([30.0, 20.0, 0.1])
+    x = np.zeros((m, 3, n))
+    x[:, :, 0] = rng.normal(size=(m, 3))
+    noise = rng.normal(size=(m, 3, n)) * np.sqrt(1 - rho ** 2)
+    for t in range(1, n):
+        x[:, :, t] = rho * x[:, :, t - 1] + noise[:, :, t]
+    x = np.array(TRUE_PARAMS)[:, np.newaxis] + scale[:, np.newaxis] * x
+    return x.tolist()
+
+
+def write_gauge(path, n_years, seed=0, missing=0.05):
+    """
+    Write `n_years` of a synthetic hourly tide gauge record to `path`, in the
+    UHSLC CSV format read by `utils.read_and_clean`, with a fraction `missing`
+    of the hours replaced by the fill in value.
+    """
+    rng = np.random.RandomState(seed)
+    hours = pd.date_range(str(1970), str(1970 + n_years), freq="h", inclusive="left")
+    t = np.arange(len(hours))
+    sealevel = 2000 + 300 * np.sin(2 * np.pi * t / 12.42) + rng.normal(0, 30, len(t))
+    sealevel = np.round(sealevel).astype(int)
+    sealevel[rng.rand(len(t)) < missing] = -32767
+    pd.DataFrame(
+        {
+            "year": hours.year,
+            "month": hours.month,
+            "day": hours.day,
+            "hour": hours.hour,
+            "sealevel": sealevel,
+        }
+    ).to_csv(path, header=False, index=False)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+End-to-end scaling harness: runs the full `sspipeline` command line tool on
+synthetic gauges from known GEV parameters, across a grid of record lengths,
+`iterations` and `sequences`, and records the wall time, peak memory, ESS per
+second, return level error and time of each stage of every run to
+scaling.csv, along with scaling plots. Run it from the top directory of the
+repository with::
+
+    python -m benchmarks.scaling --years 10,50,200 --iterations 2000,20000
+"""
+
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+
+import click
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from sspipeline.synthetic import synthetic_gauge
+from sspipeline.synthetic import true_return_levels
+
+PARAMS = (900, 150, 0.1)
+GRID = ["years", "iterations", "sequences"]
+
+
+def integers(ctx, param, value):
+    return [int(x) for x in value.split(",")]
+
+
+def run(config, run_dir, params):
+    """
+    Run the command line tool with the `config` in `run_dir`, and collect its
+    measurements, with the return level error against the GEV `params` of the
+    gauge
+    """
+    for subdir in ["plots", "parameters"]:
+        if not os.path.isdir(os.path.join(run_dir, subdir)):
+            os.makedirs(os.path.join(run_dir, subdir))
+    config_file = os.path.join(run_dir, "config.json")
+    with open(config_file, "w") as f:
+        json.dump(config, f, indent=2)
+    wall = time.perf_counter()
+    subprocess.check_call(
+        [sys.executable, "-m", "sspipeline", "--config", config_file],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    result = {"wall": time.perf_counter() - wall}
+    with open(os.path.join(run_dir, "profile.json")) as f:
+        profile = json.load(f)
+    result["peak_rss_mb"] = max(s["peak_rss_mb"] or 0 for s in profile["stages"])
+    # The chains (or the sampler) are summed into one sampling stage
+    for s in profile["stages"]:
+        name = s["stage"]
+        if name.startswith("chain ") or name.startswith("sampler"):
+            name = "sampling"
+        key = "stage: " + name
+        result[key] = result.get(key, 0) + s["wall"]
+    ess = pd.read_csv(os.path.join(run_dir, "ess.csv"), index_col="chain")
+    for name in ["mu", "sigma", "xi"]:
+        result["ess_per_sec_" + name] = ess["ess_per_sec_" + name]["total"]
+    # Relative error of the centre of the 90% credible interval, and whether
+    # the interval covers the true return levels
+    levels = pd.read_csv(os.path.join(run_dir, "return_levels.csv"), index_col=0)
+    truth = true_return_levels(params, levels.index)
+    error = np.abs((levels["5"] + levels["95"]).values / 2 - truth) / truth
+    for period in [10, 100, 500]:
+        result["rl_error_" + str(period)] = float(error[levels.index == period][0])
+    result["rl_coverage"] = float(
+        np.mean((levels["5"].values <= truth) & (truth <= levels["95"].values))
+    )
+    return result
+
+
+def scaling_plots(df, output_dir):
+    """
+    Plot the time of each stage and the peak memory against each grid variable
+    that was varied (taking the median over the others)
+    """
+    stages = [c for c in df.columns if c.startswith("stage: ")]
+    for variable in GRID:
+        if df[variable].nunique() < 2:
+            continue
+        medians = df.groupby(variable).median(numeric_only=True)
+        fig, ax = plt.subplots(nrows=1, ncols=2, figsize=(16, 6))
+        for i, stage in enumerate(["wall"] + stages):
+            ax[0].plot(
+                medians.index,
+                medians[stage],
+                marker="o",
+                linestyle="-" if i < 10 else "--",
+                label=stage[len("stage: ") :] if stage != "wall" else "total",
+            )
+        ax[0].set_xscale("log")
+        ax[0].set_yscale("log")
+        ax[0].set_xlabel(variable, fontsize=14)
+        ax[0].set_ylabel("Wall Time [s]", fontsize=14)
+        ax[0].legend(loc="best", fontsize=8)
+        ax[0].grid(alpha=0.5)
+        ax[1].plot(medians.index, medians["peak_rss_mb"], marker="o", color="black")
+        ax[1].set_xscale("log")
+        ax[1].set_xlabel(variable, fontsize=14)
+        ax[1].set_ylabel("Peak Memory [MB]", fontsize=14)
+        ax[1].grid(alpha=0.5)
+        fig.savefig(os.path.join(output_dir, "scaling_" + variable + ".png"))
+        plt.close(fig)
+
+
+@click.command(context_settings=dict(help_option_names=["-h", "--help"]))
+@click.option(
+    "--years",
+    callback=integers,
+    default="10,50,200",
+    show_default=1,
+    help="Record lengths of the synthetic gauges.",
+)
+@click.option(
+    "--iterations",
+    callback=integers,
+    default="2000,10000",
+    show_default=1,
+    help="Iterations of each Markov chain.",
+)
+@click.option(
+    "--sequences",
+    callback=integers,
+    default="3",
+    show_default=1,
+    help="Numbers of Markov chains.",
+)
+@click.option(
+    "--interval",
+    type=int,
+    default=1,
+    show_default=1,
+    help="Hours between the measurements of the synthetic gauges.",
+)
+@click.option(
+    "--config",
+    "extra",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="Configuration file with further parameters for every run.",
+)
+@click.option(
+    "--output-dir",
+    default="scaling",
+    show_default=1,
+    help="Where to put the gauges, runs, scaling.csv and plots.",
+)
+@click.option("--seed", type=int, default=0, show_default=1)
+def main(years, iterations, sequences, interval, extra, output_dir, seed):
+    """Scaling harness for the sspipeline command line tool"""
+    base = {}
+    if extra is not None:
+        with open(extra) as f:
+            base = json.load(f)
+    gauges = {}
+    for n_years in years:
+        gauges[n_years] = os.path.join(output_dir, "gauge-" + str(n_years) + ".csv")
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        synthetic_gauge(gauges[n_years], n_years, PARAMS, interval, seed=seed)
+    rows = []
+    for n_years, n_iter, m in itertools.product(years, iterations, sequences):
+        name = "{0}y-{1}i-{2}s".format(n_years, n_iter, m)
+        run_dir = os.path.join(output_dir, name) + "/"
+        config = dict(base)
+        config.update(
+            {
+                "data": gauges[n_years],
+                "output_dir": run_dir,
+                "iterations": n_iter,
+                "sequences": m,
+                "transition": base.get("transition", [10, 2, 0.01]),
+                # Coarser records have fewer measurements per year
+                "percentage": base.get("percentage", 0.9) / interval,
+                "plot": 0,
+                "verbose": 0,
+            }
+        )
+        click.echo("running " + name)
+        row = {"years": n_years, "iterations": n_iter, "sequences": m}
+        row.update(run(config, run_dir, PARAMS))
+        rows.append(row)
+    df = pd.DataFrame(rows)
+    df.to_csv(os.path.join(output_dir, "scaling.csv"), index=False)
+    scaling_plots(df, output_dir)
+    click.echo(df[GRID + ["wall", "peak_rss_mb", "ess_per_sec_xi", "rl_error_100"]])
+
+
+if __name__ == "__main__":
+    main()
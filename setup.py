@@ -65,10 +65,9 @@ setup(
         "Programming Language :: Python",
         "Programming Language :: Python :: 3.6",
     ],
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks"]),
     install_requires=[
         "click",
-        "tqdm",
         "numpy",
         "pandas",
         "scipy",
@@ -77,6 +76,7 @@ setup(
         "sphinx_rtd_theme",
         "numpydoc",
     ],
+    extras_require={"numba": ["numba"]},
     entry_points={"console_scripts": ["sspipeline=sspipeline:main"]},
     setup_requires=["setuptools>=38.6.0"],
 )
@@ -18,10 +18,11 @@
 # along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
 
 # Tell module what it's allowed to import
-__all__ = ["acf_result"]
+__all__ = ["acf_result", "autocorrelation", "bulk_ess", "ess_result"]
 
 import matplotlib.pyplot as plt
 import numpy as np
+from scipy import stats
 
 plt.style.use("ggplot")
 COLORS = ["#34495e", "#95a5a6", "#a76c6e"]
@@ -124,3 +125,64 @@ def acf_result(mcmc_chains, params, burnin, threshold, output_dir="output", plot
                 ax[i].grid(alpha=0.5)
             fig.savefig(output_dir + "/plots/acf.png")
     return lags
+
+
+def autocorrelation(X):
+    """
+    Autocorrelation function of the rows of `X` at every lag, computed with the
+    FFT in O(n log n) time rather than one correlation per lag.
+    """
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+    n = X.shape[-1]
+    X = X - np.mean(X, axis=-1, keepdims=True)
+    # Zero-pad to avoid the circular wrap-around of the FFT
+    nfft = 1 << (2 * n - 1).bit_length()
+    f = np.fft.rfft(X, n=nfft, axis=-1)
+    acov = np.fft.irfft(f * np.conjugate(f), n=nfft, axis=-1)[..., :n]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return acov / acov[..., :1]
+
+
+def bulk_ess(X):
+    """
+    Bulk effective sample size of each row of `X` (one chain per row), from
+    the FFT autocorrelation of the rank-normalized draws (Vehtari et al., 2021;
+    https://doi.org/10.1214/20-BA1221), with Geyer's initial monotone sequence
+    estimator of the integrated autocorrelation time. Chains that never move
+    have an effective sample size of nan.
+    """
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+    n = X.shape[-1]
+    # Rank-normalize, so that the ESS is also meaningful for heavy tails
+    ranks = stats.rankdata(X, axis=-1)
+    Z = stats.norm.ppf((ranks - 0.375) / (n + 0.25))
+    rho = autocorrelation(Z)
+    ess = np.full(len(X), np.nan)
+    for j in range(len(X)):
+        if not np.isfinite(rho[j, 0]):
+            continue
+        # Sums of consecutive pairs of autocorrelations, up to the first one
+        # that is negative, made monotone decreasing
+        pairs = rho[j, : n - n % 2].reshape(-1, 2).sum(axis=1)
+        negative = np.flatnonzero(pairs < 0)
+        if len(negative):
+            pairs = pairs[: negative[0]]
+        pairs = np.minimum.accumulate(pairs)
+        tau = max(-1 + 2 * np.sum(pairs), 1 / np.log10(n)) if n > 1 else 1
+        ess[j] = n / tau
+    return ess
+
+
+def ess_result(mcmc_chains, burnin, walls):
+    """
+    Bulk effective sample size of each parameter of each of the `mcmc_chains`
+    after the `burnin`, and the effective samples per second of sampling, from
+    the wall time of each chain in `walls`. Returns arrays of shape
+    (parameters, chains).
+    """
+    d = len(mcmc_chains[0])
+    ess = np.array(
+        [bulk_ess([chain[i][burnin:] for chain in mcmc_chains]) for i in range(d)]
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return ess, ess / np.array(walls, dtype=float)
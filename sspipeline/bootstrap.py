@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tell module what it's allowed to import
+__all__ = ["bootstrap"]
+
+import multiprocessing
+
+import numpy as np
+import scipy.stats as stats
+
+from .gev_utils import batch_loglikelihood
+
+
+def batch_nelder_mead(f, x0, step, max_iter=1000, xtol=1e-6, ftol=1e-8):
+    """
+    Minimize `B` independent problems at once with the Nelder-Mead simplex
+    method. `f` maps an array of shape (B, k, d) to the (B, k) objective values
+    of `k` candidate points per problem, so that every simplex update is a
+    single vectorized call. `x0` holds the (B, d) starting points and `step`
+    the size of the initial simplex along each coordinate.
+
+    Returns the (B, d) minimizers, their objective values, and whether each
+    problem met the convergence tolerances.
+    """
+    B, d = x0.shape
+    alpha, gamma, rho, shrink = 1.0, 2.0, 0.5, 0.5
+    simplex = np.repeat(x0[:, np.newaxis, :], d + 1, axis=1)
+    simplex[:, 1:, :] += np.identity(d) * np.reshape(step, (-1, 1, d))
+    F = f(simplex)
+    rows = np.arange(B)
+    converged = np.zeros(B, dtype=bool)
+    for it in range(max_iter):
+        order = np.argsort(F, axis=1)
+        simplex = np.take_along_axis(simplex, order[:, :, np.newaxis], axis=1)
+        F = np.take_along_axis(F, order, axis=1)
+        with np.errstate(invalid="ignore"):
+            fspread = np.abs(F[:, -1] - F[:, 0])
+            xspread = np.max(np.abs(simplex[:, 1:] - simplex[:, :1]), axis=(1, 2))
+            converged = (fspread <= ftol * (1 + np.abs(F[:, 0]))) & (
+                xspread <= xtol * (1 + np.max(np.abs(simplex[:, 0]), axis=1))
+            )
+        if np.all(converged):
+            break
+        # Reflection, expansion and both contractions, evaluated in one call
+        centroid = np.mean(simplex[:, :-1], axis=1)
+        worst = simplex[:, -1]
+        xr = centroid + alpha * (centroid - worst)
+        candidates = np.stack(
+            [
+                xr,
+                centroid + gamma * (xr - centroid),
+                centroid + rho * (xr - centroid),
+                centroid + rho * (worst - centroid),
+            ],
+            axis=1,
+        )
+        fc = f(candidates)
+        fr, fe, fo, fi = fc[:, 0], fc[:, 1], fc[:, 2], fc[:, 3]
+        choice = np.full(B, -1)
+        best = fr < F[:, 0]
+        choice[best & (fe < fr)] = 1
+        choice[best & ~(fe < fr)] = 0
+        middle = ~best & (fr < F[:, -2])
+        choice[middle] = 0
+        outside = ~best & ~middle & (fr < F[:, -1])
+        choice[outside & (fo <= fr)] = 2
+        inside = ~best & ~middle & ~outside
+        choice[inside & (fi < F[:, -1])] = 3
+        choice[converged] = -2
+        replace = choice >= 0
+        simplex[replace, -1] = candidates[rows[replace], choice[replace]]
+        F[replace, -1] = fc[rows[replace], choice[replace]]
+        # Shrink the simplices for which no candidate was acceptable
+        shrinking = choice == -1
+        if np.any(shrinking):
+            best_point = simplex[shrinking, :1]
+            simplex[shrinking, 1:] = best_point + shrink * (
+                simplex[shrinking, 1:] - best_point
+            )
+            F[shrinking] = f(simplex)[shrinking]
+    best = np.argmin(F, axis=1)
+    return simplex[rows, best], F[rows, best], converged
+
+
+def fit_gev(samples, x0):
+    """
+    Maximum likelihood fits of a GEV distribution to each row of the (B, n)
+    array `samples`, with all `B` fits advanced together by
+    `batch_nelder_mead` from the (B, 3) starting points `x0`.
+    """
+
+    def objective(params):
+        return -batch_loglikelihood(params, samples[:, np.newaxis, :])
+
+    step = np.transpose([0.1 * x0[:, 1], 0.1 * x0[:, 1], np.full(len(x0), 0.05)])
+    return batch_nelder_mead(objective, x0, step)
+
+
+def fit_chunk(args):
+    """
+    Process pool helper for `bootstrap`.
+    """
+    samples, x0 = args
+    return fit_gev(samples, x0)
+
+
+def bootstrap(data_meas, n_samples=1000, processes=1):
+    """
+    Parametric bootstrap alternative to `runner`. The GEV distribution is first
+    fitted to `data_meas` by maximum likelihood. Then `n_samples` synthetic
+    annual maximum records of the same length are simulated from the fitted
+    distribution in one (n_samples, n) array, and all of them are refitted at
+    once with a batched Nelder-Mead optimizer. With `processes` > 1 the refits
+    are split across a process pool.
+
+    Returns the refitted parameter sets in the same shape as a single
+    `adaptivemcmc` chain (so that `final_params_pool` can be used with no
+    burn-in and a lag of 1), the maximum likelihood parameters, and the
+    fraction of refits that converged (refits that did not reach a finite
+    likelihood are dropped).
+    """
+    np.seterr(divide="ignore", invalid="ignore")
+    data = np.asarray(data_meas, dtype=float)
+    scale_est = np.sqrt(6) * np.std(data) / np.pi
+    loc_est = np.mean(data) - 0.5772 * scale_est
+    x0 = np.array([[loc_est, scale_est, 0.01]])
+    mle, nll, _ = fit_gev(data[np.newaxis, :], x0)
+    mle = mle[0]
+
+    samples = stats.genextreme.rvs(
+        c=-mle[2], loc=mle[0], scale=mle[1], size=(n_samples, len(data))
+    )
+    starts = np.repeat(mle[np.newaxis, :], n_samples, axis=0)
+    if processes > 1:
+        chunks = np.array_split(np.arange(n_samples), processes)
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(
+                fit_chunk, [(samples[chunk], starts[chunk]) for chunk in chunks]
+            )
+        finally:
+            pool.close()
+            pool.join()
+        params = np.concatenate([result[0] for result in results])
+        nll = np.concatenate([result[1] for result in results])
+        converged = np.concatenate([result[2] for result in results])
+    else:
+        params, nll, converged = fit_gev(samples, starts)
+    params = params[np.isfinite(nll)]
+    return [np.transpose(params).tolist()], list(mle), float(np.mean(converged))
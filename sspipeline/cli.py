@@ -18,13 +18,16 @@
 # along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
 
 # Tell module what it's allowed to import
-__all__ = ["main"]
+__all__ = ["main", "run_pipeline"]
 
 import json
 import logging
+import os
+from functools import partial
 
 import click
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 
 from .core import output_parameters
@@ -32,77 +35,91 @@ from .core import diagnostic_plots
 from .core import final_params_pool
 from .core import history_plots
 from .core import max_ls_parameters
+from .core import read_proposals
 from .core import runner
+from .core import store_chains
+from .core import write_proposals
 
 from .gelman_rubin import GR_result
 
 from .acf import acf_result
+from .acf import ess_result
 
-from .gev_utils import logpost
+from .events import ConsoleSink
+from .events import EventStream
+from .events import JSONLinesSink
+from .events import LogEvents
+
+from . import gev_utils
+from .gev_utils import batch_loglikelihood
+from .gev_utils import prepare_data
+
+from .gaugefile import EXTENSION
+from .gaugefile import convert_gauge
+
+from .bootstrap import bootstrap
+
+from .kernels import BACKENDS
+from .kernels import HAVE_NUMBA
+from .kernels import resolve_backend
+
+from .laplace import laplace
+
+from .multisite import multisite_runner
+
+from . import pot
+
+from .priors import compile_prior
+
+from .profiling import Profiler
+from .profiling import stage
+
+from .smc import read_pool
+from .smc import smc
+
+from .service import serve_forever
+
+from .summaries import combine_summaries
 
 from .utils import check_params
 from .utils import read_and_clean
+from .utils import read_exceedances
 from .utils import log
+from .utils import plot_annual_maxima
+from .utils import read_stations
 
 from .__version__ import __version__
 
 
-@click.command(context_settings=dict(help_option_names=["-h", "--help"]))
-@click.version_option(version=__version__)
-@click.option(
-    "--config",
-    type=click.Path(
-        exists=False, file_okay=True, dir_okay=False, readable=True, allow_dash=False
-    ),
-    default="config.json",
-    show_default=1,
-    help="Read configuration from PATH.",
-)
-@click.pass_context
-def main(ctx, config):
-    """A pipeline for estimating and characterizing uncertainty in coastal storm surge levels"""
-
-    # Read in the config file
-    with open(config) as f:
-        config_data = json.load(f)
-    config_data = check_params(config_data)
-    # Start up the logger
-    logging.basicConfig(
-        filename=config_data["output_dir"] + "/sspipeline.log",
-        format="%(asctime)s %(message)s",
-        filemode="w",
-    )
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
-    # Log where the configuration file is at
-    logger = log(
-        logger, "the config file is located at " + config, config_data["verbose"]
-    )
-    # Put the config file into the log file
-    logger.info("==> CONFIG FILE PARAMETERS")
-    for key, value in sorted(config_data.items()):
-        logger.info("==> \t {:>10} : ".format(key) + str(value))
-    # Clean up the data
-    data_meas, logger = read_and_clean(
-        config_data["data"],
-        config_data["percentage"],
-        config_data["output_dir"],
-        logger,
-        config_data["verbose"],
-        config_data["plot"],
-    )
-    # Run the Adaptive Metropolis-Hastings Algorithm on the chains
-    mcmc_chains, ar, ls = runner(
-        m=config_data["sequences"],
-        n_iter=config_data["iterations"],
-        t=config_data["adaption"],
-        logpost=logpost,
-        data_meas=data_meas,
-        stepsize=config_data["transition"],
-    )
+def chain_results(
+    mcmc_chains,
+    ar,
+    ls,
+    config_data,
+    output_dir,
+    logger,
+    summaries=None,
+    profiler=None,
+    prefix="",
+    warmup=None,
+):
+    """
+    Diagnose the Markov chains: plot their histories, log their acceptance
+    rates, burn them in with the Gelman & Rubin diagnostic, thin them with the
+    ACF, and find the parameters with the maximum log-posterior score (from the
+    online `summaries` of the chains, if they were kept, along with the
+    posterior summaries). Each step is timed as a stage of the `profiler`, with
+    its name preceded by `prefix`. The burn-in is at least the `warmup`
+    iterations (by default, the "adaption" period). The online summaries are
+    kept from the end of the warm-up, so they are logged as running summaries
+    from there, with a warning if the burn-in is longer.
+    """
+    if warmup is None:
+        warmup = config_data["adaption"]
     # Plot the history plots for the chains
     if config_data["plot"]:
-        history_plots(mcmc_chains=mcmc_chains, output_dir=config_data["output_dir"])
+        with stage(profiler, prefix + "history plots"):
+            history_plots(mcmc_chains=mcmc_chains, output_dir=output_dir)
     # Log the acceptance rates
     logger = log(
         logger,
@@ -110,33 +127,107 @@ def main(ctx, config):
         config_data["verbose"],
     )
     # Burnin the chains!
-    burnin = GR_result(
-        mcmc_chains=mcmc_chains,
-        params=[r"$\mu$", r"$\sigma$", r"$\xi$"],
-        t=config_data["adaption"],
-        threshold=config_data["gr_threshold"],
-        output_dir=config_data["output_dir"],
-        plot=config_data["plot"],
-    )
+    with stage(profiler, prefix + "GR_result", len(mcmc_chains)):
+        burnin = GR_result(
+            mcmc_chains=mcmc_chains,
+            params=[r"$\mu$", r"$\sigma$", r"$\xi$"],
+            t=warmup,
+            threshold=config_data["gr_threshold"],
+            output_dir=output_dir,
+            plot=config_data["plot"],
+        )
     # Thin the chains!
-    lags = acf_result(
-        mcmc_chains,
-        [r"$\mu$", r"$\sigma$", r"$\xi$"],
-        burnin,
-        config_data["acf_threshold"],
-        config_data["output_dir"],
-        config_data["plot"],
+    with stage(profiler, prefix + "acf_result", len(mcmc_chains)):
+        lags = acf_result(
+            mcmc_chains,
+            [r"$\mu$", r"$\sigma$", r"$\xi$"],
+            burnin,
+            config_data["acf_threshold"],
+            output_dir,
+            config_data["plot"],
+        )
+    if not summaries:
+        # Find the maximum parameters
+        with stage(profiler, prefix + "max_ls_parameters", len(mcmc_chains)):
+            max_params = max_ls_parameters(
+                ls, mcmc_chains, logger, config_data["verbose"]
+            )
+        return burnin, lags, max_params, logger
+    # Report the summaries kept while sampling, without re-scanning the chains
+    with stage(profiler, prefix + "combine_summaries", len(summaries)):
+        pooled = combine_summaries(summaries)
+    max_params = pooled["map_params"]
+    logger = log(
+        logger,
+        "the parameters with max log-posterior score are: ["
+        + str(max_params[0] / 1000)
+        + ", "
+        + str(max_params[1] / 1000)
+        + ", "
+        + str(max_params[2])
+        + "]",
+        config_data["verbose"],
     )
-    # Calculate the final parameter pool
-    params_analysis = final_params_pool(
-        mcmc_chains=mcmc_chains,
-        burnin=burnin,
-        lags=lags,
-        output_dir=config_data["output_dir"],
-        plot=config_data["plot"],
+    logger = log(
+        logger,
+        "the acceptance rates over the last iterations of these Markov chains "
+        "are: " + str(pooled["acceptance"]),
+        config_data["verbose"],
     )
-    # Find the maximum parameters
-    max_params = max_ls_parameters(ls, mcmc_chains, logger, config_data["verbose"])
+    # The summaries were kept from the end of the warm-up, not from the burn-in
+    # that the parameter pool (and so the return levels) starts from
+    if burnin > warmup:
+        logger = log(
+            logger,
+            "WARNING : the running posterior summaries below start at iteration "
+            "{0}, before the Gelman & Rubin burn-in of {1} iterations, so they "
+            "may include draws from before convergence and differ from the "
+            "posterior used for the return levels".format(warmup, burnin),
+            True,
+        )
+    for i, (name, units) in enumerate([("mu", 1000), ("sigma", 1000), ("xi", 1)]):
+        logger = log(
+            logger,
+            "the running posterior mean (sd) [quantiles {0}] of {1} from iteration "
+            "{2} is {3} ({4}) {5}".format(
+                list(pooled["quantiles"]),
+                name,
+                warmup,
+                round(pooled["mean"][i] / units, 4),
+                round(pooled["std"][i] / units, 4),
+                [round(q[i] / units, 4) for q in pooled["quantiles"].values()],
+            ),
+            config_data["verbose"],
+        )
+    return burnin, lags, max_params, logger
+
+
+def write_results(
+    data_meas,
+    mcmc_chains,
+    burnin,
+    lags,
+    max_params,
+    config_data,
+    output_dir,
+    logger,
+    profiler=None,
+    prefix="",
+):
+    """
+    Pool the parameter sets, and write the diagnostic plots, return levels and
+    parameters to `output_dir`, timing each step as a stage of the `profiler`
+    """
+    # Calculate the final parameter pool
+    with stage(profiler, prefix + "final_params_pool") as record:
+        params_analysis, _ = final_params_pool(
+            mcmc_chains=mcmc_chains,
+            burnin=burnin,
+            lags=lags,
+            output_dir=output_dir,
+            plot=config_data["plot"],
+        )
+        record["count"] = len(params_analysis)
     # Diagnostic Plots
     (
         percentile_05,
@@ -151,8 +242,9 @@ def main(ctx, config):
         data_meas,
         max_params,
         params_analysis,
-        config_data["output_dir"],
+        output_dir,
         config_data["plot"],
+        profiler,
     )
     # Output return levels
     df = pd.DataFrame(
@@ -173,13 +265,604 @@ def main(ctx, config):
         index={0: 2, 3: 5, 8: 10, 18: 20, 48: 50, 98: 100, 198: 200, 498: 500},
         inplace=True,
     )
-    df.to_csv(config_data["output_dir"] + "/return_levels.csv")
-    # Output the parameters
-    output_parameters(
-        mcmc_chains=mcmc_chains,
-        burnin=burnin,
-        lags=lags,
-        output_dir=config_data["output_dir"],
+    with stage(profiler, prefix + "output"):
+        df.to_csv(output_dir + "/return_levels.csv")
+        # Output the parameters
+        output_parameters(
+            mcmc_chains=mcmc_chains,
+            burnin=burnin,
+            lags=lags,
+            output_dir=output_dir,
+        )
+    return logger
+
+
+def efficiency_results(
+    mcmc_chains, burnin, walls, total_wall, config_data, output_dir, logger
+):
+    """
+    Log the bulk effective sample size per second of sampling of each parameter
+    (see `acf.ess_result`), from the wall time `walls` of each chain and the
+    `total_wall` time of the sampler (neither of which includes the "compile"
+    stage of the Numba kernels), and write them for each chain to ess.csv in
+    `output_dir`
+    """
+    ess, ess_per_sec = ess_result(mcmc_chains, burnin, walls)
+    names = ["mu", "sigma", "xi"]
+    data = {"wall": list(walls) + [total_wall]}
+    for i, name in enumerate(names):
+        data["ess_" + name] = list(ess[i]) + [np.nansum(ess[i])]
+    for i, name in enumerate(names):
+        data["ess_per_sec_" + name] = list(ess_per_sec[i]) + [
+            np.nansum(ess[i]) / total_wall if total_wall > 0 else np.nan
+        ]
+    df = pd.DataFrame(
+        data=data, index=[str(j + 1) for j in range(len(walls))] + ["total"]
+    )
+    df.index.name = "chain"
+    df.to_csv(output_dir + "/ess.csv")
+    for name in names:
+        logger = log(
+            logger,
+            "the bulk effective sample sizes per second of {0} are {1}, "
+            "{2} in total".format(
+                name,
+                [round(x, 2) for x in df["ess_per_sec_" + name][:-1]],
+                round(df["ess_per_sec_" + name]["total"], 2),
+            ),
+            config_data["verbose"],
+        )
+    return logger
+
+
+def write_profile(profiler, config_data, logger):
+    """
+    Write the measurements of the `profiler` to profile.json in the output
+    directory, and their summary table to the log
+    """
+    profiler.write(config_data["output_dir"])
+    logger.info("==> PROFILE")
+    for line in profiler.table():
+        logger.info("==> \t " + line)
+    return logger
+
+
+def run_pipeline(config_data, config="config.json", listener=None, observers=None):
+    """
+    Run the pipeline with the parameters `config_data`, as read from the
+    configuration file `config`, and write its log to sspipeline.log in the
+    output directory. The `listener` is passed on to the `profiling.Profiler`
+    of the run, to follow its stages as they finish, and the `observers` (by
+    default, the console) are subscribed to its `events.EventStream`, along
+    with the JSON-lines file in the "events" parameter. Returns the profiler.
+    """
+    config_data = check_params(config_data)
+    # Start up the logger, for this run only
+    handler = logging.FileHandler(
+        config_data["output_dir"] + "/sspipeline.log", mode="w"
+    )
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    logger = logging.getLogger("sspipeline")
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    # Time every stage of the run
+    cprofile_dir = None
+    if config_data["cprofile"]:
+        cprofile_dir = config_data["output_dir"] + "/profiles"
+    profiler = Profiler(cprofile_dir, listener)
+    # Publish the progress of the run
+    if observers is None:
+        observers = [ConsoleSink()]
+    events = EventStream(observers, config_data["event_interval"])
+    sink = None
+    if config_data["events"] is not None:
+        sink = JSONLinesSink(config_data["events"])
+        events.subscribe(sink)
+    log_events = LogEvents(events)
+    logger.addHandler(log_events)
+    try:
+        pipeline(config_data, config, logger, profiler, events)
+    finally:
+        logger.removeHandler(log_events)
+        logger.removeHandler(handler)
+        handler.close()
+        if sink is not None:
+            sink.close()
+    return profiler
+
+
+def pipeline(config_data, config, logger, profiler, events):
+    """
+    Helper function to `run_pipeline`, which runs every stage of the pipeline
+    """
+    # Log where the configuration file is at
+    logger = log(
+        logger, "the config file is located at " + config, config_data["verbose"]
+    )
+    # Put the config file into the log file
+    logger.info("==> CONFIG FILE PARAMETERS")
+    for key, value in sorted(config_data.items()):
+        logger.info("==> \t {:>10} : ".format(key) + str(value))
+    # Compile the priors once, and bind them into the log-posterior functions
+    prior = compile_prior(config_data["priors"])
+    logpost = partial(gev_utils.logpost, prior=prior)
+    batch_logpost = partial(gev_utils.batch_logpost, prior=prior)
+    batch_logprior = partial(gev_utils.batch_logprior, prior=prior)
+    grad_logpost = partial(gev_utils.grad_logpost, prior=prior)
+    # Shard the likelihood of large datasets over a pool of threads
+    gev_utils.set_threads(config_data["threads"])
+    if isinstance(config_data["data"], list) or config_data["combined"]:
+        # Jointly fit several gauges, each with its own output directory
+        stations = None
+        if config_data["combined"]:
+            # Read the annual maxima of every station in one pass
+            with stage(profiler, "read_stations") as record:
+                stations, logger = read_stations(
+                    config_data["data"],
+                    config_data["percentage"],
+                    logger,
+                    config_data["verbose"],
+                )
+                record["count"] = sum(len(s) for s in stations.values())
+        site_dirs, data_sites = [], []
+        for datafile in config_data["data"] if stations is None else stations:
+            site = datafile
+            if stations is None:
+                site = os.path.splitext(os.path.basename(datafile))[0]
+            site_dir = os.path.join(config_data["output_dir"], site) + "/"
+            for subdir in ["plots", "parameters"]:
+                if not os.path.isdir(site_dir + subdir):
+                    os.makedirs(site_dir + subdir)
+            if stations is not None:
+                if not stations[site]:
+                    logger = log(
+                        logger,
+                        "WARNING : station " + site + " has no years with enough "
+                        "data, and is left out",
+                        True,
+                    )
+                    continue
+                data_meas = list(stations[site].values())
+                if config_data["plot"]:
+                    plot_annual_maxima(stations[site], site_dir)
+            else:
+                with stage(profiler, site + ": read_and_clean") as record:
+                    data_meas, logger = read_and_clean(
+                        datafile,
+                        config_data["percentage"],
+                        site_dir,
+                        logger,
+                        config_data["verbose"],
+                        config_data["plot"],
+                    )
+                    record["count"] = len(data_meas)
+            site_dirs.append(site_dir)
+            data_sites.append(data_meas)
+        # Run the Adaptive Metropolis-Hastings Algorithm on every gauge at once
+        n_chains = len(data_sites) * config_data["sequences"]
+        events.emit(
+            "chain_start",
+            chain=None,
+            chains=n_chains,
+            n_iter=config_data["iterations"],
+            engine="multisite",
+            message="running "
+            + str(n_chains)
+            + " chains on "
+            + str(len(data_sites))
+            + " gauges at once",
+        )
+        with stage(profiler, "sampler (multisite)", n_chains) as record:
+            results = multisite_runner(
+                data_sites=data_sites,
+                m=config_data["sequences"],
+                n_iter=config_data["iterations"],
+                logprior=batch_logprior,
+                t=config_data["adaption"],
+                stepsize=config_data["transition"],
+                events=events,
+            )
+        chain_ar = [r for mcmc_chains, ar, ls in results for r in ar]
+        for i in range(n_chains):
+            events.emit(
+                "chain_end", chain=i + 1, acceptance=chain_ar[i], wall=record["wall"]
+            )
+            profiler.chain(
+                "chain " + str(i + 1),
+                config_data["iterations"],
+                config_data["iterations"],
+                record["wall"],
+            )
+        for site_dir, data_meas, (mcmc_chains, ar, ls) in zip(
+            site_dirs, data_sites, results
+        ):
+            logger = log(logger, "results for " + site_dir, config_data["verbose"])
+            mcmc_chains = store_chains(mcmc_chains, config_data["storage_dtype"])
+            ls = store_chains(ls, config_data["storage_dtype"])
+            prefix = os.path.basename(os.path.normpath(site_dir)) + ": "
+            burnin, lags, max_params, logger = chain_results(
+                mcmc_chains,
+                ar,
+                ls,
+                config_data,
+                site_dir,
+                logger,
+                profiler=profiler,
+                prefix=prefix,
+            )
+            # The gauges were sampled together, so each chain took the whole
+            # sampling time
+            logger = efficiency_results(
+                mcmc_chains,
+                burnin,
+                [record["wall"]] * len(mcmc_chains),
+                record["wall"],
+                config_data,
+                site_dir,
+                logger,
+            )
+            logger = write_results(
+                data_meas,
+                mcmc_chains,
+                burnin,
+                lags,
+                max_params,
+                config_data,
+                site_dir,
+                logger,
+                profiler,
+                prefix,
+            )
+        logger = write_profile(profiler, config_data, logger)
+        logger = log(logger, "All done!", True)
+        return
+    # Clean up the data
+    with stage(profiler, "read_and_clean") as record:
+        if config_data["extraction"] == "pot":
+            data_meas, exceedances, logger = read_exceedances(
+                config_data["data"],
+                config_data["percentage"],
+                config_data["threshold"],
+                config_data["run_length"],
+                config_data["output_dir"],
+                logger,
+                config_data["verbose"],
+                config_data["plot"],
+            )
+        else:
+            data_meas, logger = read_and_clean(
+                config_data["data"],
+                config_data["percentage"],
+                config_data["output_dir"],
+                logger,
+                config_data["verbose"],
+                config_data["plot"],
+            )
+        # Prepare the data once for the many log-posterior evaluations
+        data_meas = prepare_data(data_meas)
+        record["count"] = len(data_meas)
+    # The data the parameters are fitted to, and their likelihood
+    fit_data, fit_loglikelihood = data_meas, batch_loglikelihood
+    if config_data["extraction"] == "pot":
+        # Fit the peaks over the threshold, with the same GEV parameters for
+        # the annual maxima, which are still used for the diagnostics
+        fit_data = prepare_data(exceedances["peaks"])
+        terms = {
+            "threshold": exceedances["threshold"],
+            "n_years": exceedances["n_years"],
+        }
+        fit_loglikelihood = partial(pot.batch_loglikelihood, **terms)
+        logpost = partial(pot.logpost, prior=prior, **terms)
+        batch_logpost = partial(pot.batch_logpost, prior=prior, **terms)
+    if config_data["mode"] == "laplace":
+        # Approximate the posterior with a Gaussian about its mode
+        with stage(profiler, "sampler (laplace)", config_data["samples"]) as record:
+            mcmc_chains, max_params, quality = laplace(
+                data_meas=fit_data,
+                logpost=batch_logpost,
+                n_samples=config_data["samples"],
+            )
+        logger = log(
+            logger,
+            "the Laplace approximation importance-sampling efficiency is {0}, "
+            "with {1}% of draws outside the GEV support".format(
+                round(quality["ess_fraction"], 3),
+                round(100 * quality["outside_support"], 2),
+            ),
+            config_data["verbose"],
+        )
+        if quality["poor"]:
+            logger = log(
+                logger,
+                "WARNING : the Laplace approximation looks poor for this gauge, "
+                "a full MCMC run is recommended",
+                True,
+            )
+        logger = log(
+            logger,
+            "the parameters at the posterior mode are: ["
+            + str(max_params[0] / 1000)
+            + ", "
+            + str(max_params[1] / 1000)
+            + ", "
+            + str(max_params[2])
+            + "]",
+            config_data["verbose"],
+        )
+        # The draws are already independent, so there is nothing to burn in or
+        # thin
+        burnin, lags = 0, [1]
+        walls = [record["wall"]]
+    elif config_data["mode"] == "bootstrap":
+        # Refit the GEV distribution to records simulated from the MLE
+        with stage(profiler, "sampler (bootstrap)", config_data["samples"]) as record:
+            mcmc_chains, max_params, converged = bootstrap(
+                data_meas=data_meas,
+                n_samples=config_data["samples"],
+                processes=config_data["processes"],
+            )
+        logger = log(
+            logger,
+            "{0}% of the bootstrap refits converged".format(round(100 * converged, 2)),
+            config_data["verbose"],
+        )
+        logger = log(
+            logger,
+            "the maximum likelihood parameters are: ["
+            + str(max_params[0] / 1000)
+            + ", "
+            + str(max_params[1] / 1000)
+            + ", "
+            + str(max_params[2])
+            + "]",
+            config_data["verbose"],
+        )
+        burnin, lags = 0, [1]
+        walls = [record["wall"]]
+    elif config_data["mode"] == "smc":
+        # Temper the particles into the posterior, starting from the previous
+        # run's parameter pool if there is one
+        previous_pool = None
+        if config_data["previous"] is not None:
+            previous_pool = read_pool(config_data["previous"])
+            logger = log(
+                logger,
+                "warm-starting from the {0} parameter sets in {1}, with {2} new "
+                "observations".format(
+                    len(previous_pool),
+                    config_data["previous"],
+                    config_data["new_observations"],
+                ),
+                config_data["verbose"],
+            )
+        with stage(profiler, "sampler (smc)", config_data["samples"]) as record:
+            mcmc_chains, max_params, n_steps = smc(
+                data_meas=data_meas,
+                loglikelihood=batch_loglikelihood,
+                logprior=batch_logprior,
+                n_particles=config_data["samples"],
+                previous_pool=previous_pool,
+                n_new=config_data["new_observations"],
+                processes=config_data["processes"],
+            )
+        logger = log(
+            logger,
+            "the SMC sampler took {0} tempering steps".format(n_steps),
+            config_data["verbose"],
+        )
+        logger = log(
+            logger,
+            "the parameters with max log-posterior score are: ["
+            + str(max_params[0] / 1000)
+            + ", "
+            + str(max_params[1] / 1000)
+            + ", "
+            + str(max_params[2])
+            + "]",
+            config_data["verbose"],
+        )
+        burnin, lags = 0, [1]
+        walls = [record["wall"]]
+    else:
+        if config_data["backend"] == "numba" and not HAVE_NUMBA:
+            logger = log(
+                logger,
+                "WARNING : Numba is not installed, falling back to the NumPy backend",
+                True,
+            )
+        backend = resolve_backend(config_data["backend"])
+        if config_data["extraction"] == "pot":
+            # The compiled kernels only have the likelihood of the annual maxima
+            if config_data["backend"] == "numba":
+                logger = log(
+                    logger,
+                    "WARNING : the Numba backend only fits annual maxima, falling "
+                    "back to the NumPy backend",
+                    True,
+                )
+            backend = "numpy"
+        # The kernels evaluate the GEV log-posterior for the compiled priors
+        # themselves, and the peaks over threshold through `logpost`
+        kernel_prior = prior
+        if config_data["extraction"] == "pot":
+            kernel_prior = None
+        # Warm start the adaptation from a previous run's proposals
+        proposals = [{} for i in range(config_data["sequences"])]
+        if config_data["proposal"] is not None:
+            proposals = read_proposals(
+                config_data["proposal"], config_data["sequences"]
+            )
+            logger = log(
+                logger,
+                "warm-starting the proposals from " + config_data["proposal"],
+                config_data["verbose"],
+            )
+        # Chains warm started with skip_warmup have no adaptation period to burn in
+        warmup = config_data["adaption"]
+        if (
+            config_data["skip_warmup"]
+            and config_data["engine"] == "adaptive"
+            and all(proposals)
+        ):
+            warmup = 0
+        # Run the Adaptive Metropolis-Hastings Algorithm on the chains
+        summaries = []
+        mcmc_chains, ar, ls = runner(
+            m=config_data["sequences"],
+            n_iter=config_data["iterations"],
+            t=config_data["adaption"],
+            logpost=logpost if config_data["engine"] == "adaptive" else batch_logpost,
+            data_meas=fit_data,
+            stepsize=config_data["transition"],
+            engine=config_data["engine"],
+            loglikelihood=fit_loglikelihood,
+            logprior=batch_logprior,
+            n_temps=config_data["temperatures"],
+            grad_logpost=grad_logpost,
+            backend=backend,
+            prior=kernel_prior,
+            summaries=summaries,
+            proposals=proposals,
+            skip_warmup=config_data["skip_warmup"],
+            profiler=profiler,
+            events=events,
+            dtype=config_data["storage_dtype"],
+        )
+        # The sampling time of each chain (the population engines sample all
+        # of the chains together, so theirs are the same)
+        walls = [c["wall"] for c in profiler.chains]
+        if config_data["engine"] == "adaptive":
+            write_proposals(proposals, config_data["output_dir"])
+        burnin, lags, max_params, logger = chain_results(
+            mcmc_chains,
+            ar,
+            ls,
+            config_data,
+            config_data["output_dir"],
+            logger,
+            summaries,
+            profiler,
+            warmup=warmup,
+        )
+    # Keep the stored chains compact (the sampler already stored them so)
+    mcmc_chains = store_chains(mcmc_chains, config_data["storage_dtype"])
+    total_wall = walls[0]
+    if config_data["mode"] == "mcmc" and config_data["engine"] == "adaptive":
+        total_wall = sum(walls)
+    logger = efficiency_results(
+        mcmc_chains,
+        burnin,
+        walls,
+        total_wall,
+        config_data,
+        config_data["output_dir"],
+        logger,
+    )
+    logger = write_results(
+        data_meas,
+        mcmc_chains,
+        burnin,
+        lags,
+        max_params,
+        config_data,
+        config_data["output_dir"],
+        logger,
+        profiler,
     )
+    logger = write_profile(profiler, config_data, logger)
     # Log "All done!"
     logger = log(logger, "All done!", True)
+
+
+@click.group(
+    invoke_without_command=True,
+    context_settings=dict(help_option_names=["-h", "--help"]),
+)
+@click.version_option(version=__version__)
+@click.option(
+    "--config",
+    type=click.Path(
+        exists=False, file_okay=True, dir_okay=False, readable=True, allow_dash=False
+    ),
+    default="config.json",
+    show_default=1,
+    help="Read configuration from PATH.",
+)
+@click.option(
+    "--backend",
+    type=click.Choice(BACKENDS),
+    default=None,
+    help="Override the 'backend' of the adaptive Metropolis-Hastings kernels.",
+)
+@click.option(
+    "--cprofile",
+    is_flag=True,
+    default=False,
+    help="Dump cProfile statistics for every stage of the pipeline.",
+)
+@click.pass_context
+def main(ctx, config, backend, cprofile):
+    """A pipeline for estimating and characterizing uncertainty in coastal storm surge levels"""
+    if ctx.invoked_subcommand is not None:
+        return
+    # Read in the config file
+    with open(config) as f:
+        config_data = json.load(f)
+    if backend is not None:
+        config_data["backend"] = backend
+    if cprofile:
+        config_data["cprofile"] = True
+    run_pipeline(config_data, config)
+
+
+@main.command()
+@click.option(
+    "--host", default="127.0.0.1", show_default=1, help="Address to listen on."
+)
+@click.option(
+    "--port", type=int, default=8765, show_default=1, help="Port to listen on."
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=os.cpu_count(),
+    show_default="the number of CPUs",
+    help="Number of warm worker processes, which is the most jobs run at once.",
+)
+@click.option(
+    "--memory-budget",
+    type=float,
+    default=4096,
+    show_default=1,
+    help="Total estimated memory [MB] of the jobs run at once.",
+)
+def serve(host, port, workers, memory_budget):
+    """Run the pipeline as a local service, for submitting jobs over HTTP"""
+    serve_forever(host, port, workers, memory_budget)
+
+
+@main.command()
+@click.argument(
+    "csvfiles",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, file_okay=True, dir_okay=False, readable=True),
+)
+@click.option(
+    "--output-dir",
+    type=click.Path(exists=True, file_okay=False, dir_okay=True, writable=True),
+    default=None,
+    help="Write the converted files to DIR instead of next to each CSV file.",
+)
+def convert(csvfiles, output_dir):
+    """Convert hourly gauge CSV files into the compact binary format"""
+    for csvfile in csvfiles:
+        path = os.path.splitext(csvfile)[0] + EXTENSION
+        if output_dir is not None:
+            path = os.path.join(output_dir, os.path.basename(path))
+        count, fill = convert_gauge(csvfile, path)
+        click.echo(
+            "{0} -> {1} ({2} hours, fill in value {3})".format(
+                csvfile, path, count, fill
+            )
+        )
@@ -24,141 +24,211 @@ __all__ = [
     "final_params_pool",
     "max_ls_parameters",
     "diagnostic_plots",
+    "gof_diagnostics",
 ]
 
+import json
+
 import matplotlib.pyplot as plt
 import numpy as np
 import scipy.stats as stats
-from tqdm import tqdm
 
+from .demc import demcmc
+from .gev_utils import prepare_data
+from .kernels import HAVE_NUMBA
+from .kernels import adaptive_block
+from .kernels import compile_kernels
+from .kernels import make_logpost
+from .mala import mala
+from .priors import compile_prior
+from .profiling import stage
+from .summaries import OnlineSummary
+from .tempering import parallel_tempering
 from .utils import log
 
+if HAVE_NUMBA:
+    from .kernels import jit_adaptive_block
+
 plt.style.use("ggplot")
 COLORS = ["#34495e", "#95a5a6", "#a76c6e"]
 
-
-def update_mean(m, X):
-    """
-    Online adaptation of the mean of the previous MCMC iterates. Used to
-    tune the MCMC proposal distribution.
-    See Haario et al (2001; https://projecteuclid.org/euclid.bj/1080222083) for
-    more information.
-    """
-    N = len(X[0])
-    n = []
-    for i in range(len(m)):
-        n.append([(m[i][0] * (N - 1) + X[i][-1]) / N])
-    return np.array(n)
-
-
-def update_cov(X, m, Ct, Sd, Id, eps):
-    """
-    Online adaptation of the covariance of the previous MCMC iterates. Used to
-    tune the MCMC proposal distribution.
-    See Haario et al (2001; https://projecteuclid.org/euclid.bj/1080222083) for
-    more information.
-    """
-    m1 = update_mean(m, X)
-    t = len(X[0]) - 1
-    part1 = ((t - 1) / t) * Ct
-    part2 = t * np.matmul(m, np.transpose(m))
-    part3 = (t + 1) * np.matmul(m1, np.transpose(m1))
-    Xt = []
-    Xt.append(X[:, -1])
-    part4 = np.matmul(np.transpose(Xt), Xt)
-    part5 = eps * Id
-    cov = part1 + (Sd / t) * (part2 - part3 + part4 + part5)
-    return (cov + np.transpose(cov)) / 2, m1
-
-
-def random_move(current_state, X, Ct, t, t0, stepsize, data_meas, logpost, m, S_d, I_d):
-    """
-    Proposal step of the Metropolis-Hastings algorithm. This is a multivariate
-    normal random draw, given the current Markov chain state and the covariance
-    matrix from the `update_cov` above.
-    Returns the proposed move and log-posterior score, to be used in the
-    Metropolis acceptance probability calculation in the main iteration.
-    """
-    if t <= t0:
-        next_move = stats.multivariate_normal.rvs(current_state, stepsize)
-        return next_move, logpost(next_move, data_meas), m, stepsize
-    elif t == t0 + 1:
-        n = []
-        for i in range(len(X)):
-            n.append([np.mean(X[i])])
-        cov = S_d * np.cov(X) + I_d * 0.0001 * S_d
-        next_move = stats.multivariate_normal.rvs(current_state, cov)
-        return next_move, logpost(next_move, data_meas), n, cov
-    else:
-        cov, m1 = update_cov(X, m, Ct, S_d, I_d, 0.0001)
-        next_move = stats.multivariate_normal.rvs(current_state, cov)
-        return next_move, logpost(next_move, data_meas), m1, cov
-
-
-def adaptivemcmc(initial_state, n_iter, stepsize, data_meas, logpost, t0):
+# Names of the population engines, for the events
+ENGINE_NAMES = {"demc": "DE-MC", "mala": "MALA", "tempering": "parallel tempering"}
+
+
+def adaptivemcmc(
+    initial_state,
+    n_iter,
+    stepsize,
+    data_meas,
+    logpost,
+    t0,
+    backend="numpy",
+    block=1000,
+    prior=None,
+    summary=None,
+    adaptation=None,
+    skip_warmup=False,
+    events=None,
+    chain=1,
+    dtype=None,
+):
     """
     Simple adaptive Metropolis-Hastings iteration, as detailed by Haario et al
     (2001; https://projecteuclid.org/euclid.bj/1080222083).
+    The iterations are run in blocks of `block` by `kernels.adaptive_block`,
+    with the random numbers for each block drawn up front. If a compiled
+    `prior` is passed (see `priors.compile_prior`), the scalar GEV
+    log-posterior of `kernels.make_logpost` for it is used instead of
+    `logpost`. With `backend="numba"` it and the block kernel are compiled
+    with Numba (for the default priors if there is no `prior`), so the whole
+    block runs without returning to the interpreter; otherwise the same
+    functions run as plain Python. Both backends consume the same random
+    stream and evaluate the same log-posterior, so given the same seed they
+    produce the same chains. Without a `prior`, the NumPy backend runs
+    `logpost`, for other likelihoods such as that of the peaks over threshold.
+    If a `summaries.OnlineSummary` is passed as `summary`, it is updated after
+    every block.
+    If an `adaptation` dictionary is passed, the final adapted "mean", "cov"
+    (the running covariance of the chain, before scaling) and "count" are
+    stored in it. If it already holds them (from a previous run, see
+    `read_proposals`), the adaptation starts from them, weighted as at most
+    `t0` iterations, and with `skip_warmup` the proposal is adaptive from the
+    first iteration instead of after `t0`.
+    If an `events.EventStream` is passed as `events`, "progress" events of the
+    chain, numbered `chain`, are emitted to it every `events.every`
+    iterations, without changing the blocks the random numbers are drawn in.
+    The chain and its log-posteriors are returned as lists, or, if a `dtype`
+    such as "float32" is given, as arrays of that type, which are written into
+    directly by the kernel. The state and the adaptation always stay in double
+    precision.
     """
     d = len(initial_state)
-    I_d = np.identity(d)
     S_d = (2.4) ** 2 / d
-    parameters = []
-    current_state = initial_state
-    current_value = logpost(initial_state, data_meas)
-    for i in range(d):
-        parameters.append([])
-        parameters[i].append(initial_state[i])
-    lpost = [current_value]
-    n_accept = 0
-    S = 0
     np.seterr(over="ignore")
-    cov = stepsize
-    m = []
-    for t in tqdm(range(n_iter)):
-        S += 1
-        nextMove, nextValue, m, cov = random_move(
-            current_state,
-            np.array(parameters),
-            cov,
-            t,
-            t0,
-            stepsize,
-            data_meas,
-            logpost,
-            m,
-            S_d,
-            I_d,
+    jit = backend == "numba" and HAVE_NUMBA
+    kernel = jit_adaptive_block if jit else adaptive_block
+    data = prepare_data(data_meas)
+    if jit or prior is not None:
+        if prior is None:
+            prior = compile_prior()
+        logpost = make_logpost(prior.table, jit=jit)
+        # It checks the support against the first and last sorted values
+        data = data.sorted
+    # Adaptation state: current state and value, running mean, M2 and count
+    state = np.array(initial_state, dtype=float)
+    value = float(logpost(state, data))
+    mean, M2, count = np.array(state), np.zeros((d, d)), 1
+    if adaptation:
+        # Warm start from the adaptation of a previous run
+        count = int(max(min(adaptation["count"], t0), 2))
+        mean = np.array(adaptation["mean"], dtype=float)
+        M2 = np.array(adaptation["cov"], dtype=float) * (count - 1)
+        if skip_warmup:
+            t0 = -1
+    scale = np.sqrt(np.asarray(stepsize, dtype=float))
+    out = np.empty((d + 1, n_iter + 1), dtype=dtype or float)
+    out[:d, 0] = state
+    out[d, 0] = value
+    n_accept = 0
+    if summary is not None:
+        summary.update(out[:d, :1].T, out[d, :1], None, 0)
+    if events is not None:
+        progress = events.progress(chain, n_iter)
+    for start in range(0, n_iter, block):
+        n = min(block, n_iter - start)
+        z = np.random.normal(size=(n, d))
+        u = np.random.uniform(size=n)
+        # The block is run in pieces ending at the progress events, so the random
+        # numbers drawn (and the chain) do not depend on the event interval
+        stops = [start + n]
+        if events is not None:
+            first = start - start % events.every + events.every
+            stops = list(range(first, start + n, events.every)) + stops
+        piece = start
+        for stop in stops:
+            value, count, accepted = kernel(
+                state,
+                value,
+                mean,
+                M2,
+                count,
+                data,
+                z[piece - start : stop - start],
+                u[piece - start : stop - start],
+                piece,
+                t0,
+                scale,
+                S_d,
+                out,
+                logpost,
+            )
+            n_accept += accepted
+            if events is not None:
+                progress.update(stop, accepted, value)
+            piece = stop
+        if summary is not None:
+            new = slice(start + 1, start + n + 1)
+            moved = np.any(out[:d, new] != out[:d, start : start + n], axis=0)
+            summary.update(out[:d, new].T, out[d, new], moved, start + 1)
+    if adaptation is not None:
+        adaptation.update(
+            {"mean": mean.tolist(), "cov": (M2 / (count - 1)).tolist(), "count": count}
         )
-        delta_obj = np.exp(nextValue - lpost[-1])
-        if delta_obj > 1:
-            n_accept += 1
-            for i in range(d):
-                parameters[i].append(nextMove[i])
-            lpost.append(nextValue)
-            current_state = nextMove
-            current_value = nextValue
-        else:
-            p_accept = delta_obj
-            accept = np.random.choice([True, False], p=[p_accept, 1 - p_accept])
-            if accept:
-                n_accept += 1
-                for i in range(d):
-                    parameters[i].append(nextMove[i])
-                lpost.append(nextValue)
-                current_state = nextMove
-                current_value = nextValue
-            else:
-                for i in range(d):
-                    parameters[i].append(parameters[i][-1])
-                lpost.append(lpost[-1])
-    return (parameters, lpost, n_accept / S)
-
-
-def runner(m, n_iter, data_meas, logpost, t=1000, stepsize=[10, 2, 0.01]):
+    if dtype is not None:
+        return (out[:d], out[d], n_accept / n_iter)
+    return (out[:d].tolist(), out[d].tolist(), n_accept / n_iter)
+
+
+def runner(
+    m,
+    n_iter,
+    data_meas,
+    logpost,
+    t=1000,
+    stepsize=[10, 2, 0.01],
+    engine="adaptive",
+    loglikelihood=None,
+    logprior=None,
+    n_temps=8,
+    grad_logpost=None,
+    backend="numpy",
+    prior=None,
+    summaries=None,
+    proposals=None,
+    skip_warmup=False,
+    profiler=None,
+    events=None,
+    dtype=None,
+):
     """
     Driver to run `m` separate simulations of the Adaptive Metropolis-Hastings
-    algorithm (`adaptivemcmc` above).
+    algorithm (`adaptivemcmc` above), with its kernels compiled by Numba for the
+    compiled `prior` when `backend="numba"`.
+    If a list is passed as `summaries`, an `OnlineSummary` of each chain's
+    posterior (from the end of the adaptation period `t`, or from the start for
+    chains warm started with `skip_warmup`) is appended to it.
+    If a list of `proposals` is passed, the adaptation of each chain is warm
+    started from its entry (if it is not empty) and its final adaptation is
+    stored in it (see `adaptivemcmc`).
+    If a `profiling.Profiler` is passed as `profiler`, the sampling of each
+    chain is timed, along with its iterations and likelihood evaluations per
+    second. With `backend="numba"` the kernels are compiled first, in a
+    "compile" stage of their own.
+    If an `events.EventStream` is passed as `events`, the start, progress and
+    end of each chain are emitted to it.
+    If a `dtype` such as "float32" is given, the chains and their
+    log-posteriors are stored as arrays of that type (see `store_chains`)
+    instead of lists.
+    With `engine="demc"` the `m` chains are instead run together as the
+    population of a Differential Evolution sampler (`demc.demcmc`), in which
+    case `logpost` must accept a batch of parameter sets.
+    With `engine="tempering"` each chain is the cold replica of a ladder of
+    `n_temps` tempered replicas (`tempering.parallel_tempering`), which needs
+    the batched `loglikelihood` and `logprior` separately instead of `logpost`.
+    With `engine="mala"` the chains are run together with the gradient-based
+    Langevin sampler (`mala.mala`), which also needs the batched
+    `grad_logpost`.
     """
     np.seterr(divide="ignore", invalid="ignore")
     loc_est = np.median(data_meas)
@@ -171,18 +241,161 @@ def runner(m, n_iter, data_meas, logpost, t=1000, stepsize=[10, 2, 0.01]):
         shapei = shape_est
         theta = [ui, si, shapei]
         problems.append(theta)
+    if engine in ["demc", "mala", "tempering"]:
+        # The population engines advance all of the chains together
+        n_evals = n_iter * (n_temps if engine == "tempering" else 1)
+        if events is not None:
+            message = "running " + ENGINE_NAMES[engine] + " on " + str(m) + " chains"
+            if engine == "tempering":
+                message += " with " + str(n_temps) + " temperatures"
+            events.emit(
+                "chain_start",
+                chain=None,
+                chains=m,
+                n_iter=n_iter,
+                engine=engine,
+                message=message,
+            )
+        with stage(profiler, "sampler (" + engine + ")", m * n_iter) as record:
+            result = population_runner(
+                np.array(problems, dtype=float),
+                n_iter,
+                data_meas,
+                logpost,
+                t,
+                stepsize,
+                engine,
+                loglikelihood,
+                logprior,
+                n_temps,
+                grad_logpost,
+                events,
+            )
+            result = (
+                store_chains(result[0], dtype),
+                result[1],
+                store_chains(result[2], dtype),
+            )
+        if profiler is not None:
+            for i in range(m):
+                profiler.chain("chain " + str(i + 1), n_iter, n_evals, record["wall"])
+        if events is not None:
+            for i in range(m):
+                events.emit(
+                    "chain_end",
+                    chain=i + 1,
+                    acceptance=result[1][i],
+                    wall=record.get("wall"),
+                )
+        return result
+    if backend == "numba" and HAVE_NUMBA:
+        # Compile the kernels up front, so that the compilation is timed as a
+        # stage of its own instead of as part of the first chain
+        table = compile_prior().table if prior is None else prior.table
+        with stage(profiler, "compile"):
+            compile_kernels(table, dtype)
     ar, mcmc_chains, ls = [], [], []
     for i in range(m):
-        print("INFO : running Chain " + str(i + 1))
-        parameters, l, r = adaptivemcmc(
-            problems[i], n_iter, stepsize, data_meas, logpost, t
-        )
+        if events is not None:
+            events.emit(
+                "chain_start",
+                chain=i + 1,
+                n_iter=n_iter,
+                engine=engine,
+                message="running Chain " + str(i + 1),
+            )
+        summary = None
+        adaptation = None if proposals is None else proposals[i]
+        if summaries is not None:
+            # Chains warm started with skip_warmup are adaptive from the start
+            start = 0 if skip_warmup and adaptation else t
+            summary = OnlineSummary(len(problems[i]), start=start)
+            summaries.append(summary)
+        with stage(profiler, "chain " + str(i + 1), n_iter) as record:
+            parameters, l, r = adaptivemcmc(
+                problems[i],
+                n_iter,
+                stepsize,
+                data_meas,
+                logpost,
+                t,
+                backend,
+                prior=prior,
+                summary=summary,
+                adaptation=adaptation,
+                skip_warmup=skip_warmup,
+                events=events,
+                chain=i + 1,
+                dtype=dtype,
+            )
+        if events is not None:
+            events.emit("chain_end", chain=i + 1, acceptance=r, wall=record.get("wall"))
+        if profiler is not None:
+            profiler.chain("chain " + str(i + 1), n_iter, n_iter + 1, record["wall"])
         mcmc_chains.append(parameters)
         ar.append(r)
         ls.append(l)
     return mcmc_chains, ar, ls
 
 
+def population_runner(
+    initial_states,
+    n_iter,
+    data_meas,
+    logpost,
+    t,
+    stepsize,
+    engine,
+    loglikelihood,
+    logprior,
+    n_temps,
+    grad_logpost,
+    events=None,
+):
+    """
+    Helper function to `runner`, which runs the engines that advance all of the
+    chains together.
+    """
+    if engine == "demc":
+        return demcmc(
+            initial_states, n_iter, stepsize, data_meas, logpost, t, events=events
+        )
+    if engine == "mala":
+        return mala(
+            initial_states,
+            n_iter,
+            stepsize,
+            data_meas,
+            logpost,
+            grad_logpost,
+            t,
+            events=events,
+        )
+    return parallel_tempering(
+        initial_states,
+        n_iter,
+        stepsize,
+        data_meas,
+        loglikelihood,
+        logprior,
+        t,
+        n_temps,
+        events=events,
+    )
+
+
+def store_chains(chains, dtype=None):
+    """
+    Store each of the `chains` (or of their log-posteriors) as an array of
+    `dtype`, such as "float32" to halve the memory of double precision (and use
+    an eighth of that of lists of floats). With `dtype=None` they are left as
+    they are.
+    """
+    if dtype is None:
+        return chains
+    return [np.asarray(chain, dtype=dtype) for chain in chains]
+
+
 def history_plots(mcmc_chains, true_params=None, output_dir="output"):
     """
     Make history plots for the Markov chain output from the `adaptivemcmc`
@@ -256,42 +469,36 @@ def final_params_pool(mcmc_chains, burnin, lags, output_dir="output", plot=False
     in a pool of concomitant parameter sets that represent independent samples
     from the joint posterior distribution of the parameters, given the processed
     tide gauge data.
+    Returns the pool as an (n, 3) array, gathered from strided slices of the
+    chains with a single concatenation, and the index in `mcmc_chains` of the
+    chain that each of its rows came from.
     """
-    m, n = len(mcmc_chains), len(mcmc_chains[0][0])
-    params_pool, params_ana = [], [[] for i in range(3)]
-    for i in range(m):
-        for j in range(burnin, n, lags[i]):
-            params_pool.append([])
-            for k in range(3):
-                params_ana[k].append(mcmc_chains[i][k][j])
-                params_pool[-1].append(mcmc_chains[i][k][j])
+    samples = [
+        np.asarray(chain)[:3, burnin :: lags[i]] for i, chain in enumerate(mcmc_chains)
+    ]
+    params_pool = np.concatenate(samples, axis=1).T
+    chain_ids = np.repeat(np.arange(len(samples)), [s.shape[1] for s in samples])
 
     if plot:
         fig, ax = plt.subplots(nrows=1, ncols=3, figsize=(16, 6))
         # mu parameter
-        params_ana_0 = []
-        for i in range(len(params_ana[0])):
-            params_ana_0.append(params_ana[0][i] / 1000)
-        ax[0].hist(params_ana_0, color="#34495e", edgecolor="white")
+        ax[0].hist(params_pool[:, 0] / 1000, color="#34495e", edgecolor="white")
         ax[0].set_xlabel(r"$\mu$ [m]")
         ax[0].set_ylabel("Frequency")
         ax[0].grid(alpha=0.5)
         # sigma parameter
-        params_ana_1 = []
-        for i in range(len(params_ana[1])):
-            params_ana_1.append(params_ana[1][i] / 1000)
-        ax[1].hist(params_ana_1, color="#34495e", edgecolor="white")
+        ax[1].hist(params_pool[:, 1] / 1000, color="#34495e", edgecolor="white")
         ax[1].set_xlabel(r"$\sigma$ [m]")
         ax[1].set_ylabel("Frequency")
         ax[1].grid(alpha=0.5)
         # c parameter
-        ax[2].hist(params_ana[2], color="#34495e", edgecolor="white")
+        ax[2].hist(params_pool[:, 2], color="#34495e", edgecolor="white")
         ax[2].set_xlabel(r"$\xi$")
         ax[2].set_ylabel("Frequency")
         ax[2].grid(alpha=0.5)
         # output the figure
         fig.savefig(output_dir + "plots/params_pool.png")
-    return params_pool
+    return params_pool, chain_ids
 
 
 def max_ls_parameters(ls, mcmc_chains, logger, verbose):
@@ -302,14 +509,15 @@ def max_ls_parameters(ls, mcmc_chains, logger, verbose):
     max_indices = []
     maxs = []
     for i in range(len(mcmc_chains)):
-        max_indices.append(np.where(np.array(ls[i]) == np.array(ls[i]).max())[0][0])
-        maxs.append(np.array(ls[i]).max())
-    seqi = np.where(np.array(maxs) == np.array(maxs).max())[0][0]
+        scores = np.asarray(ls[i])
+        max_indices.append(int(np.argmax(scores)))
+        maxs.append(scores[max_indices[-1]])
+    seqi = int(np.argmax(maxs))
     iterj = max_indices[seqi]
     max_params = []
     d = len(mcmc_chains[0])
     for i in range(d):
-        max_params.append(mcmc_chains[seqi][i][iterj])
+        max_params.append(float(mcmc_chains[seqi][i][iterj]))
     logger = log(
         logger,
         "the parameters with max log-posterior score are: ["
@@ -325,7 +533,12 @@ def max_ls_parameters(ls, mcmc_chains, logger, verbose):
 
 
 def diagnostic_plots(
-    data_meas, max_params, params_analysis, output_dir="output", plot=False
+    data_meas,
+    max_params,
+    params_analysis,
+    output_dir="output",
+    plot=False,
+    profiler=None,
 ):
     """
     Generates a set of diagnostic plots, as displayed in the accompanying code
@@ -341,166 +554,143 @@ def diagnostic_plots(
        return level (y-axis) in surge height.
     D) density plot:  the estimated distribution of annual maximum sea levels,
        with the histogram of processed data points superimposed
+    The probability, quantile and density diagnostics are computed by
+    `gof_diagnostics`. The return levels, goodness of fit and plots are timed
+    as stages of the `profiler`, if one is passed.
     """
     data = []
     for i in range(len(data_meas)):
         data.append(data_meas[i] / 1000)
     RP = np.arange(2, 501, 1)
-    RL = []
-    RL_max = []
-    percentile_05 = []
-    percentile_1 = []
-    percentile_2 = []
-    percentile_5 = []
-    percentile_95 = []
-    percentile_98 = []
-    percentile_99 = []
-    percentile_995 = []
-    for i in range(len(RP)):
-        RL.append([])
-        RL_max.append(
-            stats.genextreme.ppf(
-                q=(1 - 1 / RP[i]),
-                c=-max_params[2],
-                loc=max_params[0] / 1000,
-                scale=max_params[1] / 1000,
-            )
+    q = 1 - 1 / RP
+    RL_max = stats.genextreme.ppf(
+        q=q, c=-max_params[2], loc=max_params[0] / 1000, scale=max_params[1] / 1000
+    )
+    # Return levels for every (return period, parameter set) pair at once
+    params = np.asarray(params_analysis)
+    with stage(profiler, "return levels", len(params) * len(RP)):
+        RL = stats.genextreme.ppf(
+            q=q[:, np.newaxis],
+            c=-params[:, 2],
+            loc=params[:, 0] / 1000,
+            scale=params[:, 1] / 1000,
         )
-        for j in range(len(params_analysis)):
-            RL[i].append(
-                stats.genextreme.ppf(
-                    q=(1 - 1 / RP[i]),
-                    c=-params_analysis[j][2],
-                    loc=params_analysis[j][0] / 1000,
-                    scale=params_analysis[j][1] / 1000,
-                )
-            )
-    for i in range(len(RL)):
-        percentile_95.append(np.percentile((RL[i]), 95))
-        percentile_5.append(np.percentile((RL[i]), 5))
+        percentile_95 = np.percentile(RL, 95, axis=1)
+        percentile_5 = np.percentile(RL, 5, axis=1)
 
-        percentile_98.append(np.percentile((RL[i]), 98))
-        percentile_2.append(np.percentile((RL[i]), 2))
+        percentile_98 = np.percentile(RL, 98, axis=1)
+        percentile_2 = np.percentile(RL, 2, axis=1)
 
-        percentile_99.append(np.percentile((RL[i]), 99))
-        percentile_1.append(np.percentile((RL[i]), 1))
+        percentile_99 = np.percentile(RL, 99, axis=1)
+        percentile_1 = np.percentile(RL, 1, axis=1)
 
-        percentile_995.append(np.percentile((RL[i]), 99.5))
-        percentile_05.append(np.percentile((RL[i]), 0.5))
+        percentile_995 = np.percentile(RL, 99.5, axis=1)
+        percentile_05 = np.percentile(RL, 0.5, axis=1)
 
-    empirical = [
-        stats.genextreme.ppf(
-            q=(i + 1) / (len(data) + 1),
-            c=-max_params[2],
-            loc=max_params[0] / 1000,
-            scale=max_params[1] / 1000,
-        )
-        for i in range(len(data))
-    ]
-    cdf = [
-        stats.genextreme.cdf(
-            x=np.sort(data)[i],
-            c=-max_params[2],
-            loc=max_params[0] / 1000,
-            scale=max_params[1] / 1000,
-        )
-        for i in range(len(data))
-    ]
-    x_range = np.arange(0, max(data) + 1, 0.0005)
-    y_range = [
-        stats.genextreme.pdf(
-            x=xi, c=-max_params[2], loc=max_params[0] / 1000, scale=max_params[1] / 1000
-        )
-        for xi in x_range
-    ]
+    with stage(profiler, "goodness of fit", len(data)):
+        gof = gof_diagnostics(data_meas, max_params)
 
     if plot:
-        fig, ax = plt.subplots(nrows=2, ncols=2, figsize=(18, 12))
+        with stage(profiler, "diagnostic plots"):
+            fig, ax = plt.subplots(nrows=2, ncols=2, figsize=(18, 12))
 
-        ax[0, 0].scatter(
-            cdf, [(i + 1) / (len(data) + 1) for i in range(len(data))], color="black"
-        )
-        ax[0, 0].plot(np.arange(0, 1, 0.01), np.arange(0, 1, 0.01), color="steelblue")
-        ax[0, 0].set_title("Probability Plot", fontsize=14)
-        ax[0, 0].set_xlabel("Model", fontsize=14)
-        ax[0, 0].set_ylabel("Empirical", fontsize=14)
-        ax[0, 0].annotate("$\mathbf{A}$", xy=(0.0, 1.03), xycoords="axes fraction", fontsize=16)
-
-        ax[0, 1].scatter(empirical, np.sort(data), color="black")
-        ax[0, 1].plot(
-            np.arange(0, int(round(np.max(data), 0)) + 1),
-            np.arange(0, int(round(np.max(data), 0)) + 1),
-            color="steelblue",
-        )
-        ax[0, 1].set_title("Quantile Plot", fontsize=14)
-        ax[0, 1].set_xlabel("Model [m]", fontsize=14)
-        ax[0, 1].set_ylabel("Empirical [m]", fontsize=14)
-        ax[0, 1].set_xlim(ax[0, 1].set_ylim()[0], ax[0, 1].set_ylim()[1])
-        ax[0, 1].annotate("$\mathbf{B}$", xy=(0.0, 1.03), xycoords="axes fraction", fontsize=16)
-
-        ax[1, 0].plot(
-            np.log10(RP), RL_max, color="r", label="Max Posterior Score Parameter Sets"
-        )
-        ax[1, 0].scatter(
-            np.log10(
-                [
-                    (len(data) + 1) / (len(data) + 1 - k)
-                    for k in np.arange(1, len(data) + 1, 1)
-                ]
-            ),
-            np.sort(data),
-            label="Actual Sorted Observations",
-            color="black",
-            marker="X",
-        )
-        ax[1, 0].fill_between(
-            x=np.log10(RP),
-            y1=percentile_95,
-            y2=percentile_5,
-            alpha=0.3,
-            label="90% Credible Interval",
-            facecolor="skyblue",
-        )
-        ax[1, 0].fill_between(
-            x=np.log10(RP),
-            y1=percentile_995,
-            y2=percentile_05,
-            alpha=0.27,
-            label="99% Credible Interval",
-            facecolor="skyblue",
-        )
-        ax[1, 0].legend(loc="upper left", fontsize=10)
-        ax[1, 0].set_xticks(np.log10([1, 2, 5, 10, 20, 100, 200, 500]))
-        ax[1, 0].set_xticklabels([1, 2, 5, 10, 20, 100, 200, 500])
-        ax[1, 0].set_title("Return Level Plot", fontsize=14)
-        ax[1, 0].set_xlabel("Return Period [years]", fontsize=14)
-        ax[1, 0].set_ylabel("Return Level [m]", fontsize=14)
-        if ax[1, 0].set_ylim()[1] > 10:
-            ax[1, 0].set_ylim(0, 10)
-        ax[1, 0].annotate("$\mathbf{C}$", xy=(0.0, 1.03), xycoords="axes fraction", fontsize=16)
-
-        ax[1, 1].hist(
-            data,
-            bins=np.linspace(min(data), max(data)),
-            density=True,
-            edgecolor="black",
-            label="Histogram for Observations",
-            color="white",
-            alpha=0.4,
-        )
-        ax[1, 1].plot(x_range, y_range, label="Best Model", color="black")
-        ax[1, 1].plot(
-            data, np.zeros_like(data), "b+", ms=20, color="black", label="Observations"
-        )
-        ax[1, 1].legend(loc="best", fontsize=10)
-        ax[1, 1].set_yticklabels([])
-        ax[1, 1].set_title("Density Plot", fontsize=14)
-        ax[1, 1].set_xlabel("Annual Max Sea Level [m]", fontsize=14)
-        ax[1, 1].set_ylabel("Density", fontsize=14)
-        ax[1, 1].set_xlim(ax[0, 1].set_xlim()[0], ax[0, 1].set_xlim()[1])
-        ax[1, 1].annotate("$\mathbf{D}$", xy=(0.0, 1.03), xycoords="axes fraction", fontsize=16)
+            ax[0, 0].scatter(gof["cdf"], gof["probability"], color="black")
+            ax[0, 0].plot(
+                np.arange(0, 1, 0.01), np.arange(0, 1, 0.01), color="steelblue"
+            )
+            ax[0, 0].set_title("Probability Plot", fontsize=14)
+            ax[0, 0].set_xlabel("Model", fontsize=14)
+            ax[0, 0].set_ylabel("Empirical", fontsize=14)
+            ax[0, 0].annotate(
+                "$\mathbf{A}$", xy=(0.0, 1.03), xycoords="axes fraction", fontsize=16
+            )
+
+            ax[0, 1].scatter(gof["quantile"], gof["sorted"], color="black")
+            ax[0, 1].plot(
+                np.arange(0, int(round(np.max(data), 0)) + 1),
+                np.arange(0, int(round(np.max(data), 0)) + 1),
+                color="steelblue",
+            )
+            ax[0, 1].set_title("Quantile Plot", fontsize=14)
+            ax[0, 1].set_xlabel("Model [m]", fontsize=14)
+            ax[0, 1].set_ylabel("Empirical [m]", fontsize=14)
+            ax[0, 1].set_xlim(ax[0, 1].set_ylim()[0], ax[0, 1].set_ylim()[1])
+            ax[0, 1].annotate(
+                "$\mathbf{B}$", xy=(0.0, 1.03), xycoords="axes fraction", fontsize=16
+            )
+
+            ax[1, 0].plot(
+                np.log10(RP),
+                RL_max,
+                color="r",
+                label="Max Posterior Score Parameter Sets",
+            )
+            ax[1, 0].scatter(
+                np.log10(1 / (1 - gof["probability"])),
+                gof["sorted"],
+                label="Actual Sorted Observations",
+                color="black",
+                marker="X",
+            )
+            ax[1, 0].fill_between(
+                x=np.log10(RP),
+                y1=percentile_95,
+                y2=percentile_5,
+                alpha=0.3,
+                label="90% Credible Interval",
+                facecolor="skyblue",
+            )
+            ax[1, 0].fill_between(
+                x=np.log10(RP),
+                y1=percentile_995,
+                y2=percentile_05,
+                alpha=0.27,
+                label="99% Credible Interval",
+                facecolor="skyblue",
+            )
+            ax[1, 0].legend(loc="upper left", fontsize=10)
+            ax[1, 0].set_xticks(np.log10([1, 2, 5, 10, 20, 100, 200, 500]))
+            ax[1, 0].set_xticklabels([1, 2, 5, 10, 20, 100, 200, 500])
+            ax[1, 0].set_title("Return Level Plot", fontsize=14)
+            ax[1, 0].set_xlabel("Return Period [years]", fontsize=14)
+            ax[1, 0].set_ylabel("Return Level [m]", fontsize=14)
+            if ax[1, 0].set_ylim()[1] > 10:
+                ax[1, 0].set_ylim(0, 10)
+            ax[1, 0].annotate(
+                "$\mathbf{C}$", xy=(0.0, 1.03), xycoords="axes fraction", fontsize=16
+            )
+
+            ax[1, 1].hist(
+                data,
+                bins=np.linspace(min(data), max(data)),
+                density=True,
+                edgecolor="black",
+                label="Histogram for Observations",
+                color="white",
+                alpha=0.4,
+            )
+            ax[1, 1].plot(
+                gof["x_range"], gof["density"], label="Best Model", color="black"
+            )
+            ax[1, 1].plot(
+                data,
+                np.zeros_like(data),
+                "b+",
+                ms=20,
+                color="black",
+                label="Observations",
+            )
+            ax[1, 1].legend(loc="best", fontsize=10)
+            ax[1, 1].set_yticklabels([])
+            ax[1, 1].set_title("Density Plot", fontsize=14)
+            ax[1, 1].set_xlabel("Annual Max Sea Level [m]", fontsize=14)
+            ax[1, 1].set_ylabel("Density", fontsize=14)
+            ax[1, 1].set_xlim(ax[0, 1].set_xlim()[0], ax[0, 1].set_xlim()[1])
+            ax[1, 1].annotate(
+                "$\mathbf{D}$", xy=(0.0, 1.03), xycoords="axes fraction", fontsize=16
+            )
 
-        fig.savefig(output_dir + "plots/diagnostic_plots.png")
+            fig.savefig(output_dir + "plots/diagnostic_plots.png")
 
     return (
         percentile_05,
@@ -514,10 +704,72 @@ def diagnostic_plots(
     )
 
 
+def gof_diagnostics(data_meas, max_params, step=0.0005):
+    """
+    Goodness of fit of the GEV distribution with the `max_params` to the
+    annual maxima `data_meas` (both in mm), as plotted by `diagnostic_plots`,
+    with every quantity computed at once on the sorted data:
+
+    - "sorted": the sorted annual maxima [m]
+    - "probability": their empirical (Weibull plotting position) probabilities
+    - "cdf": the model probabilities of the sorted annual maxima (probability
+      plot)
+    - "quantile": the model quantiles at the empirical probabilities [m]
+      (quantile plot)
+    - "x_range" and "density": the model density on a grid from 0 to 1 m
+      above the largest annual maximum, with spacing `step` [m] (density
+      plot)
+    - "ks": the Kolmogorov-Smirnov statistic of the fit
+    - "quantile_rmse": the root mean squared difference between the sorted
+      annual maxima and the model quantiles [m]
+    """
+    data = np.sort(np.asarray(data_meas, dtype=float)) / 1000
+    n = len(data)
+    gev = stats.genextreme(
+        c=-max_params[2], loc=max_params[0] / 1000, scale=max_params[1] / 1000
+    )
+    probability = np.arange(1, n + 1) / (n + 1)
+    cdf = gev.cdf(data)
+    quantile = gev.ppf(probability)
+    x_range = np.arange(0, data[-1] + 1, step)
+    ks = max(np.max(np.arange(1, n + 1) / n - cdf), np.max(cdf - np.arange(0, n) / n))
+    return {
+        "sorted": data,
+        "probability": probability,
+        "cdf": cdf,
+        "quantile": quantile,
+        "x_range": x_range,
+        "density": gev.pdf(x_range),
+        "ks": float(ks),
+        "quantile_rmse": float(np.sqrt(np.mean((data - quantile) ** 2))),
+    }
+
+
+def read_proposals(path, m):
+    """
+    Read the adapted proposals of a previous run (see `write_proposals`), as
+    one dictionary per chain for `m` chains, reusing them in turn if the
+    previous run had fewer chains.
+    """
+    with open(path) as f:
+        chains = json.load(f)["chains"]
+    return [dict(chains[i % len(chains)]) for i in range(m)]
+
+
+def write_proposals(proposals, output_dir="output"):
+    """
+    Save the final adapted mean and covariance of each chain to
+    proposal.json in `output_dir`, to warm start later runs.
+    """
+    with open(output_dir + "/proposal.json", "w") as f:
+        json.dump({"chains": proposals}, f, indent=2)
+
+
 def output_parameters(mcmc_chains, burnin, lags, output_dir="output"):
     '''
     Can uncomment the f.write statements below in order to separate out which
-    parameters came from which chains.
+    parameters came from which chains. Chains stored as float32 arrays (see
+    `store_chains`) are written with float32 precision.
     '''
     for i in range(len(mcmc_chains[0])):
         with open(output_dir + "/parameters/parameter-" + str(i + 1) + ".txt", "w") as f:
@@ -527,5 +779,5 @@ def output_parameters(mcmc_chains, burnin, lags, output_dir="output"):
                 #else:
                 #    f.write("\n\nCHAIN " + str(j + 1) + "\n")
                 #f.write("==========\n\n")
-                for k in range(burnin, len(mcmc_chains[j][i]), lags[j]):
-                    f.write(str(mcmc_chains[j][i][k]) + "\n")
+                for x in mcmc_chains[j][i][burnin :: lags[j]]:
+                    f.write(str(x) + "\n")
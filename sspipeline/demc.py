@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tell module what it's allowed to import
+__all__ = ["demcmc"]
+
+import numpy as np
+
+from .events import PopulationProgress
+
+
+def archive_pairs(M, m):
+    """
+    Draw `m` pairs of distinct indices into an archive of `M` past states.
+    """
+    r1 = np.random.randint(M, size=m)
+    r2 = np.random.randint(M - 1, size=m)
+    r2 += r2 >= r1
+    return r1, r2
+
+
+def demcmc(
+    initial_states,
+    n_iter,
+    stepsize,
+    data_meas,
+    logpost,
+    t0,
+    p_snooker=0.1,
+    p_jump=0.1,
+    archive_every=10,
+    events=None,
+):
+    """
+    Differential Evolution Markov chain sampler with an archive of past states
+    and snooker updates (DE-MCzs), as detailed by ter Braak & Vrugt (2008;
+    https://doi.org/10.1007/s11222-008-9104-9).
+
+    All `m` chains (one per row of `initial_states`) are advanced together,
+    with `logpost` evaluated once per iteration on the (m, d) array of
+    proposals, so it must accept a batch of parameter sets (see
+    `gev_utils.batch_logpost`). Each proposal is built from the difference of
+    two states drawn from the archive: a parallel-direction update scaled by
+    2.38 / sqrt(2 d) (or by 1 with probability `p_jump`, to jump between
+    modes), or, with probability `p_snooker`, a snooker update along the line
+    through the current state and a third archived state. The current states
+    are added to the archive every `archive_every` iterations. The archive is
+    seeded around the initial states with the `stepsize` variances, and both
+    the seeds and the states from the first half of the `t0` warm-up
+    iterations are dropped from it at iteration `t0`.
+
+    Returns the chains, log-posterior scores and acceptance rates in the same
+    format as `runner`.
+
+    If an `events.EventStream` is passed as `events`, "progress" events of
+    each chain are emitted to it every `events.every` iterations (see
+    `events.PopulationProgress`).
+    """
+    np.seterr(over="ignore")
+    m, d = initial_states.shape
+    gamma = 2.38 / np.sqrt(2 * d)
+    # Seed the archive with 10 d states around the initial chain states
+    M0 = 10 * d
+    Z = np.empty((M0 + m * (n_iter // archive_every + 1), d))
+    Z[:M0] = initial_states[np.random.randint(m, size=M0)] + np.random.normal(
+        size=(M0, d)
+    ) * np.sqrt(stepsize)
+    M = M0
+    parameters = np.empty((m, d, n_iter + 1))
+    lpost = np.empty((m, n_iter + 1))
+    current_state = np.array(initial_states, dtype=float)
+    current_value = logpost(current_state, data_meas)
+    parameters[:, :, 0] = current_state
+    lpost[:, 0] = current_value
+    n_accept = np.zeros(m)
+    progress = None
+    if events is not None:
+        progress = PopulationProgress(events, m, n_iter)
+    rows = np.arange(m)
+    for t in range(n_iter):
+        r1, r2 = archive_pairs(M, m)
+        diff = Z[r1] - Z[r2]
+        # Parallel-direction update, with occasional mode-jumping steps
+        g = np.where(np.random.uniform(size=m) < p_jump, 1.0, gamma)
+        noise = 1e-4 * np.std(Z[:M], axis=0) * np.random.normal(size=(m, d))
+        proposal = current_state + g[:, np.newaxis] * diff + noise
+        log_jacobian = np.zeros(m)
+        # Snooker update: project the difference onto the line through the
+        # current state and a third archived state
+        snooker = np.random.uniform(size=m) < p_snooker
+        if np.any(snooker):
+            z = Z[np.random.randint(M, size=m)]
+            u = current_state - z
+            norm2 = np.sum(u ** 2, axis=1)
+            norm2[norm2 == 0] = np.inf
+            proj = (np.sum(diff * u, axis=1) / norm2)[:, np.newaxis] * u
+            g_s = np.random.uniform(1.2, 2.2, size=m)
+            snooker_move = current_state + g_s[:, np.newaxis] * proj
+            proposal[snooker] = snooker_move[snooker]
+            with np.errstate(divide="ignore"):
+                log_jacobian[snooker] = (d - 1) * (
+                    np.log(np.linalg.norm(snooker_move - z, axis=1))
+                    - 0.5 * np.log(norm2)
+                )[snooker]
+        value = logpost(proposal, data_meas)
+        with np.errstate(invalid="ignore"):
+            accept = np.log(np.random.uniform(size=m)) < (
+                value - current_value + log_jacobian
+            )
+        current_state[accept] = proposal[accept]
+        current_value[accept] = value[accept]
+        n_accept += accept
+        parameters[:, :, t + 1] = current_state
+        lpost[:, t + 1] = current_value
+        if (t + 1) % archive_every == 0:
+            Z[M : M + m] = current_state
+            M += m
+        if t + 1 == t0:
+            # Forget the early, pre-convergence part of the archive
+            keep = M0 + m * ((t0 // 2) // archive_every)
+            if M - keep >= 3:
+                Z[: M - keep] = Z[keep:M]
+                M -= keep
+        if progress is not None:
+            progress.update(t + 1, n_accept, current_value)
+    mcmc_chains = [parameters[i].tolist() for i in rows]
+    ls = [lpost[i].tolist() for i in rows]
+    ar = (n_accept / n_iter).tolist()
+    return mcmc_chains, ar, ls
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tell module what it's allowed to import
+__all__ = [
+    "EventStream",
+    "PopulationProgress",
+    "JSONLinesSink",
+    "ConsoleSink",
+    "LogEvents",
+]
+
+import json
+import logging
+import sys
+import time
+
+
+class EventStream(object):
+    """
+    Publishes the events of a pipeline run to its `observers`, each a function
+    called with the event as a dictionary: its "event" kind, its "time", and
+    its fields. Progress events of the chains are emitted every `every`
+    iterations (see `ChainProgress`). The events emitted by the pipeline are:
+
+    - "chain_start": a chain (or a population of chains) starts sampling
+    - "progress": the "iteration" of a "chain", its "acceptance" rate and the
+      "iterations_per_sec" since the last progress event, its current
+      "logpost", and the "eta" in seconds
+    - "chain_end": a chain finishes, with its "acceptance" rate and "wall" time
+    - "log": a "message" written to the log, and whether it is "verbose"
+
+    Events with a "message" are also meant to be shown to users, except for
+    the "log" events that are not "verbose".
+    """
+
+    def __init__(self, observers=None, every=1000):
+        self.observers = list(observers or [])
+        self.every = every
+
+    def subscribe(self, observer):
+        self.observers.append(observer)
+
+    def emit(self, kind, **fields):
+        if not self.observers:
+            return
+        event = {"event": kind, "time": time.time()}
+        event.update(fields)
+        for observer in self.observers:
+            observer(event)
+
+    def progress(self, chain, n_iter):
+        return ChainProgress(self, chain, n_iter)
+
+
+class ChainProgress(object):
+    """
+    Tracks the progress of the Markov chain `chain` of `n_iter` iterations,
+    emitting a "progress" event to the `events` every `events.every`
+    iterations and at the end
+    """
+
+    def __init__(self, events, chain, n_iter):
+        self.events, self.chain, self.n_iter = events, chain, n_iter
+        self.start = self.last_time = time.perf_counter()
+        self.last_iteration, self.accepted = 0, 0
+
+    def update(self, iteration, accepted, logpost):
+        """
+        Record that the chain reached `iteration`, accepting `accepted`
+        proposals since the last update, with the log-posterior `logpost`
+        """
+        self.accepted += accepted
+        n = iteration - self.last_iteration
+        if n < self.events.every and iteration < self.n_iter:
+            return
+        now = time.perf_counter()
+        rate = n / (now - self.last_time) if now > self.last_time else None
+        total = iteration / (now - self.start) if now > self.start else None
+        self.events.emit(
+            "progress",
+            chain=self.chain,
+            iteration=iteration,
+            n_iter=self.n_iter,
+            acceptance=self.accepted / n,
+            logpost=float(logpost),
+            iterations_per_sec=rate,
+            eta=(self.n_iter - iteration) / total if total else None,
+        )
+        self.last_iteration, self.last_time, self.accepted = iteration, now, 0
+
+
+class PopulationProgress(object):
+    """
+    Tracks the progress of the `m` Markov chains of `n_iter` iterations that a
+    population sampler advances together, numbered from `first`, emitting a
+    "progress" event of each chain to the `events` every `events.every`
+    iterations and at the end
+    """
+
+    def __init__(self, events, m, n_iter, first=1):
+        self.events, self.n_iter = events, n_iter
+        self.chains = [events.progress(first + i, n_iter) for i in range(m)]
+        self.reported = [0] * m
+
+    def update(self, iteration, n_accept, logposts):
+        """
+        Record that the chains reached `iteration`, having accepted `n_accept`
+        proposals in total, with the log-posteriors `logposts`
+        """
+        if iteration % self.events.every and iteration < self.n_iter:
+            return
+        for i, chain in enumerate(self.chains):
+            chain.update(iteration, n_accept[i] - self.reported[i], logposts[i])
+            self.reported[i] = n_accept[i]
+
+
+class JSONLinesSink(object):
+    """
+    Observer writing each event as a line of JSON to the file `path`, flushed
+    as it is written so that the events can be followed live
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "w")
+
+    def __call__(self, event):
+        self.file.write(json.dumps(event) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ConsoleSink(object):
+    """
+    Observer showing the events with a "message" (of the "log" events, only the
+    "verbose" ones), and the progress of the chains, on the console
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def __call__(self, event):
+        if event["event"] == "progress":
+            # Overwrite the progress line of the chain on a terminal
+            end = "\r" if self.stream.isatty() else "\n"
+            if event["iteration"] == event["n_iter"]:
+                end = "\n"
+            self.stream.write(
+                "INFO : chain {0}: {1}/{2} iterations, acceptance {3:.3f}, "
+                "{4:.0f} it/s, ETA {5:.1f} s".format(
+                    event["chain"],
+                    event["iteration"],
+                    event["n_iter"],
+                    event["acceptance"],
+                    event["iterations_per_sec"] or 0,
+                    event["eta"] or 0,
+                )
+                + end
+            )
+            self.stream.flush()
+        elif "message" in event and event.get("verbose", True):
+            print("INFO : " + event["message"], file=self.stream)
+
+
+class LogEvents(logging.Handler):
+    """
+    Logging handler forwarding the messages written to the log as "log" events
+    of the `events`, which are "verbose" if they were logged by `utils.log`
+    with `verbose`
+    """
+
+    def __init__(self, events):
+        logging.Handler.__init__(self)
+        self.events = events
+
+    def emit(self, record):
+        self.events.emit(
+            "log",
+            message=record.getMessage(),
+            verbose=getattr(record, "verbose", False),
+        )
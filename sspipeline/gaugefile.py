@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tell module what it's allowed to import
+__all__ = ["EXTENSION", "convert_gauge", "is_gauge_file", "open_gauge"]
+
+import numpy as np
+import pandas as pd
+
+# Extension of the converted gauge files
+EXTENSION = ".gauge"
+MAGIC = b"SSGAUGE1"
+# Fixed 32 byte header, followed by the hours, sea level and mask columns
+HEADER = np.dtype(
+    [
+        ("magic", "S8"),
+        ("count", "<u8"),
+        ("itemsize", "<u4"),
+        ("fill", "<i4"),
+        ("has_fill", "u1"),
+        ("reserved", "V7"),
+    ]
+)
+
+
+def fill_value(sealevel):
+    """
+    The fill in value of a record: the most common of its sea levels below
+    -5000 mm, or None if there are none.
+
+    Parameters
+    ----------
+    sealevel : :class:`numpy.ndarray`
+        hourly sea levels, in mm
+
+    Returns
+    -------
+    fill : int or None
+        the fill in value
+    """
+    low = sealevel[sealevel < -5000]
+    if len(low) == 0:
+        return None
+    values, counts = np.unique(low, return_counts=True)
+    return int(values[np.argmax(counts)])
+
+
+def convert_gauge(csvfile, path):
+    """
+    Convert a tide gauge record in the UHSLC hourly CSV format into a compact
+    columnar binary file, which `open_gauge` maps into memory instead of
+    parsing. The file holds a 32 byte header, then the hours since
+    1970-01-01T00 as int32, the sea levels in mm as int16 (or int32 if they do
+    not fit) and a mask of the fill in values, one byte per hour, all sorted by
+    time.
+
+    Parameters
+    ----------
+    csvfile : str
+        where the CSV file is located
+    path : str
+        where to write the binary file
+
+    Returns
+    -------
+    count : int
+        number of hours in the record
+    fill : int or None
+        the fill in value of the record
+    """
+    dfSL = pd.read_csv(csvfile, header=None).dropna()
+    times = pd.to_datetime(
+        pd.DataFrame(
+            {"year": dfSL[0], "month": dfSL[1], "day": dfSL[2], "hour": dfSL[3]}
+        )
+    )
+    hours = (times - pd.Timestamp(0)) // pd.Timedelta(hours=1)
+    order = np.argsort(hours.to_numpy(), kind="stable")
+    hours = hours.to_numpy()[order]
+    sealevel = np.round(dfSL[4].to_numpy()[order]).astype(np.int64)
+    fill = fill_value(sealevel)
+    itemsize = 4
+    if len(sealevel) == 0 or (
+        sealevel.min() >= np.iinfo(np.int16).min
+        and sealevel.max() <= np.iinfo(np.int16).max
+    ):
+        itemsize = 2
+    header = np.zeros(1, dtype=HEADER)
+    header["magic"] = MAGIC
+    header["count"] = len(hours)
+    header["itemsize"] = itemsize
+    header["fill"] = 0 if fill is None else fill
+    header["has_fill"] = fill is not None
+    with open(path, "wb") as f:
+        f.write(header.tobytes())
+        f.write(hours.astype("<i4").tobytes())
+        f.write(sealevel.astype("<i" + str(itemsize)).tobytes())
+        f.write((sealevel == fill).astype("u1").tobytes())
+    return len(hours), fill
+
+
+def is_gauge_file(path):
+    """
+    Whether `path` is a binary file written by `convert_gauge`.
+    """
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def open_gauge(path):
+    """
+    Map a binary file written by `convert_gauge` into memory, without reading
+    it.
+
+    Parameters
+    ----------
+    path : str
+        where the binary file is located
+
+    Returns
+    -------
+    hours : :class:`numpy.memmap`
+        hours since 1970-01-01T00, in increasing order
+    sealevel : :class:`numpy.memmap`
+        sea levels, in mm
+    mask : :class:`numpy.memmap`
+        whether each sea level is the fill in value
+    fill : int or None
+        the fill in value of the record
+    """
+    header = np.fromfile(path, dtype=HEADER, count=1)
+    if len(header) == 0 or header["magic"][0] != MAGIC:
+        raise ValueError(path + " is not a gauge file written by convert_gauge")
+    n, itemsize = int(header["count"][0]), int(header["itemsize"][0])
+    fill = int(header["fill"][0]) if header["has_fill"][0] else None
+    if n == 0:
+        empty = np.empty(0, dtype="<i4")
+        return empty, empty, np.empty(0, dtype=bool), fill
+    offset = HEADER.itemsize
+    hours = np.memmap(path, dtype="<i4", mode="r", offset=offset, shape=(n,))
+    offset += 4 * n
+    sealevel = np.memmap(
+        path, dtype="<i" + str(itemsize), mode="r", offset=offset, shape=(n,)
+    )
+    offset += itemsize * n
+    mask = np.memmap(path, dtype=bool, mode="r", offset=offset, shape=(n,))
+    return hours, sealevel, mask, fill
@@ -79,8 +79,8 @@ def psrf(sequences):
                   \\text{where }\\textrm{Var}_i\\text{ is the variance of
                   sequence $i$}
     """
-    u = [np.mean(sequence) for sequence in sequences]
-    s = [np.var(sequence, ddof=1) for sequence in sequences]
+    u = [np.mean(sequence, dtype=float) for sequence in sequences]
+    s = [np.var(sequence, ddof=1, dtype=float) for sequence in sequences]
     m = len(sequences)
     n = len(sequences[0])
     U = np.mean(u)
@@ -18,39 +18,156 @@
 # along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
 
 # Tell module what it's allowed to import
-__all__ = ["logpost"]
+__all__ = [
+    "PreparedData",
+    "prepare_data",
+    "logpost",
+    "batch_loglikelihood",
+    "batch_logpost",
+    "grad_logpost",
+    "hess_logpost",
+    "set_threads",
+]
+
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
 
-import scipy.stats as stats
 import numpy as np
 
+from .priors import compile_prior
+
+# Compiled once, for when no prior is passed in
+DEFAULT_PRIOR = compile_prior()
+
+# Persistent thread pool that the batched log-likelihoods shard the data over
+# (see `set_threads`), and the least work (data values times parameter sets)
+# worth handing to a thread
+POOL = {"threads": 1, "executor": None}
+MIN_SHARD_WORK = 50000
+
+
+class PreparedData(object):
+    """
+    Annual maxima prepared once for repeated log-posterior evaluations
+
+    The values are held as a contiguous float64 array (in their original
+    order), along with their sorted order, count, minimum, maximum, sum and sum
+    of squares. Since the support of a GEV distribution is an interval, the
+    minimum and maximum are all that `in_support` needs to reject a parameter
+    set without touching the data. Wherever an array is expected, it behaves
+    like the array of values.
+
+    Parameters
+    ----------
+    data : :class:`numpy.ndarray`
+        the data you're fitting
+    """
+
+    def __init__(self, data):
+        self.values = np.ascontiguousarray(data, dtype=float)
+        self.sorted = np.sort(self.values)
+        self.n = len(self.values)
+        self.min = float(self.sorted[0])
+        self.max = float(self.sorted[-1])
+        self.sum = float(np.sum(self.values))
+        self.sum_squares = float(np.sum(self.values ** 2))
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.values
+        return self.values.astype(dtype)
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def mean(self):
+        return self.sum / self.n
+
+    def std(self):
+        return np.sqrt(max(self.sum_squares / self.n - self.mean() ** 2, 0.0))
+
+
+def prepare_data(data):
+    """
+    Wrap `data` in a `PreparedData`, unless it already is one
+
+    Parameters
+    ----------
+    data : :class:`PreparedData` or :class:`numpy.ndarray`
+        the data you're fitting
+
+    Returns
+    -------
+    data : :class:`PreparedData`
+    """
+    if isinstance(data, PreparedData):
+        return data
+    return PreparedData(data)
+
+
+def in_support(parameters, data):
+    """
+    Check whether every observation lies inside the support of a GEV
+    distribution, for one or many parameter sets, using only the data minimum
+    and maximum (precomputed by `PreparedData`)
+
+    Parameters
+    ----------
+    parameters : :class:`numpy.ndarray`
+        array of shape (..., 3) holding the :math:`\mu`, :math:`\sigma`, and
+        :math:`\\xi` parameters of each GEV distribution
+    data : :class:`PreparedData` or :class:`numpy.ndarray`
+        the data you're fitting
+
+    Returns
+    -------
+    supported : :class:`numpy.ndarray`
+        boolean array of shape (...)
+    """
+    parameters = np.asarray(parameters, dtype=float)
+    if isinstance(data, PreparedData):
+        data_min, data_max = data.min, data.max
+    else:
+        data_min, data_max = np.min(data), np.max(data)
+    mu, sigma, shape = parameters[..., 0], parameters[..., 1], parameters[..., 2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z_min = 1 + shape * (data_min - mu) / sigma
+        z_max = 1 + shape * (data_max - mu) / sigma
+    return (sigma > 0) & (z_min > 0) & (z_max > 0)
+
 
 def loglikelihood(parameters, data):
     """
-    Compute the log-likelihood of a GEV distribution
+    Compute the log-likelihood of a GEV distribution, rejecting the parameter
+    sets outside of the support (see `in_support`) before evaluating the
+    vectorized `gev_logpdf` on the data
 
     Parameters
     ----------
     parameters : tuple
         :math:`\mu`, :math:`\sigma`, and :math:`\\xi` parameters for a GEV
         distribution
-    data : :class:`numpy.ndarray`
+    data : :class:`PreparedData` or :class:`numpy.ndarray`
         the data you're fitting
 
     Returns
     -------
     log_likelihood : float
     """
+    if not in_support(parameters, data):
+        return -np.inf
     mu, sigma, shape = parameters
-    s = 0
-    for i in range(len(data)):
-        logpdf = stats.genextreme.logpdf(x=data[i], loc=mu, scale=sigma, c=-shape)
-        if logpdf == -np.inf:
-            return -np.inf
-        s += logpdf
-    return s
+    return float(np.sum(gev_logpdf(np.asarray(data), mu, sigma, shape)))
 
 
-def logprior(parameters):
+def logprior(parameters, prior=None):
     """
     Compute the log-prior of a GEV distribution
 
@@ -59,19 +176,20 @@ def logprior(parameters):
     parameters : tuple
         :math:`\mu`, :math:`\sigma`, and :math:`\\xi` parameters for a GEV
         distribution
+    prior : :class:`priors.GEVPrior`
+        the compiled priors (by default, uniform priors on :math:`\mu` and
+        :math:`\sigma`, and a wide normal prior on :math:`\\xi`)
 
     Returns
     -------
     log_prior : float
     """
-    mu, sigma, shape = parameters
-    mu_logpdf = stats.uniform.logpdf(x=mu, loc=0, scale=10000)
-    sigma_logpdf = stats.uniform.logpdf(x=sigma, loc=0, scale=10000)
-    shape_logpdf = stats.norm.logpdf(x=shape, loc=0, scale=1000)
-    return mu_logpdf + sigma_logpdf+ shape_logpdf
+    if prior is None:
+        prior = DEFAULT_PRIOR
+    return prior(parameters)
 
 
-def logpost(parameters, data):
+def logpost(parameters, data, prior=None):
     """
     Compute the log-posterior (log-prior + log-likelihood) of a GEV
     distribution
@@ -83,13 +201,347 @@ def logpost(parameters, data):
         distribution
     data : :class:`numpy.ndarray`
         the data you're fitting
+    prior : :class:`priors.GEVPrior`
+        the compiled priors (see `logprior`)
 
     Returns
     -------
     log_post : float
     """
-    pi = logprior(parameters)
-    if pi == -np.inf:
+    pi = logprior(parameters, prior)
+    if pi == -np.inf or not in_support(parameters, data):
         return -np.inf
     LL = loglikelihood(parameters, data)
     return LL + pi
+
+
+def gev_logpdf(x, mu, sigma, shape):
+    """
+    Vectorized log-density of a GEV distribution, broadcasting over all of its
+    arguments (same parameterization as `loglikelihood`, so that the shape is
+    the negative of the scipy `c` parameter)
+
+    Parameters
+    ----------
+    x : :class:`numpy.ndarray`
+        points at which to evaluate the log-density
+    mu, sigma, shape : :class:`numpy.ndarray`
+        :math:`\mu`, :math:`\sigma`, and :math:`\\xi` parameters for a GEV
+        distribution
+
+    Returns
+    -------
+    log_pdf : :class:`numpy.ndarray`
+        the log-density, with -inf outside of the support
+    """
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        z = (x - mu) / sigma
+        gumbel = np.abs(shape) < 1e-10
+        safe_shape = np.where(gumbel, 1.0, shape)
+        logt = np.log1p(safe_shape * z)
+        logpdf = np.where(
+            gumbel,
+            -z - np.exp(-z),
+            -(1 + 1 / safe_shape) * logt - np.exp(-logt / safe_shape),
+        )
+        logpdf = np.where(gumbel | (1 + safe_shape * z > 0), logpdf, -np.inf)
+        return np.where(sigma > 0, logpdf - np.log(sigma), -np.inf)
+
+
+def set_threads(threads):
+    """
+    Set the number of threads that the batched log-likelihoods shard the data
+    over, keeping a persistent pool of them. With 1 (the default), everything
+    runs on the calling thread; with 0 or None, one thread per CPU is used.
+
+    Parameters
+    ----------
+    threads : int
+        number of threads
+    """
+    threads = threads or os.cpu_count() or 1
+    if threads == POOL["threads"]:
+        return
+    if POOL["executor"] is not None:
+        POOL["executor"].shutdown()
+    POOL["executor"] = None
+    if threads > 1:
+        POOL["executor"] = ThreadPoolExecutor(
+            threads, thread_name_prefix="sspipeline-likelihood"
+        )
+    POOL["threads"] = threads
+
+
+def shard_sum(func, values, n_sets, *args):
+    """
+    Compute ``func(values, *args)``, a sum over the data `values` for each of
+    `n_sets` parameter sets, by splitting the data into contiguous shards that
+    are summed on the thread pool (see `set_threads`) and then adding up the
+    partial sums. NumPy releases the GIL in its ufuncs, so the shards run in
+    parallel. The number of shards adapts to the work, so that small datasets
+    keep the single-threaded path.
+
+    Parameters
+    ----------
+    func : callable
+        returns the sums over (a shard of) the data, of shape (n_sets,)
+    values : :class:`numpy.ndarray`
+        the data, of shape (n,)
+    n_sets : int
+        the number of parameter sets
+    args : tuple
+        further arguments to `func`
+
+    Returns
+    -------
+    sums : :class:`numpy.ndarray`
+        array of shape (n_sets,)
+    """
+    n_shards = min(POOL["threads"], len(values) * n_sets // MIN_SHARD_WORK)
+    if n_shards <= 1 or POOL["executor"] is None:
+        return func(values, *args)
+    size = int(math.ceil(len(values) / n_shards))
+    futures = [
+        POOL["executor"].submit(func, values[i : i + size], *args)
+        for i in range(0, len(values), size)
+    ]
+    return sum(future.result() for future in futures)
+
+
+def gev_sum(values, mu, sigma, shape):
+    """
+    Helper function to `batch_loglikelihood`, which sums the GEV log-density
+    of `values` for each parameter set
+    """
+    return np.sum(gev_logpdf(values, mu, sigma, shape), axis=-1)
+
+
+def batch_loglikelihood(parameters, data):
+    """
+    Compute the log-likelihood of a GEV distribution for many parameter sets
+    at once. Data shared by all of the parameter sets are sharded over the
+    threads set by `set_threads`, if there are enough of them.
+
+    Parameters
+    ----------
+    parameters : :class:`numpy.ndarray`
+        array of shape (..., 3) holding the :math:`\mu`, :math:`\sigma`, and
+        :math:`\\xi` parameters of each GEV distribution
+    data : :class:`PreparedData` or :class:`numpy.ndarray`
+        the data you're fitting, either shared by all parameter sets (shape
+        (n,)), in which case the parameter sets outside of the support are
+        rejected without evaluating the data, or one record per parameter set
+        (shape (..., n))
+
+    Returns
+    -------
+    log_likelihood : :class:`numpy.ndarray`
+        array of shape (...)
+    """
+    parameters = np.asarray(parameters, dtype=float)
+    values = np.asarray(data)
+    if values.ndim > 1:
+        # One record per parameter set, so there is no shared support to check
+        mu = parameters[..., 0:1]
+        sigma = parameters[..., 1:2]
+        shape = parameters[..., 2:3]
+        return np.sum(gev_logpdf(values, mu, sigma, shape), axis=-1)
+    # Only evaluate the parameter sets that put all of the data in the support
+    supported = in_support(parameters, data)
+    LL = np.full(supported.shape, -np.inf)
+    kept = parameters[supported]
+    LL[supported] = shard_sum(
+        gev_sum, values, len(kept), kept[:, 0:1], kept[:, 1:2], kept[:, 2:3]
+    )
+    return LL
+
+
+def batch_logprior(parameters, prior=None):
+    """
+    Compute the log-prior of a GEV distribution for many parameter sets at once
+    (same priors as `logprior`)
+
+    Parameters
+    ----------
+    parameters : :class:`numpy.ndarray`
+        array of shape (..., 3) holding the :math:`\mu`, :math:`\sigma`, and
+        :math:`\\xi` parameters of each GEV distribution
+    prior : :class:`priors.GEVPrior`
+        the compiled priors (see `logprior`)
+
+    Returns
+    -------
+    log_prior : :class:`numpy.ndarray`
+        array of shape (...)
+    """
+    if prior is None:
+        prior = DEFAULT_PRIOR
+    return prior(parameters)
+
+
+def batch_logpost(parameters, data, prior=None):
+    """
+    Compute the log-posterior (log-prior + log-likelihood) of a GEV
+    distribution for many parameter sets at once
+
+    Parameters
+    ----------
+    parameters : :class:`numpy.ndarray`
+        array of shape (..., 3) holding the :math:`\mu`, :math:`\sigma`, and
+        :math:`\\xi` parameters of each GEV distribution
+    data : :class:`numpy.ndarray`
+        the data you're fitting
+    prior : :class:`priors.GEVPrior`
+        the compiled priors (see `logprior`)
+
+    Returns
+    -------
+    log_post : :class:`numpy.ndarray`
+        array of shape (...)
+    """
+    parameters = np.asarray(parameters, dtype=float)
+    pi = batch_logprior(parameters, prior)
+    # Only evaluate the likelihood of the parameter sets the prior allows
+    allowed = pi > -np.inf
+    lp = np.full(pi.shape, -np.inf)
+    lp[allowed] = pi[allowed] + batch_loglikelihood(parameters[allowed], data)
+    return lp
+
+
+def grad_loglikelihood(parameters, data):
+    """
+    Compute the analytic gradient of the log-likelihood of a GEV distribution
+    with respect to its parameters, for many parameter sets at once
+
+    With :math:`z = (x - \mu) / \sigma`, :math:`t = 1 + \\xi z` and
+    :math:`A = t^{-1/\\xi}`, each observation contributes
+
+    .. math:: \\frac{\partial \ell}{\partial \mu} = \\frac{1 + \\xi -
+              A}{\sigma t}, \quad \\frac{\partial \ell}{\partial
+              \sigma} = \\frac{z (1 + \\xi - A) / t - 1}{\sigma}, \quad
+              \\frac{\partial \ell}{\partial \\xi} = \\frac{(1 - A)
+              \log t}{\\xi^2} - \\frac{z (1 + \\xi - A)}{\\xi t}
+
+    with the Gumbel limits used for :math:`\\xi \\to 0`.
+
+    Parameters
+    ----------
+    parameters : :class:`numpy.ndarray`
+        array of shape (..., 3) holding the :math:`\mu`, :math:`\sigma`, and
+        :math:`\\xi` parameters of each GEV distribution
+    data : :class:`numpy.ndarray`
+        the data you're fitting
+
+    Returns
+    -------
+    grad_log_likelihood : :class:`numpy.ndarray`
+        array of shape (..., 3), set to zero where the data fall outside of
+        the support
+    """
+    parameters = np.asarray(parameters, dtype=float)
+    mu = parameters[..., 0:1]
+    sigma = parameters[..., 1:2]
+    shape = parameters[..., 2:3]
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        z = (np.asarray(data) - mu) / sigma
+        gumbel = np.abs(shape) < 1e-10
+        safe_shape = np.where(gumbel, 1.0, shape)
+        logt = np.where(gumbel, 0.0, np.log1p(safe_shape * z))
+        A = np.where(gumbel, np.exp(-z), np.exp(-logt / safe_shape))
+        t = np.exp(logt)
+        common = (1 + shape - A) / t
+        d_mu = common / sigma
+        d_sigma = (z * common - 1) / sigma
+        d_shape = np.where(
+            gumbel,
+            z ** 2 / 2 * (1 - np.exp(-z)) - z,
+            (1 - A) * logt / safe_shape ** 2 - z * common / safe_shape,
+        )
+        grad = np.stack(
+            [np.sum(d_mu, axis=-1), np.sum(d_sigma, axis=-1), np.sum(d_shape, axis=-1)],
+            axis=-1,
+        )
+    return np.where(np.isfinite(grad), grad, 0.0)
+
+
+def grad_logprior(parameters, prior=None):
+    """
+    Compute the analytic gradient of the log-prior of a GEV distribution (same
+    priors as `logprior`) for many parameter sets at once
+
+    Parameters
+    ----------
+    parameters : :class:`numpy.ndarray`
+        array of shape (..., 3) holding the :math:`\mu`, :math:`\sigma`, and
+        :math:`\\xi` parameters of each GEV distribution
+    prior : :class:`priors.GEVPrior`
+        the compiled priors (see `logprior`)
+
+    Returns
+    -------
+    grad_log_prior : :class:`numpy.ndarray`
+        array of shape (..., 3)
+    """
+    if prior is None:
+        prior = DEFAULT_PRIOR
+    return prior.grad(parameters)
+
+
+def grad_logpost(parameters, data, prior=None):
+    """
+    Compute the analytic gradient of the log-posterior of a GEV distribution
+    for many parameter sets at once
+
+    Parameters
+    ----------
+    parameters : :class:`numpy.ndarray`
+        array of shape (..., 3) holding the :math:`\mu`, :math:`\sigma`, and
+        :math:`\\xi` parameters of each GEV distribution
+    data : :class:`numpy.ndarray`
+        the data you're fitting
+    prior : :class:`priors.GEVPrior`
+        the compiled priors (see `logprior`)
+
+    Returns
+    -------
+    grad_log_post : :class:`numpy.ndarray`
+        array of shape (..., 3)
+    """
+    return grad_loglikelihood(parameters, data) + grad_logprior(parameters, prior)
+
+
+def hess_logpost(parameters, data, rel_step=1e-6, prior=None):
+    """
+    Compute the Hessian of the log-posterior of a GEV distribution for many
+    parameter sets at once, by central differences of the analytic gradient
+    `grad_logpost`
+
+    Parameters
+    ----------
+    parameters : :class:`numpy.ndarray`
+        array of shape (..., 3) holding the :math:`\mu`, :math:`\sigma`, and
+        :math:`\\xi` parameters of each GEV distribution
+    data : :class:`numpy.ndarray`
+        the data you're fitting
+    rel_step : float
+        finite-difference step, relative to the size of each parameter
+    prior : :class:`priors.GEVPrior`
+        the compiled priors (see `logprior`)
+
+    Returns
+    -------
+    hess_log_post : :class:`numpy.ndarray`
+        array of shape (..., 3, 3)
+    """
+    parameters = np.asarray(parameters, dtype=float)
+    d = parameters.shape[-1]
+    h = rel_step * np.maximum(np.abs(parameters), 1)
+    columns = []
+    for i in range(d):
+        step = np.zeros_like(parameters)
+        step[..., i] = h[..., i]
+        forward = grad_logpost(parameters + step, data, prior)
+        backward = grad_logpost(parameters - step, data, prior)
+        columns.append((forward - backward) / (2 * h[..., i : i + 1]))
+    H = np.stack(columns, axis=-1)
+    return (H + np.swapaxes(H, -1, -2)) / 2
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tell module what it's allowed to import
+__all__ = [
+    "HAVE_NUMBA",
+    "BACKENDS",
+    "resolve_backend",
+    "make_logpost",
+    "adaptive_block",
+    "compile_kernels",
+]
+
+import math
+
+import numpy as np
+
+try:
+    import numba
+
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+BACKENDS = ["auto", "numba", "numpy"]
+
+# Log-posterior functions built by `make_logpost`, by priors and backend
+LOGPOSTS = {}
+
+
+def resolve_backend(backend):
+    """
+    Resolve the requested `backend` ("auto", "numba" or "numpy") into the one
+    that will be used: "numba" only if Numba is installed, "numpy" otherwise.
+    """
+    if backend != "numpy" and HAVE_NUMBA:
+        return "numba"
+    return "numpy"
+
+
+def prior_logpdf(row, x):
+    """
+    Scalar log-density at `x` of one prior, from its row of the
+    `priors.GEVPrior` table (the prior type code followed by its constants).
+    """
+    code, a, b, c = row[0], row[1], row[2], row[3]
+    if code == 0:
+        if x < a or x > b:
+            return -np.inf
+        return c
+    if code == 1:
+        return c - 0.5 * ((x - a) * b) ** 2
+    if code == 2:
+        if x < a:
+            return -np.inf
+        return c - math.log1p(((x - a) * b) ** 2)
+    if x <= 0:
+        return -np.inf
+    logx = math.log(x)
+    return c - logx - 0.5 * ((logx - a) * b) ** 2
+
+
+def gev_loglikelihood(parameters, data):
+    """
+    Scalar log-likelihood of a GEV distribution, with the same
+    parameterization as `gev_utils.loglikelihood`. The `data` must be sorted in
+    increasing order, so that parameter sets outside of the support are
+    rejected from its first and last values alone.
+    """
+    mu, sigma, shape = parameters[0], parameters[1], parameters[2]
+    if sigma <= 0:
+        return -np.inf
+    if abs(shape) >= 1e-10:
+        if 1 + shape * (data[0] - mu) / sigma <= 0:
+            return -np.inf
+        if 1 + shape * (data[len(data) - 1] - mu) / sigma <= 0:
+            return -np.inf
+    s = 0.0
+    for i in range(len(data)):
+        z = (data[i] - mu) / sigma
+        if abs(shape) < 1e-10:
+            s -= z + math.exp(-z)
+        else:
+            t = 1 + shape * z
+            if t <= 0:
+                return -np.inf
+            logt = math.log(t)
+            s -= (1 + 1 / shape) * logt + math.exp(-logt / shape)
+        s -= math.log(sigma)
+    return s
+
+
+def make_logpost(table, jit=False):
+    """
+    Build the scalar GEV log-posterior for the priors in `table` (see
+    `priors.GEVPrior`), written as plain loops with the prior constants folded
+    in. Proposals outside of the prior or the support are rejected before the
+    data are touched, so the data must be sorted (see
+    `gev_utils.PreparedData`). With `jit=True` it is compiled by Numba, for
+    `adaptive_block`. The functions are cached by their priors, so that a
+    long-running process compiles them (and `adaptive_block` for them) once.
+    """
+    table = np.array(table, dtype=float)
+    key = (table.tobytes(), jit)
+    if key not in LOGPOSTS:
+        LOGPOSTS[key] = build_logpost(table, jit)
+    return LOGPOSTS[key]
+
+
+def build_logpost(table, jit):
+    """
+    Helper function to `make_logpost`
+    """
+    if jit:
+        prior, loglikelihood = jit_prior_logpdf, jit_gev_loglikelihood
+    else:
+        prior, loglikelihood = prior_logpdf, gev_loglikelihood
+
+    def logpost(parameters, data):
+        s = 0.0
+        for i in range(3):
+            s += prior(table[i], parameters[i])
+        if s == -np.inf:
+            return s
+        return s + loglikelihood(parameters, data)
+
+    if jit:
+        return numba.njit(logpost)
+    return logpost
+
+
+def adaptive_block(
+    state, value, mean, M2, count, data, z, u, start, t0, scale, S_d, out, logpost
+):
+    """
+    Run one block of iterations of the adaptive Metropolis-Hastings algorithm
+    (Haario et al., 2001; https://projecteuclid.org/euclid.bj/1080222083)
+    without returning to the interpreter in between.
+
+    The adaptation state is explicit: the current `state` and its log-posterior
+    `value`, and the running `mean`, sum of squared deviations `M2` and `count`
+    of the chain so far (Welford's algorithm). `state`, `mean` and `M2` are
+    updated in place. The random numbers are drawn beforehand, one row of
+    standard normals `z` and one uniform `u` per iteration, so that every
+    backend consumes the same random stream. The proposal covariance is the
+    diagonal `scale` ** 2 up to iteration `t0`, and the running covariance
+    times `S_d` afterwards. The states and log-posteriors of iterations
+    `start + 1` onward are written into the columns of `out` (the last row of
+    which holds the log-posteriors).
+
+    Returns the log-posterior of the final state, the new count and the number
+    of accepted proposals.
+    """
+    d = len(state)
+    proposal = np.empty(d)
+    delta = np.empty(d)
+    L = np.zeros((d, d))
+    n_accept = 0
+    for k in range(len(u)):
+        t = start + k
+        if t <= t0:
+            for i in range(d):
+                proposal[i] = state[i] + scale[i] * z[k, i]
+        else:
+            # Cholesky factor of S_d * (covariance + 0.0001 * I)
+            for i in range(d):
+                for j in range(i + 1):
+                    s = S_d * M2[i, j] / (count - 1)
+                    if i == j:
+                        s += S_d * 0.0001
+                    for l in range(j):
+                        s -= L[i, l] * L[j, l]
+                    if i == j:
+                        L[i, i] = math.sqrt(s)
+                    else:
+                        L[i, j] = s / L[j, j]
+            for i in range(d):
+                s = state[i]
+                for j in range(i + 1):
+                    s += L[i, j] * z[k, j]
+                proposal[i] = s
+        new_value = logpost(proposal, data)
+        diff = new_value - value
+        if diff >= 0 or u[k] < math.exp(diff):
+            n_accept += 1
+            for i in range(d):
+                state[i] = proposal[i]
+            value = new_value
+        # Update the running moments
+        count += 1
+        for i in range(d):
+            delta[i] = state[i] - mean[i]
+            mean[i] += delta[i] / count
+        for i in range(d):
+            for j in range(d):
+                M2[i, j] += delta[i] * (state[j] - mean[j])
+        for i in range(d):
+            out[i, t + 1] = state[i]
+        out[d, t + 1] = value
+    return value, count, n_accept
+
+
+if HAVE_NUMBA:
+    jit_prior_logpdf = numba.njit(cache=True)(prior_logpdf)
+    jit_gev_loglikelihood = numba.njit(cache=True)(gev_loglikelihood)
+    jit_adaptive_block = numba.njit(cache=True)(adaptive_block)
+
+
+def compile_kernels(table, dtype=None):
+    """
+    Compile the Numba log-posterior for the priors in `table` and
+    `adaptive_block` for it (writing the chains as `dtype`), by running them on
+    a tiny input, so that the compilation is not timed as part of the first
+    chain. Does nothing without Numba.
+    """
+    if not HAVE_NUMBA:
+        return
+    logpost = make_logpost(table, jit=True)
+    state, data = np.ones(3), np.ones(1)
+    out = np.empty((4, 2), dtype=dtype or float)
+    jit_adaptive_block(
+        state,
+        float(logpost(state, data)),
+        np.array(state),
+        np.zeros((3, 3)),
+        1,
+        data,
+        np.zeros((1, 3)),
+        np.zeros(1),
+        0,
+        0,
+        np.ones(3),
+        1.0,
+        out,
+        logpost,
+    )
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tell module what it's allowed to import
+__all__ = ["laplace"]
+
+import numpy as np
+import scipy.optimize as optimize
+
+from .gev_utils import in_support
+from .gev_utils import prepare_data
+
+
+def find_mode(data_meas, logpost):
+    """
+    Locate the posterior mode by maximizing the batched `logpost` (see
+    `gev_utils.batch_logpost`) with the Nelder-Mead simplex method. The search starts from the method-of-moments estimates for
+    a Gumbel distribution (a GEV with zero shape), and is restarted once from
+    the first optimum to polish the result.
+    """
+    np.seterr(divide="ignore", invalid="ignore")
+    data_meas = prepare_data(data_meas)
+    scale_est = np.sqrt(6) * data_meas.std() / np.pi
+    loc_est = data_meas.mean() - 0.5772 * scale_est
+    shape_est = 0.01
+
+    def objective(theta):
+        return -float(logpost(theta, data_meas))
+
+    x0 = np.array([loc_est, scale_est, shape_est])
+    for i in range(2):
+        result = optimize.minimize(
+            objective,
+            x0,
+            method="Nelder-Mead",
+            options={"xatol": 1e-8, "fatol": 1e-10, "maxiter": 5000},
+        )
+        x0 = result.x
+    return result.x, -result.fun
+
+
+def hessian(f, x, h):
+    """
+    Central finite-difference approximation to the Hessian matrix of the scalar
+    function `f` at `x`, using the per-coordinate step sizes `h`. All of the
+    points of the stencil are evaluated with one call to `f`, which must accept
+    a batch of parameter sets.
+    """
+    d = len(x)
+    steps = np.diag(h)
+    points = [x]
+    for i in range(d):
+        points += [x + steps[i], x - steps[i]]
+    for i in range(d):
+        for j in range(i + 1, d):
+            points += [
+                x + steps[i] + steps[j],
+                x + steps[i] - steps[j],
+                x - steps[i] + steps[j],
+                x - steps[i] - steps[j],
+            ]
+    values = f(np.array(points))
+    H = np.zeros((d, d))
+    for i in range(d):
+        H[i, i] = (values[1 + 2 * i] - 2 * values[0] + values[2 + 2 * i]) / h[i] ** 2
+    k = 1 + 2 * d
+    for i in range(d):
+        for j in range(i + 1, d):
+            H[i, j] = (values[k] - values[k + 1] - values[k + 2] + values[k + 3]) / (
+                4 * h[i] * h[j]
+            )
+            H[j, i] = H[i, j]
+            k += 4
+    return H
+
+
+def laplace(
+    data_meas,
+    logpost,
+    n_samples=10000,
+    n_check=200,
+    ess_threshold=0.5,
+    support_threshold=0.01,
+):
+    """
+    Fast approximate alternative to `runner`: fit the posterior mode, build a
+    Gaussian approximation to the posterior from the Hessian of the
+    log-posterior at the mode, and draw `n_samples` parameter sets from it in a
+    single vectorized call. `logpost` must accept a batch of parameter sets
+    (see `gev_utils.batch_logpost`).
+
+    The quality of the approximation is checked with importance weights
+    (log-posterior minus Gaussian log-density) on `n_check` of the draws. The
+    approximation is flagged as poor if the Hessian is not negative definite,
+    if the relative effective sample size of those weights is below
+    `ess_threshold`, or if more than `support_threshold` of the draws fall
+    outside the support of the GEV distribution. Flagged gauges should be
+    re-run with the full MCMC.
+
+    Returns the draws in the same shape as a single `adaptivemcmc` chain (so
+    that `final_params_pool` can be used with no burn-in and a lag of 1), the
+    posterior mode, and a dictionary of the quality diagnostics.
+    """
+    data_meas = prepare_data(data_meas)
+    mode, lp_mode = find_mode(data_meas, logpost)
+    h = 1e-4 * np.maximum(np.abs(mode), 1)
+    H = hessian(lambda theta: logpost(theta, data_meas), mode, h)
+    # The Gaussian precision is the negative Hessian; fall back on the absolute
+    # eigenvalues if the mode is not a well-defined maximum
+    evals, evecs = np.linalg.eigh(-H)
+    hessian_ok = bool(np.all(evals > 0) and np.all(np.isfinite(evals)))
+    cov = np.matmul(evecs / np.abs(evals), np.transpose(evecs))
+    draws = np.random.multivariate_normal(mode, cov, size=n_samples)
+
+    supported = in_support(draws, data_meas)
+    outside_support = 1 - np.mean(supported)
+    draws = draws[supported]
+
+    # Importance weights of the posterior against the Gaussian approximation
+    n_check = min(n_check, len(draws))
+    diff = draws[:n_check] - mode
+    logq = -0.5 * np.sum(np.matmul(diff, -H) * diff, axis=1)
+    logp = logpost(draws[:n_check], data_meas)
+    logw = (logp - lp_mode) - logq
+    w = np.exp(logw - np.max(logw))
+    ess_fraction = np.sum(w) ** 2 / (n_check * np.sum(w ** 2))
+
+    quality = {
+        "hessian_ok": hessian_ok,
+        "ess_fraction": float(ess_fraction),
+        "outside_support": float(outside_support),
+        "poor": bool(
+            (not hessian_ok)
+            or ess_fraction < ess_threshold
+            or outside_support > support_threshold
+        ),
+    }
+    return [np.transpose(draws).tolist()], list(mode), quality
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tell module what it's allowed to import
+__all__ = ["mala"]
+
+import numpy as np
+
+from .events import PopulationProgress
+
+
+def log_transition(x_to, x_from, grad_from, h, C, C_inv):
+    """
+    Log-density (up to a constant) of the preconditioned Langevin proposal from
+    `x_from` to `x_to`, for a batch of chains.
+    """
+    drift = (h / 2)[:, np.newaxis] * np.einsum("...ij,...j->...i", C, grad_from)
+    r = x_to - x_from - drift
+    return -np.einsum("...i,...ij,...j->...", r, C_inv, r) / (2 * h)
+
+
+def mala(
+    initial_states,
+    n_iter,
+    stepsize,
+    data_meas,
+    logpost,
+    grad_logpost,
+    t0,
+    target=0.574,
+    events=None,
+):
+    """
+    Adaptive preconditioned Metropolis-adjusted Langevin algorithm (MALA). The
+    proposal from state :math:`x` is
+
+    .. math:: y = x + \\frac{h}{2} C \\nabla \\log \\pi(x) + \\sqrt{h} C^{1/2} z,
+              \\quad z \\sim N(0, I)
+
+    so it drifts toward higher posterior density using the analytic gradient
+    `grad_logpost`, instead of moving blindly as the random walk of
+    `adaptivemcmc` does. The preconditioner :math:`C` is the diagonal matrix of
+    the `stepsize` variances until iteration `t0`, and the running covariance
+    of the chain (Haario et al., 2001) afterwards. The step size :math:`h` is
+    adapted with a diminishing Robbins-Monro gain toward the `target`
+    acceptance rate (Roberts & Rosenthal, 1998;
+    https://doi.org/10.1111/1467-9868.00123).
+
+    All `m` chains (one per row of `initial_states`) are advanced together, so
+    `logpost` and `grad_logpost` must accept a batch of parameter sets (see
+    `gev_utils.batch_logpost` and `gev_utils.grad_logpost`).
+
+    Returns the chains, log-posterior scores and acceptance rates in the same
+    format as `runner`.
+
+    If an `events.EventStream` is passed as `events`, "progress" events of
+    each chain are emitted to it every `events.every` iterations (see
+    `events.PopulationProgress`).
+    """
+    np.seterr(over="ignore")
+    m, d = initial_states.shape
+    I_d = np.identity(d)
+    C0 = np.diag(np.asarray(stepsize, dtype=float))
+    C = np.repeat(C0[np.newaxis], m, axis=0)
+    C_inv = np.linalg.inv(C)
+    L = np.linalg.cholesky(C)
+    log_h = np.zeros(m)
+
+    state = np.array(initial_states, dtype=float)
+    value = logpost(state, data_meas)
+    grad = grad_logpost(state, data_meas)
+    mean, cov, count = np.array(state), np.zeros((m, d, d)), 1
+    parameters = np.empty((m, d, n_iter + 1))
+    lpost = np.empty((m, n_iter + 1))
+    parameters[:, :, 0] = state
+    lpost[:, 0] = value
+    n_accept = np.zeros(m)
+    progress = None
+    if events is not None:
+        progress = PopulationProgress(events, m, n_iter)
+    for t in range(n_iter):
+        h = np.exp(log_h)
+        z = np.random.normal(size=(m, d))
+        drift = (h / 2)[:, np.newaxis] * np.einsum("...ij,...j->...i", C, grad)
+        proposal = (
+            state
+            + drift
+            + np.sqrt(h)[:, np.newaxis] * np.einsum("...ij,...j->...i", L, z)
+        )
+        new_value = logpost(proposal, data_meas)
+        new_grad = grad_logpost(proposal, data_meas)
+        with np.errstate(invalid="ignore"):
+            log_alpha = (
+                new_value
+                - value
+                + log_transition(state, proposal, new_grad, h, C, C_inv)
+                - log_transition(proposal, state, grad, h, C, C_inv)
+            )
+            accept = np.log(np.random.uniform(size=m)) < log_alpha
+        state[accept] = proposal[accept]
+        value[accept] = new_value[accept]
+        grad[accept] = new_grad[accept]
+        n_accept += accept
+        # Adapt the step size toward the target acceptance rate
+        alpha = np.exp(np.minimum(np.nan_to_num(log_alpha, nan=-np.inf), 0))
+        log_h += (alpha - target) / (t + 1) ** 0.6
+        # Update the running moments, and the preconditioner after warm-up
+        count += 1
+        delta = state - mean
+        mean += delta / count
+        cov += (np.einsum("...i,...j->...ij", delta, state - mean) - cov) / count
+        if t >= t0:
+            C = cov + 0.0001 * I_d
+            C_inv = np.linalg.inv(C)
+            L = np.linalg.cholesky(C)
+        parameters[:, :, t + 1] = state
+        lpost[:, t + 1] = value
+        if progress is not None:
+            progress.update(t + 1, n_accept, value)
+    mcmc_chains = [parameters[i].tolist() for i in range(m)]
+    ls = [lpost[i].tolist() for i in range(m)]
+    ar = (n_accept / n_iter).tolist()
+    return mcmc_chains, ar, ls
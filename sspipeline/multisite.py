@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tell module what it's allowed to import
+__all__ = ["stack_sites", "multisite_runner"]
+
+import numpy as np
+
+from .events import PopulationProgress
+from .gev_utils import gev_logpdf
+
+
+def stack_sites(data_sites):
+    """
+    Stack the annual maxima of several gauges into a NaN-padded
+    (n_sites, max_years) array, along with the mask of the observed entries.
+    """
+    n_years = max(len(data) for data in data_sites)
+    stacked = np.full((len(data_sites), n_years), np.nan)
+    for i, data in enumerate(data_sites):
+        stacked[i, : len(data)] = data
+    return stacked, ~np.isnan(stacked)
+
+
+def multisite_logpost(parameters, stacked, mask, logprior):
+    """
+    Log-posterior of every (site, chain) parameter set in the
+    (n_sites, m, 3) array `parameters`, given the padded site data, in one
+    broadcast call.
+    """
+    pi = logprior(parameters)
+    logpdf = gev_logpdf(
+        stacked[:, np.newaxis, :],
+        parameters[..., 0:1],
+        parameters[..., 1:2],
+        parameters[..., 2:3],
+    )
+    LL = np.sum(np.where(mask[:, np.newaxis, :], logpdf, 0.0), axis=-1)
+    return np.where(pi == -np.inf, -np.inf, LL + pi)
+
+
+def multisite_runner(
+    data_sites, m, n_iter, logprior, t=1000, stepsize=[10, 2, 0.01], events=None
+):
+    """
+    Run `m` adaptive Metropolis-Hastings chains (as in `adaptivemcmc`) for each
+    of several gauges, advancing every chain of every site in lockstep. The
+    annual maxima in `data_sites` are stacked into a padded, masked array (see
+    `stack_sites`), so that each iteration evaluates the log-posteriors of all
+    sites and chains in one broadcast call, and proposes from all of their
+    covariances with one batched Cholesky factorization. This amortizes the
+    interpreter overhead of the small per-gauge arrays across the sites.
+
+    The proposals use the `stepsize` variances until iteration `t`, and the
+    running covariance of each chain (Haario et al., 2001) afterwards.
+    `logprior` must accept a batch of parameter sets (see
+    `gev_utils.batch_logprior`). If an `events.EventStream` is passed as
+    `events`, "progress" events of each chain (numbered site by site) are
+    emitted to it every `events.every` iterations (see
+    `events.PopulationProgress`).
+
+    Returns one `(mcmc_chains, ar, ls)` tuple per site, in the same format as
+    `runner`.
+    """
+    np.seterr(divide="ignore", invalid="ignore", over="ignore")
+    stacked, mask = stack_sites(data_sites)
+    S, d = len(data_sites), 3
+    I_d = np.identity(d)
+    S_d = (2.4) ** 2 / d
+    state = np.empty((S, m, d))
+    for i, data in enumerate(data_sites):
+        loc_est = np.median(data)
+        scale_est = (np.percentile(data, 75) - np.percentile(data, 25)) / 2
+        state[i, :, 0] = np.random.randint(low=loc_est, high=loc_est + 100, size=m)
+        state[i, :, 1] = np.random.randint(low=scale_est, high=scale_est + 100, size=m)
+        state[i, :, 2] = 0.01
+    value = multisite_logpost(state, stacked, mask, logprior)
+    mean, cov, count = np.array(state), np.zeros((S, m, d, d)), 1
+    scale = np.sqrt(np.asarray(stepsize, dtype=float))
+    parameters = np.empty((S, m, d, n_iter + 1))
+    lpost = np.empty((S, m, n_iter + 1))
+    parameters[..., 0] = state
+    lpost[..., 0] = value
+    n_accept = np.zeros((S, m))
+    progress = None
+    if events is not None:
+        progress = PopulationProgress(events, S * m, n_iter)
+    for it in range(n_iter):
+        if it <= t:
+            proposal = state + scale * np.random.normal(size=(S, m, d))
+        else:
+            L = np.linalg.cholesky(S_d * cov + S_d * 0.0001 * I_d)
+            z = np.random.normal(size=(S, m, d, 1))
+            proposal = state + np.matmul(L, z)[..., 0]
+        new_value = multisite_logpost(proposal, stacked, mask, logprior)
+        accept = np.log(np.random.uniform(size=(S, m))) < new_value - value
+        state[accept] = proposal[accept]
+        value[accept] = new_value[accept]
+        n_accept += accept
+        count += 1
+        delta = state - mean
+        mean += delta / count
+        cov += (np.einsum("...i,...j->...ij", delta, state - mean) - cov) / count
+        parameters[..., it + 1] = state
+        lpost[..., it + 1] = value
+        if progress is not None:
+            progress.update(it + 1, n_accept.ravel(), value.ravel())
+    results = []
+    for i in range(S):
+        results.append(
+            (
+                [parameters[i, j].tolist() for j in range(m)],
+                (n_accept[i] / n_iter).tolist(),
+                [lpost[i, j].tolist() for j in range(m)],
+            )
+        )
+    return results
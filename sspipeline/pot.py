@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tell module what it's allowed to import
+__all__ = [
+    "decluster",
+    "loglikelihood",
+    "logpost",
+    "batch_loglikelihood",
+    "batch_logpost",
+]
+
+import numpy as np
+
+from .gev_utils import PreparedData
+from .gev_utils import batch_logprior
+from .gev_utils import shard_sum
+
+
+def decluster(times, values, threshold, run_length):
+    """
+    Runs declustering of the exceedances of `threshold`: exceedances less than
+    `run_length` hours apart belong to the same cluster, and only the peak of
+    each cluster is kept. Every step is a single vectorized pass over the
+    record.
+
+    Parameters
+    ----------
+    times : :class:`numpy.ndarray`
+        increasing hours of the measurements
+    values : :class:`numpy.ndarray`
+        the measurements
+    threshold : float
+        the threshold that the peaks exceed
+    run_length : float
+        the shortest gap between clusters, in hours
+
+    Returns
+    -------
+    peaks : :class:`numpy.ndarray`
+        the peak of each cluster
+    peak_times : :class:`numpy.ndarray`
+        the hour of each peak
+    """
+    above = np.flatnonzero(values > threshold)
+    if len(above) == 0:
+        return np.empty(0), np.empty(0, dtype=np.asarray(times).dtype)
+    exceedances, hours = values[above], times[above]
+    # A cluster starts wherever the previous exceedance is a run length away
+    new = np.concatenate([[True], np.diff(hours) >= run_length])
+    starts = np.flatnonzero(new)
+    peaks = np.maximum.reduceat(exceedances, starts)
+    # The (first) largest exceedance of each cluster comes first in this order
+    cluster = np.cumsum(new)
+    first = np.lexsort((-exceedances, cluster))[starts]
+    return peaks, hours[first]
+
+
+def batch_loglikelihood(parameters, data, threshold, n_years):
+    """
+    Compute the Poisson-GPD (point process) log-likelihood of the declustered
+    peaks over `threshold` in `n_years` years of data, for many parameter sets
+    at once (with the peaks sharded over the threads of
+    `gev_utils.set_threads`, if there are enough of them). It is parameterized
+    by the GEV distribution of the annual maxima (Coles, 2001, section 7.5),
+    with the same parameterization as `gev_utils.loglikelihood`, so that the
+    priors, samplers and return levels of the annual maxima apply unchanged.
+
+    Parameters
+    ----------
+    parameters : :class:`numpy.ndarray`
+        array of shape (..., 3) holding the :math:`\\mu`, :math:`\\sigma`, and
+        :math:`\\xi` parameters of the GEV distribution of the annual maxima
+    data : :class:`gev_utils.PreparedData` or :class:`numpy.ndarray`
+        the declustered peaks
+    threshold : float
+        the threshold of the peaks
+    n_years : float
+        number of years of data the peaks were taken from
+
+    Returns
+    -------
+    log_likelihood : :class:`numpy.ndarray`
+        array of shape (...)
+    """
+    parameters = np.asarray(parameters, dtype=float)
+    values = np.asarray(data, dtype=float)
+    flat = parameters.reshape(-1, 3)
+    mu, sigma, shape = flat[:, 0:1], flat[:, 1:2], flat[:, 2:3]
+    LL = np.full(len(flat), -np.inf)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        # Only evaluate the parameter sets with the threshold and all of the
+        # peaks inside the support
+        if isinstance(data, PreparedData):
+            edges = np.array([threshold, data.min, data.max])
+        else:
+            edges = np.array([threshold, np.min(values), np.max(values)])
+        supported = (sigma[:, 0] > 0) & np.all(
+            1 + shape * (edges - mu) / sigma > 0, axis=1
+        )
+        mu, sigma, shape = mu[supported], sigma[supported], shape[supported]
+        gumbel = np.abs(shape) < 1e-10
+        safe_shape = np.where(gumbel, 1.0, shape)
+        z_u = (threshold - mu[:, 0]) / sigma[:, 0]
+        y_u = np.where(
+            gumbel[:, 0], z_u, np.log1p(safe_shape[:, 0] * z_u) / safe_shape[:, 0]
+        )
+        LL[supported] = (
+            shard_sum(pp_sum, values, len(mu), mu, sigma, shape)
+            - len(values) * np.log(sigma[:, 0])
+            - n_years * np.exp(-y_u)
+        )
+    return LL.reshape(parameters.shape[:-1])
+
+
+def pp_sum(values, mu, sigma, shape):
+    """
+    Helper function to `batch_loglikelihood`, which sums the terms of the
+    peaks `values` for each parameter set (less their log-scales)
+    """
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        gumbel = np.abs(shape) < 1e-10
+        safe_shape = np.where(gumbel, 1.0, shape)
+        # log(1 + shape * z) / shape, which tends to z as the shape tends to 0
+        z = (values - mu) / sigma
+        y = np.where(gumbel, z, np.log1p(safe_shape * z) / safe_shape)
+        return np.sum(-(1 + shape) * y, axis=1)
+
+
+def loglikelihood(parameters, data, threshold, n_years):
+    """
+    Compute the Poisson-GPD log-likelihood of one parameter set (see
+    `batch_loglikelihood`)
+
+    Parameters
+    ----------
+    parameters : list
+        the :math:`\\mu`, :math:`\\sigma`, and :math:`\\xi` parameters
+    data : :class:`gev_utils.PreparedData` or :class:`numpy.ndarray`
+        the declustered peaks
+    threshold : float
+        the threshold of the peaks
+    n_years : float
+        number of years of data the peaks were taken from
+
+    Returns
+    -------
+    log_likelihood : float
+    """
+    return float(batch_loglikelihood(parameters, data, threshold, n_years))
+
+
+def logpost(parameters, data, threshold, n_years, prior=None):
+    """
+    Compute the log-posterior (log-prior + Poisson-GPD log-likelihood) of one
+    parameter set, with the priors of `gev_utils.logprior`
+
+    Parameters
+    ----------
+    parameters : list
+        the :math:`\\mu`, :math:`\\sigma`, and :math:`\\xi` parameters
+    data : :class:`gev_utils.PreparedData` or :class:`numpy.ndarray`
+        the declustered peaks
+    threshold : float
+        the threshold of the peaks
+    n_years : float
+        number of years of data the peaks were taken from
+    prior : :class:`priors.GEVPrior`
+        the compiled priors
+
+    Returns
+    -------
+    log_post : float
+    """
+    lp = float(batch_logprior(parameters, prior))
+    if lp == -np.inf:
+        return lp
+    return lp + loglikelihood(parameters, data, threshold, n_years)
+
+
+def batch_logpost(parameters, data, threshold, n_years, prior=None):
+    """
+    Compute the log-posterior of many parameter sets at once (see `logpost`)
+
+    Parameters
+    ----------
+    parameters : :class:`numpy.ndarray`
+        array of shape (..., 3) holding the :math:`\\mu`, :math:`\\sigma`, and
+        :math:`\\xi` parameters
+    data : :class:`gev_utils.PreparedData` or :class:`numpy.ndarray`
+        the declustered peaks
+    threshold : float
+        the threshold of the peaks
+    n_years : float
+        number of years of data the peaks were taken from
+    prior : :class:`priors.GEVPrior`
+        the compiled priors
+
+    Returns
+    -------
+    log_post : :class:`numpy.ndarray`
+        array of shape (...)
+    """
+    parameters = np.asarray(parameters, dtype=float)
+    pi = batch_logprior(parameters, prior)
+    # Only evaluate the likelihood of the parameter sets the prior allows
+    allowed = pi > -np.inf
+    lp = np.full(pi.shape, -np.inf)
+    lp[allowed] = pi[allowed] + batch_loglikelihood(
+        parameters[allowed], data, threshold, n_years
+    )
+    return lp
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tell module what it's allowed to import
+__all__ = ["PRIORS", "DEFAULT_PRIORS", "GEVPrior", "compile_prior"]
+
+import math
+
+import numpy as np
+
+# Priors used when the config file does not specify them
+DEFAULT_PRIORS = {
+    "mu": {"type": "uniform", "lower": 0, "upper": 10000},
+    "sigma": {"type": "uniform", "lower": 0, "upper": 10000},
+    "xi": {"type": "normal", "loc": 0, "scale": 1000},
+}
+
+
+class Uniform(object):
+    """
+    Uniform prior on [`lower`, `upper`]
+    """
+
+    code = 0
+
+    def __init__(self, lower, upper):
+        self.lower, self.upper = float(lower), float(upper)
+        self.const = -math.log(self.upper - self.lower)
+
+    def logpdf(self, x):
+        inside = (x >= self.lower) & (x <= self.upper)
+        return np.where(inside, self.const, -np.inf)
+
+    def grad(self, x):
+        return np.zeros_like(x)
+
+    def row(self):
+        return [self.code, self.lower, self.upper, self.const]
+
+
+class Normal(object):
+    """
+    Normal prior with mean `loc` and standard deviation `scale`
+    """
+
+    code = 1
+
+    def __init__(self, loc, scale):
+        self.loc, self.inv_scale = float(loc), 1 / float(scale)
+        self.const = -math.log(scale) - 0.5 * math.log(2 * math.pi)
+
+    def logpdf(self, x):
+        return self.const - 0.5 * ((x - self.loc) * self.inv_scale) ** 2
+
+    def grad(self, x):
+        return -(x - self.loc) * self.inv_scale ** 2
+
+    def row(self):
+        return [self.code, self.loc, self.inv_scale, self.const]
+
+
+class HalfCauchy(object):
+    """
+    Half-Cauchy prior on [`loc`, inf) with scale `scale`
+    """
+
+    code = 2
+
+    def __init__(self, scale, loc=0):
+        self.loc, self.inv_scale = float(loc), 1 / float(scale)
+        self.const = math.log(2 / (math.pi * scale))
+
+    def logpdf(self, x):
+        with np.errstate(invalid="ignore"):
+            logpdf = self.const - np.log1p(((x - self.loc) * self.inv_scale) ** 2)
+        return np.where(x >= self.loc, logpdf, -np.inf)
+
+    def grad(self, x):
+        z = (x - self.loc) * self.inv_scale
+        return -2 * z * self.inv_scale / (1 + z ** 2)
+
+    def row(self):
+        return [self.code, self.loc, self.inv_scale, self.const]
+
+
+class LogNormal(object):
+    """
+    Log-normal prior, such that the log of the parameter has mean `loc` and
+    standard deviation `scale`
+    """
+
+    code = 3
+
+    def __init__(self, loc, scale):
+        self.loc, self.inv_scale = float(loc), 1 / float(scale)
+        self.const = -math.log(scale) - 0.5 * math.log(2 * math.pi)
+
+    def logpdf(self, x):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            logx = np.log(x)
+            logpdf = self.const - logx - 0.5 * ((logx - self.loc) * self.inv_scale) ** 2
+        return np.where(x > 0, logpdf, -np.inf)
+
+    def grad(self, x):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = (np.log(x) - self.loc) * self.inv_scale
+            grad = -(1 + z * self.inv_scale) / x
+        return np.where(x > 0, grad, 0.0)
+
+    def row(self):
+        return [self.code, self.loc, self.inv_scale, self.const]
+
+
+# Registry of the prior types that can be named in the config file
+PRIORS = {
+    "uniform": Uniform,
+    "normal": Normal,
+    "halfcauchy": HalfCauchy,
+    "lognormal": LogNormal,
+}
+
+
+class GEVPrior(object):
+    """
+    Joint prior on the :math:`\\mu`, :math:`\\sigma` and :math:`\\xi`
+    parameters of a GEV distribution, as independent priors whose constants are
+    computed once. Calling it evaluates the log-prior of one parameter set, or
+    of an array of shape (..., 3) of them, with vectorized support checks. It
+    holds no closures, so it can be pickled and sent to worker processes.
+    """
+
+    def __init__(self, components):
+        self.components = components
+        # One row of (code, constants) per parameter, for the compiled kernels
+        self.table = np.array([c.row() for c in components], dtype=float)
+
+    def __call__(self, parameters):
+        parameters = np.asarray(parameters, dtype=float)
+        mu, sigma, xi = self.components
+        return (
+            mu.logpdf(parameters[..., 0])
+            + sigma.logpdf(parameters[..., 1])
+            + xi.logpdf(parameters[..., 2])
+        )
+
+    def grad(self, parameters):
+        parameters = np.asarray(parameters, dtype=float)
+        return np.stack(
+            [c.grad(parameters[..., i]) for i, c in enumerate(self.components)],
+            axis=-1,
+        )
+
+
+def compile_prior(spec=None):
+    """
+    Compile the declarative prior `spec` from the config file into a
+    `GEVPrior`. `spec` maps any of "mu", "sigma" and "xi" to a dictionary with
+    the prior "type" (a key of `PRIORS`) and its parameters, such as
+    ``{"xi": {"type": "normal", "loc": 0.1, "scale": 0.1}}`` for an informative
+    regional prior on the shape. Parameters left out keep the priors in
+    `DEFAULT_PRIORS`.
+    """
+    spec = spec or {}
+    for name in spec:
+        if name not in DEFAULT_PRIORS:
+            raise ValueError(
+                "Priors can only be set for: " + ", ".join(sorted(DEFAULT_PRIORS))
+            )
+    components = []
+    for name in ["mu", "sigma", "xi"]:
+        options = dict(spec.get(name, DEFAULT_PRIORS[name]))
+        kind = options.pop("type", None)
+        if kind not in PRIORS:
+            raise ValueError(
+                "The prior type for '"
+                + name
+                + "' must be one of: "
+                + ", ".join(sorted(PRIORS))
+            )
+        try:
+            components.append(PRIORS[kind](**options))
+        except TypeError:
+            raise TypeError(
+                "Invalid parameters " + str(options) + " for the " + kind + " prior"
+            )
+    return GEVPrior(components)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tell module what it's allowed to import
+__all__ = ["Profiler", "stage"]
+
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+
+def peak_rss():
+    """
+    Peak resident set size of this process so far, in MB (None if it cannot be
+    measured on this platform).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, and in kB elsewhere
+    if sys.platform == "darwin":
+        return peak / 1024 ** 2
+    return peak / 1024
+
+
+class Profiler(object):
+    """
+    Records the wall time, CPU time, peak RSS and item count of every stage of
+    a pipeline run, along with the sampling rates of each Markov chain. With
+    `cprofile_dir` set, each stage is also run under cProfile, and its
+    statistics are dumped to `<cprofile_dir>/<stage>.prof`. If a `listener` is
+    given, it is called with "stage" or "chain" and the record of each stage
+    or chain as soon as it is recorded.
+    """
+
+    def __init__(self, cprofile_dir=None, listener=None):
+        self.cprofile_dir = cprofile_dir
+        self.listener = listener
+        self.stages, self.chains = [], []
+
+    @contextlib.contextmanager
+    def stage(self, name, count=None):
+        """
+        Context manager timing the stage `name`, which processes `count` items.
+        It yields the record of the stage, so that the count can be filled in
+        once it is known.
+        """
+        record = {"stage": name, "count": count}
+        profile = None
+        if self.cprofile_dir is not None:
+            profile = cProfile.Profile()
+            profile.enable()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall"] = time.perf_counter() - wall
+            record["cpu"] = time.process_time() - cpu
+            if profile is not None:
+                profile.disable()
+                if not os.path.isdir(self.cprofile_dir):
+                    os.makedirs(self.cprofile_dir)
+                profile.dump_stats(
+                    os.path.join(self.cprofile_dir, name.replace(" ", "_") + ".prof")
+                )
+            record["peak_rss_mb"] = peak_rss()
+            self.stages.append(record)
+            if self.listener is not None:
+                self.listener("stage", record)
+
+    def chain(self, name, n_iter, n_evals, wall):
+        """
+        Record the iterations and log-likelihood evaluations per second of the
+        chain `name`, which took `wall` seconds.
+        """
+        record = {
+            "chain": name,
+            "iterations": n_iter,
+            "likelihood_evaluations": n_evals,
+            "wall": wall,
+            "iterations_per_sec": n_iter / wall if wall > 0 else None,
+            "evaluations_per_sec": n_evals / wall if wall > 0 else None,
+        }
+        self.chains.append(record)
+        if self.listener is not None:
+            self.listener("chain", record)
+
+    def write(self, output_dir):
+        """
+        Write the measurements to profile.json in `output_dir`.
+        """
+        with open(output_dir + "/profile.json", "w") as f:
+            json.dump({"stages": self.stages, "chains": self.chains}, f, indent=2)
+
+    def table(self):
+        """
+        The measurements as lines of a summary table, for the log.
+        """
+        lines = [
+            "{:<32} {:>10} {:>10} {:>14} {:>10}".format(
+                "stage", "wall [s]", "cpu [s]", "peak RSS [MB]", "count"
+            )
+        ]
+        for s in self.stages:
+            lines.append(
+                "{:<32} {:>10.3f} {:>10.3f} {:>14} {:>10}".format(
+                    s["stage"],
+                    s["wall"],
+                    s["cpu"],
+                    "-" if s["peak_rss_mb"] is None else round(s["peak_rss_mb"], 1),
+                    "-" if s["count"] is None else s["count"],
+                )
+            )
+        for c in self.chains:
+            lines.append(
+                "{:<32} {:>10.1f} iterations/s {:>10.1f} evaluations/s".format(
+                    c["chain"],
+                    c["iterations_per_sec"] or 0,
+                    c["evaluations_per_sec"] or 0,
+                )
+            )
+        return lines
+
+
+@contextlib.contextmanager
+def unprofiled():
+    yield {}
+
+
+def stage(profiler, name, count=None):
+    """
+    `profiler.stage(name, count)`, or a context manager that does nothing if
+    `profiler` is None.
+    """
+    if profiler is None:
+        return unprofiled()
+    return profiler.stage(name, count)
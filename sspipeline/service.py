@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tell module what it's allowed to import
+__all__ = ["Scheduler", "serve_forever"]
+
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+import time
+import socketserver
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+
+from .utils import check_params
+
+# Peak memory [MB] of a worker running a small job, measured with profile.json
+WORKER_MB = 300
+# Memory [MB] of each stored parameter value: a Python float in the chains,
+# and its copies in the arrays of the diagnostics and the parameter pool
+VALUE_MB = 64 / 1024 ** 2
+
+# Queue of the events of the jobs, in each worker process
+EVENTS = None
+
+
+def estimate_memory(config_data):
+    """
+    Rough estimate of the peak memory [MB] of the job with the (checked)
+    `config_data`, unless it is given as "memory_mb" in the job
+    """
+    if "memory_mb" in config_data:
+        return float(config_data["memory_mb"])
+    sites = len(config_data["data"]) if isinstance(config_data["data"], list) else 1
+    if config_data["mode"] == "mcmc":
+        states = config_data["sequences"] * (config_data["iterations"] + 1)
+        if config_data["engine"] == "tempering":
+            states *= 2
+    else:
+        states = config_data["samples"]
+    # Three parameters and the log-posterior of each state
+    return WORKER_MB + sites * 4 * states * VALUE_MB
+
+
+def warm_up(events):
+    """
+    Initializer of the worker processes, which imports everything the jobs
+    use and compiles the Numba kernels up front
+    """
+    global EVENTS
+    EVENTS = events
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from . import cli  # noqa: F401
+    from .core import adaptivemcmc
+    from .kernels import HAVE_NUMBA
+    from .priors import compile_prior
+
+    if HAVE_NUMBA:
+        # Compiles the kernels for the default priors
+        adaptivemcmc(
+            [1000, 100, 0.1],
+            10,
+            [10, 2, 0.01],
+            [900, 1000, 1100],
+            None,
+            5,
+            "numba",
+            prior=compile_prior(),
+        )
+
+
+def run_job(job_id, config_data):
+    """
+    Run the pipeline for the job `job_id` in a worker process, sending its
+    status, the timings of its stages and chains, and its `events.EventStream`
+    back as events
+    """
+    import matplotlib.pyplot as plt
+
+    from .cli import run_pipeline
+
+    output_dir = config_data.get("output_dir", "output")
+    for subdir in ["plots", "parameters"]:
+        if not os.path.isdir(os.path.join(output_dir, subdir)):
+            os.makedirs(os.path.join(output_dir, subdir))
+
+    def listener(kind, record):
+        EVENTS.put((job_id, kind, record))
+
+    def observer(event):
+        EVENTS.put((job_id, event["event"], event))
+
+    EVENTS.put((job_id, "status", {"status": "running", "pid": os.getpid()}))
+    try:
+        profiler = run_pipeline(config_data, "job " + job_id, listener, [observer])
+    finally:
+        # The figures would otherwise pile up in the long-running worker
+        plt.close("all")
+    return {"stages": profiler.stages, "chains": profiler.chains}
+
+
+class Scheduler(object):
+    """
+    Runs the jobs submitted to the service on a pool of `workers` warm worker
+    processes, first in, first out, starting a job only when fewer than
+    `workers` jobs are running and the estimated memory of the running jobs
+    stays within the `memory_budget` [MB]. The events of each job (status
+    changes, and the timings of its stages and chains) are collected as they
+    happen.
+    """
+
+    def __init__(self, workers, memory_budget):
+        self.workers, self.memory_budget = workers, memory_budget
+        self.events = multiprocessing.Queue()
+        self.pool = ProcessPoolExecutor(
+            workers, initializer=warm_up, initargs=(self.events,)
+        )
+        # Start and warm up every worker now, rather than on the first jobs
+        for i in range(workers):
+            self.pool.submit(os.getpid)
+        self.jobs, self.pending = {}, []
+        self.running, self.memory = 0, 0.0
+        self.ids = itertools.count(1)
+        self.condition = threading.Condition()
+        threading.Thread(target=self.listen, daemon=True).start()
+
+    def submit(self, config_data):
+        """
+        Queue a job with the parameters `config_data`, returning its summary.
+        Raises ValueError if the job could never fit in the memory budget.
+        """
+        memory = estimate_memory(check_params(dict(config_data)))
+        if memory > self.memory_budget:
+            raise ValueError(
+                "The job's estimated memory of {0} MB exceeds the memory budget of "
+                "{1} MB".format(round(memory), self.memory_budget)
+            )
+        with self.condition:
+            job_id = str(next(self.ids))
+            self.jobs[job_id] = {
+                "id": job_id,
+                "status": "queued",
+                "config": config_data,
+                "memory_mb": memory,
+                "submitted": time.time(),
+                "events": [],
+            }
+            self.pending.append(job_id)
+            self.add_event(job_id, "status", {"status": "queued"})
+            self.schedule()
+            return self.summary(job_id)
+
+    def schedule(self):
+        """
+        Start the queued jobs that fit, in order (called with the lock held)
+        """
+        while self.pending and self.running < self.workers:
+            job = self.jobs[self.pending[0]]
+            if self.memory + job["memory_mb"] > self.memory_budget:
+                break
+            self.pending.pop(0)
+            self.running += 1
+            self.memory += job["memory_mb"]
+            job["started"] = time.time()
+            future = self.pool.submit(run_job, job["id"], job["config"])
+            future.add_done_callback(
+                lambda future, job_id=job["id"]: self.finished(job_id, future)
+            )
+
+    def finished(self, job_id, future):
+        with self.condition:
+            job = self.jobs[job_id]
+            job["finished"] = time.time()
+            self.running -= 1
+            self.memory -= job["memory_mb"]
+            error = future.exception()
+            if error is None:
+                job["status"] = "done"
+                job["profile"] = future.result()
+                self.add_event(job_id, "status", {"status": "done"})
+            else:
+                job["status"] = "failed"
+                job["error"] = "".join(
+                    traceback.format_exception_only(type(error), error)
+                ).strip()
+                self.add_event(
+                    job_id, "status", {"status": "failed", "error": job["error"]}
+                )
+            self.schedule()
+
+    def listen(self):
+        """
+        Collect the events sent by the workers
+        """
+        while True:
+            job_id, kind, record = self.events.get()
+            with self.condition:
+                # The job may already have finished by the time it is running
+                if kind == "status" and self.jobs[job_id]["status"] == "queued":
+                    self.jobs[job_id]["status"] = record["status"]
+                self.add_event(job_id, kind, record)
+
+    def add_event(self, job_id, kind, record):
+        """
+        Record an event of a job, and wake up its streams (called with the lock
+        held)
+        """
+        self.jobs[job_id]["events"].append(
+            {"time": time.time(), "event": kind, "record": record}
+        )
+        self.condition.notify_all()
+
+    def summary(self, job_id):
+        job = self.jobs[job_id]
+        return {
+            key: job[key]
+            for key in ["id", "status", "memory_mb", "submitted", "error"]
+            if key in job
+        }
+
+    def stream(self, job_id, timeout=1):
+        """
+        Generate the events of a job as they happen, until it finishes
+        """
+        n = 0
+        while True:
+            with self.condition:
+                job = self.jobs[job_id]
+                while len(job["events"]) == n and job["status"] not in [
+                    "done",
+                    "failed",
+                ]:
+                    self.condition.wait(timeout)
+                events = job["events"][n:]
+                finished = job["status"] in ["done", "failed"]
+            for event in events:
+                yield event
+            n += len(events)
+            if finished and not events:
+                return
+
+    def status(self):
+        with self.condition:
+            return {
+                "workers": self.workers,
+                "running": self.running,
+                "queued": len(self.pending),
+                "memory_mb": self.memory,
+                "memory_budget_mb": self.memory_budget,
+            }
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    HTTP server handling each request in its own thread (as
+    `http.server.ThreadingHTTPServer` does, which needs Python 3.7)
+    """
+
+    daemon_threads = True
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    HTTP interface of the service:
+
+    - POST /jobs with a configuration (as in config.json) queues a job
+    - GET /jobs lists the jobs, and GET /jobs/<id> gives a job's status and
+      events so far
+    - GET /jobs/<id>/events streams a job's events as JSON lines until it
+      finishes
+    - GET /status gives the workers, running and queued jobs and memory in use
+    """
+
+    def reply(self, code, body):
+        data = (json.dumps(body) + "\n").encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            return self.reply(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            config_data = json.loads(self.rfile.read(length))
+            if not isinstance(config_data, dict):
+                raise ValueError("The job must be a configuration dictionary")
+            job = self.server.scheduler.submit(config_data)
+        except (TypeError, ValueError) as error:
+            return self.reply(400, {"error": str(error)})
+        self.reply(202, job)
+
+    def do_GET(self):
+        scheduler = self.server.scheduler
+        parts = [part for part in self.path.split("/") if part]
+        if parts == ["status"]:
+            return self.reply(200, scheduler.status())
+        if parts == ["jobs"]:
+            with scheduler.condition:
+                return self.reply(200, [scheduler.summary(i) for i in scheduler.jobs])
+        if len(parts) < 2 or parts[0] != "jobs" or parts[1] not in scheduler.jobs:
+            return self.reply(404, {"error": "not found"})
+        if len(parts) == 2:
+            with scheduler.condition:
+                job = dict(scheduler.summary(parts[1]))
+                job["events"] = list(scheduler.jobs[parts[1]]["events"])
+            return self.reply(200, job)
+        if parts[2:] != ["events"]:
+            return self.reply(404, {"error": "not found"})
+        # Stream the events until the job finishes, then close the connection
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for event in scheduler.stream(parts[1]):
+            self.wfile.write((json.dumps(event) + "\n").encode())
+            self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_forever(host="127.0.0.1", port=8765, workers=1, memory_budget=4096):
+    """
+    Serve the pipeline on http://`host`:`port` (see `Handler`), running the
+    jobs with a `Scheduler` until interrupted
+    """
+    scheduler = Scheduler(workers, memory_budget)
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.scheduler = scheduler
+    print(
+        "INFO : serving on http://{0}:{1} with {2} workers and a memory budget of "
+        "{3} MB".format(host, port, workers, memory_budget)
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        scheduler.shutdown()
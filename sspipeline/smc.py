@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tell module what it's allowed to import
+__all__ = ["smc", "read_pool"]
+
+import multiprocessing
+
+import numpy as np
+
+from .laplace import find_mode
+from .laplace import hessian
+
+
+def read_pool(output_dir):
+    """
+    Read the parameter pool saved by `output_parameters` in a previous run,
+    as an (n, 3) array.
+    """
+    return np.transpose(
+        [
+            np.loadtxt(output_dir + "/parameters/parameter-" + str(i + 1) + ".txt")
+            for i in range(3)
+        ]
+    )
+
+
+def target_terms(particles, target):
+    """
+    Split the log-density of the tempered SMC target into the `base` and the
+    `incr` terms, so that the target at inverse temperature :math:`\\beta` is
+    `base + beta * incr`.
+
+    When warm-starting from a previous posterior pool, the base is the
+    posterior given the old observations and the increment is the
+    log-likelihood of the new observations. When starting cold, the base is the
+    Gaussian reference distribution and the increment brings in the full
+    posterior.
+    """
+    loglikelihood, logprior = target["loglikelihood"], target["logprior"]
+    if target["mean"] is None:
+        base = logprior(particles) + loglikelihood(particles, target["old"])
+        incr = loglikelihood(particles, target["new"])
+    else:
+        diff = particles - target["mean"]
+        base = -0.5 * np.sum(np.matmul(diff, target["precision"]) * diff, axis=-1)
+        post = logprior(particles) + loglikelihood(
+            particles, np.concatenate([target["old"], target["new"]])
+        )
+        incr = post - base
+    with np.errstate(invalid="ignore"):
+        incr = np.where(np.isnan(incr), -np.inf, incr)
+    return base, incr
+
+
+def rejuvenate(args):
+    """
+    MCMC rejuvenation moves for a chunk of particles: `n_moves` Gaussian random
+    walk Metropolis-Hastings steps with covariance `cov`, all targeting the
+    tempered SMC target at inverse temperature `beta`. Every step is a single
+    vectorized update of the whole chunk. Also used as the process pool helper
+    for `smc`.
+    """
+    particles, base, incr, beta, cov, target, n_moves, seed = args
+    rng = np.random.RandomState(seed)
+    L = np.linalg.cholesky(cov)
+    for k in range(n_moves):
+        proposal = particles + np.matmul(rng.normal(size=particles.shape), L.T)
+        new_base, new_incr = target_terms(proposal, target)
+        with np.errstate(invalid="ignore"):
+            accept = np.log(rng.uniform(size=len(particles))) < (
+                new_base + beta * new_incr - base - beta * incr
+            )
+        particles[accept] = proposal[accept]
+        base[accept] = new_base[accept]
+        incr[accept] = new_incr[accept]
+    return particles, base, incr
+
+
+def next_beta(incr, beta, ess_target):
+    """
+    Bisection for the next inverse temperature, such that the relative
+    effective sample size of the incremental weights is `ess_target`.
+    """
+
+    def ess(new_beta):
+        with np.errstate(invalid="ignore"):
+            logw = (new_beta - beta) * incr
+        logw = np.where(np.isnan(logw), -np.inf, logw)
+        w = np.exp(logw - np.max(logw))
+        return np.sum(w) ** 2 / (len(w) * np.sum(w ** 2))
+
+    if ess(1.0) >= ess_target:
+        return 1.0
+    lo, hi = beta, 1.0
+    for i in range(50):
+        mid = (lo + hi) / 2
+        if ess(mid) >= ess_target:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+def smc(
+    data_meas,
+    loglikelihood,
+    logprior,
+    n_particles=10000,
+    previous_pool=None,
+    n_new=1,
+    processes=1,
+    n_moves=10,
+    ess_target=0.5,
+):
+    """
+    Sequential Monte Carlo sampler with adaptive likelihood tempering. The
+    `n_particles` particles are reweighted, resampled (systematic resampling)
+    and rejuvenated with MCMC moves as the inverse temperature rises from 0 to
+    1, with each step chosen by bisection so that the effective sample size
+    falls to `ess_target` of the particles (Jasra et al., 2011;
+    https://doi.org/10.1111/j.1467-9469.2010.00723.x).
+
+    If `previous_pool` (an (n, 3) array of posterior draws from an earlier run,
+    see `read_pool`) is given, only the last `n_new` observations of
+    `data_meas` are treated as new and brought in by the tempering, so a new
+    year of data is absorbed without a cold restart. Otherwise the particles
+    start from a widened Gaussian approximation to the posterior about its
+    mode, which is then tempered into the posterior.
+
+    The rejuvenation moves are independent across particles, so with
+    `processes` > 1 they are split across a process pool. `loglikelihood` and
+    `logprior` must accept a batch of parameter sets (see
+    `gev_utils.batch_loglikelihood` and `gev_utils.batch_logprior`), and must
+    be picklable when `processes` > 1.
+
+    Returns the particles in the same shape as a single `adaptivemcmc` chain
+    (so that `final_params_pool` can be used with no burn-in and a lag of 1),
+    the particle with the highest log-posterior score, and the number of
+    tempering steps.
+    """
+    np.seterr(divide="ignore", invalid="ignore", over="ignore")
+    data = np.asarray(data_meas, dtype=float)
+    target = {"loglikelihood": loglikelihood, "logprior": logprior, "mean": None}
+    if previous_pool is not None:
+        target["old"] = data[: len(data) - n_new]
+        target["new"] = data[len(data) - n_new :]
+        previous_pool = np.asarray(previous_pool, dtype=float)
+        index = np.random.randint(len(previous_pool), size=n_particles)
+        particles = previous_pool[index]
+    else:
+        target["old"], target["new"] = data, data[:0]
+
+        def lp(theta, data_meas):
+            return float(logprior(theta) + loglikelihood(theta, data_meas))
+
+        mode, _ = find_mode(data, lp)
+        h = 1e-4 * np.maximum(np.abs(mode), 1)
+        H = hessian(lambda theta: lp(theta, data), mode, h)
+        evals, evecs = np.linalg.eigh(-H)
+        # Widen the Gaussian approximation so that it covers the posterior
+        cov = 4 * np.matmul(evecs / np.abs(evals), np.transpose(evecs))
+        target["mean"], target["precision"] = mode, np.linalg.inv(cov)
+        particles = np.random.multivariate_normal(mode, cov, size=n_particles)
+    base, incr = target_terms(particles, target)
+
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    beta, n_steps = 0.0, 0
+    d = particles.shape[1]
+    try:
+        while beta < 1:
+            new_beta = next_beta(incr, beta, ess_target)
+            with np.errstate(invalid="ignore"):
+                logw = (new_beta - beta) * incr
+            logw = np.where(np.isnan(logw), -np.inf, logw)
+            w = np.exp(logw - np.max(logw))
+            w /= np.sum(w)
+            beta, n_steps = new_beta, n_steps + 1
+            # Systematic resampling
+            positions = (np.random.uniform() + np.arange(n_particles)) / n_particles
+            index = np.searchsorted(np.cumsum(w), positions)
+            index = np.minimum(index, n_particles - 1)
+            particles, base, incr = particles[index], base[index], incr[index]
+            # Rejuvenate with random walk moves scaled to the particle cloud
+            cov = (2.38 ** 2 / d) * np.cov(np.transpose(particles))
+            cov += 1e-8 * np.diag(np.diag(cov)) + 1e-12 * np.identity(d)
+            chunks = np.array_split(np.arange(n_particles), processes)
+            seeds = np.random.randint(2 ** 31 - 1, size=len(chunks))
+            jobs = [
+                (particles[c], base[c], incr[c], beta, cov, target, n_moves, seeds[i])
+                for i, c in enumerate(chunks)
+            ]
+            if pool is not None:
+                results = pool.map(rejuvenate, jobs)
+            else:
+                results = [rejuvenate(job) for job in jobs]
+            particles = np.concatenate([result[0] for result in results])
+            base = np.concatenate([result[1] for result in results])
+            incr = np.concatenate([result[2] for result in results])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    lpost = logprior(particles) + loglikelihood(particles, data)
+    max_params = list(particles[np.argmax(lpost)])
+    return [np.transpose(particles).tolist()], max_params, n_steps
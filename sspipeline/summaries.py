@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tell module what it's allowed to import
+__all__ = ["OnlineSummary", "combine_summaries"]
+
+import numpy as np
+
+from .kernels import HAVE_NUMBA
+
+if HAVE_NUMBA:
+    import numba
+
+
+def p2_block(heights, positions, desired, increments, values):
+    """
+    Feed the rows of `values` (shape (n, d)) into the P-square quantile
+    estimators of Jain & Chlamtac (1985; https://doi.org/10.1145/4372.4378),
+    one set of five markers per parameter and per quantile. The marker
+    `heights`, `positions` and `desired` positions (all of shape (d, k, 5))
+    are updated in place, and `increments` (shape (k, 5)) holds the increments
+    of the desired positions for each of the k quantiles.
+    """
+    n, d = values.shape
+    k = increments.shape[0]
+    for r in range(n):
+        for j in range(d):
+            x = values[r, j]
+            for l in range(k):
+                q, pos, des = heights[j, l], positions[j, l], desired[j, l]
+                # Find the cell of x, extending the extreme markers if needed
+                if x < q[0]:
+                    q[0] = x
+                    c = 0
+                elif x >= q[4]:
+                    q[4] = x
+                    c = 3
+                else:
+                    c = 0
+                    while x >= q[c + 1]:
+                        c += 1
+                for i in range(c + 1, 5):
+                    pos[i] += 1
+                for i in range(5):
+                    des[i] += increments[l, i]
+                # Adjust the middle markers with the piecewise-parabolic formula
+                for i in range(1, 4):
+                    delta = des[i] - pos[i]
+                    if (delta >= 1 and pos[i + 1] - pos[i] > 1) or (
+                        delta <= -1 and pos[i - 1] - pos[i] < -1
+                    ):
+                        s = 1 if delta > 0 else -1
+                        parabolic = q[i] + s / (pos[i + 1] - pos[i - 1]) * (
+                            (pos[i] - pos[i - 1] + s)
+                            * (q[i + 1] - q[i])
+                            / (pos[i + 1] - pos[i])
+                            + (pos[i + 1] - pos[i] - s)
+                            * (q[i] - q[i - 1])
+                            / (pos[i] - pos[i - 1])
+                        )
+                        if q[i - 1] < parabolic < q[i + 1]:
+                            q[i] = parabolic
+                        else:
+                            q[i] += s * (q[i + s] - q[i]) / (pos[i + s] - pos[i])
+                        pos[i] += s
+
+
+if HAVE_NUMBA:
+    p2_block = numba.njit(cache=True)(p2_block)
+
+
+class OnlineSummary(object):
+    """
+    Streaming summaries of one Markov chain, updated a block of iterations at a
+    time as it is sampled, so that the MAP parameters and posterior summaries
+    are available without retaining or re-scanning the chain:
+
+    - the maximum log-posterior score so far, and its parameters
+    - the running mean and variance of each parameter (Welford's algorithm,
+      merged a block at a time)
+    - P-square estimates of the `quantiles` of each parameter
+    - the acceptance rate over the last `window` iterations
+
+    The posterior moments and quantiles only use the iterations after `start`
+    (the end of the adaptation period), while the MAP uses every iteration.
+    """
+
+    def __init__(self, d, start=0, quantiles=(0.025, 0.5, 0.975), window=1000):
+        self.d, self.start, self.window = d, start, window
+        self.quantiles = list(quantiles)
+        self.max_value, self.max_params = -np.inf, None
+        self.count, self.mean, self.M2 = 0, np.zeros(d), np.zeros(d)
+        self.first = np.empty((0, d))
+        self.recent = np.empty(0, dtype=bool)
+        p = np.array(self.quantiles)[:, np.newaxis]
+        self.increments = np.hstack([0 * p, p / 2, p, (1 + p) / 2, 1 + 0 * p])
+        self.heights = None
+
+    def update(self, states, values, accepted, first):
+        """
+        Add the iterations `first`, `first + 1`, ... with the (n, d) `states`
+        and their log-posterior `values`, and the (n,) `accepted` flags of
+        their proposals (None for the initial state). The summaries are
+        accumulated in double precision, whatever the type of `states`.
+        """
+        states = np.asarray(states, dtype=float)
+        best = int(np.argmax(values))
+        if values[best] > self.max_value:
+            self.max_value = float(values[best])
+            self.max_params = [float(x) for x in states[best]]
+        if accepted is not None:
+            self.recent = np.concatenate([self.recent, accepted])[-self.window :]
+        kept = states[max(self.start - first + 1, 0) :]
+        if len(kept) == 0:
+            return
+        # Merge the block moments into the running ones (Chan et al., 1979)
+        n = self.count + len(kept)
+        delta = np.mean(kept, axis=0) - self.mean
+        M2 = np.sum((kept - np.mean(kept, axis=0)) ** 2, axis=0)
+        self.M2 += M2 + delta ** 2 * self.count * len(kept) / n
+        self.mean += delta * len(kept) / n
+        self.count = n
+        # The P-square markers start from the first five kept states
+        if self.heights is None:
+            self.first = np.concatenate([self.first, kept])
+            if len(self.first) < 5:
+                return
+            k = len(self.quantiles)
+            init = np.sort(self.first[:5], axis=0)
+            self.heights = np.repeat(np.transpose(init)[:, np.newaxis], k, axis=1)
+            self.positions = np.tile(np.arange(1.0, 6.0), (self.d, k, 1))
+            self.desired = np.tile(1 + 4 * self.increments, (self.d, 1, 1))
+            kept = self.first[5:]
+        p2_block(
+            self.heights,
+            self.positions,
+            self.desired,
+            self.increments,
+            np.ascontiguousarray(kept),
+        )
+
+    def quantile_values(self):
+        """
+        Current estimates of the `quantiles`, as a (k, d) array.
+        """
+        if self.heights is None:
+            if len(self.first) == 0:
+                return np.full((len(self.quantiles), self.d), np.nan)
+            return np.percentile(self.first, 100 * np.array(self.quantiles), axis=0)
+        return np.transpose(self.heights[:, :, 2])
+
+    def as_dict(self):
+        return {
+            "map_params": self.max_params,
+            "map_logpost": self.max_value,
+            "count": self.count,
+            "mean": self.mean.tolist(),
+            "std": np.sqrt(self.M2 / max(self.count - 1, 1)).tolist(),
+            "quantiles": dict(zip(self.quantiles, self.quantile_values().tolist())),
+            "acceptance": float(np.mean(self.recent)) if len(self.recent) else None,
+        }
+
+
+def combine_summaries(summaries):
+    """
+    Pool the `OnlineSummary` of every chain: the MAP over all of the chains,
+    the exact pooled mean and standard deviation, and the quantiles averaged
+    across the chains (the P-square markers cannot be merged exactly).
+    """
+    best = max(summaries, key=lambda s: s.max_value)
+    count = sum(s.count for s in summaries)
+    mean = sum(s.count * s.mean for s in summaries) / count
+    M2 = sum(s.M2 + s.count * (s.mean - mean) ** 2 for s in summaries)
+    quantiles = np.mean([s.quantile_values() for s in summaries], axis=0)
+    return {
+        "map_params": best.max_params,
+        "map_logpost": best.max_value,
+        "count": count,
+        "mean": mean.tolist(),
+        "std": np.sqrt(M2 / max(count - 1, 1)).tolist(),
+        "quantiles": dict(zip(best.quantiles, quantiles.tolist())),
+        "acceptance": [s.as_dict()["acceptance"] for s in summaries],
+    }
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tell module what it's allowed to import
+__all__ = ["FILL_VALUE", "synthetic_gauge", "true_return_levels"]
+
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+
+# Sentinel for missing hours in the UHSLC hourly records
+FILL_VALUE = -32767
+
+
+def synthetic_gauge(
+    path,
+    n_years,
+    params=(900, 150, 0.1),
+    interval=1,
+    missing=0.02,
+    gappy=0.1,
+    start_year=1970,
+    seed=0,
+):
+    """
+    Write a synthetic tide gauge record to `path`, in the UHSLC hourly CSV
+    format read by `utils.read_and_clean`, whose annual maxima follow the GEV
+    distribution with the known `params` (:math:`\\mu` and :math:`\\sigma` in
+    mm, and :math:`\\xi`).
+
+    Parameters
+    ----------
+    path : str
+        where to write the CSV file
+    n_years : int
+        length of the record, in years
+    params : tuple
+        the GEV parameters of the annual maxima
+    interval : int
+        hours between measurements (1 for an hourly record)
+    missing : float
+        fraction of the measurements of each year replaced by `FILL_VALUE`
+    gappy : float
+        fraction of the years that are mostly missing (70% of their
+        measurements), which `read_and_clean` should drop
+    start_year : int
+        first year of the record
+    seed : int
+        seed of the random numbers, so that the records are reproducible
+
+    Returns
+    -------
+    annual_maxima : :class:`numpy.ndarray`
+        the annual maxima above the yearly mean sea level that were inserted
+        into the years that are not gappy [mm]
+    """
+    rng = np.random.RandomState(seed)
+    mu, sigma, xi = params
+    # Every `interval` hours from the start of the first year up to (but not
+    # including) the start of the year after the last
+    step = pd.Timedelta(hours=interval)
+    span = pd.Timestamp(str(start_year + n_years)) - pd.Timestamp(str(start_year))
+    times = pd.date_range(str(start_year), periods=int(np.ceil(span / step)), freq=step)
+    years = np.asarray(times.year)
+    t = np.arange(len(times)) * interval
+    # Mean sea level, a semi-diurnal tide and noise, well below the surges
+    sealevel = 2000 + 300 * np.sin(2 * np.pi * t / 12.42) + rng.normal(0, 30, len(t))
+    # One surge per year at a random time, above the yearly mean sea level
+    starts = np.flatnonzero(np.diff(years, prepend=years[0] - 1))
+    counts = np.diff(np.append(starts, len(years)))
+    peaks = starts + (rng.uniform(size=n_years) * counts).astype(int)
+    surges = stats.genextreme.rvs(
+        c=-xi, loc=mu, scale=sigma, size=n_years, random_state=rng
+    )
+    sealevel[peaks] = 2000 + surges
+    sealevel = np.round(sealevel).astype(int)
+    # Knock out random measurements, and most of the gappy years
+    is_gappy = rng.uniform(size=n_years) < gappy
+    p = np.where(is_gappy, 0.7, missing)[years - start_year]
+    out = rng.uniform(size=len(t)) < p
+    out[peaks[~is_gappy]] = False
+    sealevel[out] = FILL_VALUE
+    pd.DataFrame(
+        {
+            "year": years,
+            "month": times.month,
+            "day": times.day,
+            "hour": times.hour,
+            "sealevel": sealevel,
+        }
+    ).to_csv(path, header=False, index=False)
+    return surges[~is_gappy]
+
+
+def true_return_levels(params, periods=(2, 5, 10, 20, 50, 100, 200, 500)):
+    """
+    Return levels [m] of the GEV distribution with `params` (in mm) for the
+    return `periods` [years], as reported in return_levels.csv
+    """
+    mu, sigma, xi = params
+    q = 1 - 1 / np.asarray(periods, dtype=float)
+    return stats.genextreme.ppf(q, c=-xi, loc=mu / 1000, scale=sigma / 1000)
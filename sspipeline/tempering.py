@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tell module what it's allowed to import
+__all__ = ["parallel_tempering"]
+
+import numpy as np
+
+from .events import PopulationProgress
+
+
+def ladder(spacings):
+    """
+    Convert the log temperature spacings into the inverse temperatures
+    (`betas`) of the replicas, with the coldest replica fixed at a temperature
+    of 1.
+    """
+    temps = np.concatenate([[1.0], 1 + np.cumsum(np.exp(spacings))])
+    return 1 / temps
+
+
+def parallel_tempering(
+    initial_states,
+    n_iter,
+    stepsize,
+    data_meas,
+    loglikelihood,
+    logprior,
+    t0,
+    n_temps=8,
+    max_temp=100.0,
+    nu=100.0,
+    tau=1000.0,
+    events=None,
+):
+    """
+    Replica-exchange (parallel tempering) sampler. Each of the `m` chains (one
+    per row of `initial_states`) is replaced by a ladder of `n_temps` replicas
+    targeting the tempered posterior
+
+    .. math:: \\log p(\\theta) + \\beta_k \\log L(\\theta), \\quad
+              1 = \\beta_0 > \\beta_1 > \\dots
+
+    where the hot replicas can cross the low-probability regions (such as the
+    ridge toward large shape parameters) that trap a single chain. All
+    m * n_temps replicas are advanced with one batched call to `loglikelihood`
+    and `logprior` per iteration, so both must accept a batch of parameter sets
+    (see `gev_utils.batch_loglikelihood` and `gev_utils.batch_logprior`).
+
+    Every replica takes an adaptive Metropolis step: Gaussian random walk with
+    the `stepsize` variances scaled by its temperature until iteration `t0`,
+    and with its own running covariance (Haario et al., 2001) afterwards. Then
+    neighbouring replicas propose to swap states, alternating between the even
+    and the odd pairs. The ladder starts geometric up to `max_temp`, and its
+    log spacings are adapted to equalize the swap acceptance rates, with the
+    diminishing gain (tau / (t + tau)) / nu of Vousden, Farr & Mandel (2016;
+    https://doi.org/10.1093/mnras/stv2422).
+
+    Only the cold replicas are returned, in the same format as `runner`, with
+    the acceptance rates of their within-temperature moves.
+
+    If an `events.EventStream` is passed as `events`, "progress" events of
+    each (cold) chain are emitted to it every `events.every` iterations (see
+    `events.PopulationProgress`).
+    """
+    np.seterr(over="ignore")
+    m, d = initial_states.shape
+    K = n_temps
+    I_d = np.identity(d)
+    S_d = (2.4) ** 2 / d
+    spacings = np.full(K - 1, np.log(max_temp ** (1 / (K - 1.0)) - 1))
+    spacings += np.log(max_temp ** (np.arange(K - 1) / (K - 1.0)))
+    betas = ladder(spacings)
+
+    state = np.repeat(np.array(initial_states, dtype=float)[:, np.newaxis], K, axis=1)
+    prior = logprior(state)
+    LL = loglikelihood(state, data_meas)
+    # Running mean and covariance of every replica
+    mean = np.array(state)
+    cov = np.zeros((m, K, d, d))
+    count = 1
+    parameters = np.empty((m, d, n_iter + 1))
+    lpost = np.empty((m, n_iter + 1))
+    parameters[:, :, 0] = state[:, 0]
+    lpost[:, 0] = prior[:, 0] + LL[:, 0]
+    n_accept = np.zeros(m)
+    progress = None
+    if events is not None:
+        progress = PopulationProgress(events, m, n_iter)
+    chains, pairs = np.arange(m)[:, np.newaxis], np.arange(K - 1)
+    for t in range(n_iter):
+        # Within-temperature adaptive Metropolis moves
+        if t <= t0:
+            scale = np.sqrt(np.asarray(stepsize, dtype=float) / betas[:, np.newaxis])
+            proposal = state + scale * np.random.normal(size=(m, K, d))
+        else:
+            L = np.linalg.cholesky(S_d * cov + S_d * 0.0001 * I_d)
+            z = np.random.normal(size=(m, K, d, 1))
+            proposal = state + np.matmul(L, z)[..., 0]
+        new_prior = logprior(proposal)
+        new_LL = loglikelihood(proposal, data_meas)
+        with np.errstate(invalid="ignore"):
+            accept = np.log(np.random.uniform(size=(m, K))) < (
+                new_prior + betas * new_LL - prior - betas * LL
+            )
+        state[accept] = proposal[accept]
+        prior[accept] = new_prior[accept]
+        LL[accept] = new_LL[accept]
+        n_accept += accept[:, 0]
+        # Swap moves between neighbouring temperatures
+        with np.errstate(invalid="ignore"):
+            log_swap = (betas[:-1] - betas[1:]) * (LL[:, 1:] - LL[:, :-1])
+            swap_prob = np.exp(np.minimum(np.nan_to_num(log_swap, nan=-np.inf), 0))
+        offered = pairs[pairs % 2 == t % 2]
+        swap = np.random.uniform(size=(m, len(offered))) < swap_prob[:, offered]
+        rows, cols = np.nonzero(swap)
+        perm = np.tile(np.arange(K), (m, 1))
+        perm[rows, offered[cols]] = offered[cols] + 1
+        perm[rows, offered[cols] + 1] = offered[cols]
+        state, prior, LL = state[chains, perm], prior[chains, perm], LL[chains, perm]
+        # Adapt the ladder toward equal swap acceptance rates
+        if K > 2:
+            A = np.mean(swap_prob, axis=0)
+            kappa = tau / (t + tau) / nu
+            spacings[:-1] += kappa * (A[:-1] - A[1:])
+            betas = ladder(spacings)
+        # Update the running moments of every replica
+        count += 1
+        delta = state - mean
+        mean += delta / count
+        cov += (np.einsum("...i,...j->...ij", delta, state - mean) - cov) / count
+        parameters[:, :, t + 1] = state[:, 0]
+        lpost[:, t + 1] = prior[:, 0] + LL[:, 0]
+        if progress is not None:
+            progress.update(t + 1, n_accept, lpost[:, t + 1])
+    mcmc_chains = [parameters[i].tolist() for i in range(m)]
+    ls = [lpost[i].tolist() for i in range(m)]
+    ar = (n_accept / n_iter).tolist()
+    return mcmc_chains, ar, ls
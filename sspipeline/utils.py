@@ -18,14 +18,25 @@
 # along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
 
 # Tell module what it's allowed to import
-__all__ = ["check_params", "read_and_clean", "log"]
+__all__ = ["check_params", "read_and_clean", "read_stations", "log"]
 
 import datetime
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 
+from .gaugefile import fill_value
+from .gaugefile import is_gauge_file
+from .gaugefile import open_gauge
+from .kernels import BACKENDS
+from .pot import decluster
+from .priors import compile_prior
+
 plt.style.use("ggplot")
+MODES = ["mcmc", "laplace", "bootstrap", "smc"]
+ENGINES = ["adaptive", "demc", "tempering", "mala"]
+STORAGE_DTYPES = ["float64", "float32"]
+EXTRACTIONS = ["annual_maxima", "pot"]
 
 
 def check_params(params):
@@ -53,6 +64,13 @@ def check_params(params):
         new_params["data"] = params["data"]
     else:
         raise TypeError("You need to pass in a 'data' parameter!")
+    # Check whether the data file holds the records of many stations
+    if "combined" in params:
+        new_params["combined"] = bool(params["combined"])
+        if new_params["combined"] and isinstance(new_params["data"], list):
+            raise ValueError("A 'combined' data parameter must be a single file")
+    else:
+        new_params["combined"] = False
     # Check for the output parameter
     if "output_dir" in params:
         new_params["output_dir"] = params["output_dir"]
@@ -81,11 +99,167 @@ def check_params(params):
         new_params["adaption"] = params["adaption"]
     else:
         new_params["adaption"] = round(0.1 * new_params["iterations"])
-    # Check for the transition covariance matrix
+    # Check for the uncertainty estimation mode
+    if "mode" in params:
+        if params["mode"] not in MODES:
+            raise ValueError(
+                "The 'mode' parameter must be one of: " + ", ".join(MODES)
+            )
+        new_params["mode"] = params["mode"]
+    else:
+        new_params["mode"] = "mcmc"
+    # Check for the number of parameter sets to draw outside of MCMC mode
+    if "samples" in params:
+        new_params["samples"] = params["samples"]
+    else:
+        new_params["samples"] = 10000
+    # Check for the MCMC engine
+    if "engine" in params:
+        if params["engine"] not in ENGINES:
+            raise ValueError(
+                "The 'engine' parameter must be one of: " + ", ".join(ENGINES)
+            )
+        new_params["engine"] = params["engine"]
+    else:
+        new_params["engine"] = "adaptive"
+    # Check for the number of parallel tempering replicas per chain
+    if "temperatures" in params:
+        temperatures = params["temperatures"]
+        if (
+            isinstance(temperatures, bool)
+            or not isinstance(temperatures, int)
+            or temperatures < 2
+        ):
+            raise ValueError(
+                "The 'temperatures' parameter must be an integer of at least 2"
+            )
+        new_params["temperatures"] = temperatures
+    else:
+        new_params["temperatures"] = 8
+    # Check for the priors on the GEV parameters (compiled here to validate them)
+    if "priors" in params:
+        compile_prior(params["priors"])
+        new_params["priors"] = params["priors"]
+    else:
+        new_params["priors"] = {}
+    # Check for the adapted proposals of a previous run to warm start from
+    if "proposal" in params:
+        new_params["proposal"] = params["proposal"]
+    else:
+        new_params["proposal"] = None
+    # Check to see if the warm-started chains should skip the warm-up
+    if "skip_warmup" in params:
+        new_params["skip_warmup"] = bool(params["skip_warmup"])
+    else:
+        new_params["skip_warmup"] = False
+    # Check whether to dump cProfile statistics for every stage
+    if "cprofile" in params:
+        new_params["cprofile"] = bool(params["cprofile"])
+    else:
+        new_params["cprofile"] = False
+    # Check for the JSON-lines file to write the events of the run to
+    if "events" in params:
+        new_params["events"] = params["events"]
+    else:
+        new_params["events"] = None
+    # Check for the number of iterations between the progress events
+    if "event_interval" in params:
+        if int(params["event_interval"]) < 1:
+            raise ValueError("The 'event_interval' parameter must be at least 1")
+        new_params["event_interval"] = int(params["event_interval"])
+    else:
+        new_params["event_interval"] = 1000
+    # Check for how the extremes are extracted from the records
+    if "extraction" in params:
+        if params["extraction"] not in EXTRACTIONS:
+            raise ValueError(
+                "The 'extraction' parameter must be one of: " + ", ".join(EXTRACTIONS)
+            )
+        new_params["extraction"] = params["extraction"]
+    else:
+        new_params["extraction"] = "annual_maxima"
+    if new_params["extraction"] == "pot":
+        if isinstance(new_params["data"], list) or new_params["combined"]:
+            raise ValueError("Peaks over threshold can only be fitted to one gauge")
+        if new_params["mode"] not in ["mcmc", "laplace"]:
+            raise ValueError(
+                "Peaks over threshold can only be fitted in 'mcmc' or 'laplace' mode"
+            )
+        if new_params["engine"] == "mala":
+            raise ValueError("Peaks over threshold cannot be fitted with 'mala'")
+    # Check for the quantile of the sea levels used as the threshold
+    if "threshold" in params:
+        if not 0 < params["threshold"] < 1:
+            raise ValueError("The 'threshold' parameter must be between 0 and 1")
+        new_params["threshold"] = params["threshold"]
+    else:
+        new_params["threshold"] = 0.99
+    # Check for the shortest gap between clusters of exceedances, in hours
+    if "run_length" in params:
+        if params["run_length"] <= 0:
+            raise ValueError("The 'run_length' parameter must be positive")
+        new_params["run_length"] = params["run_length"]
+    else:
+        new_params["run_length"] = 72
+    # Check for the number of threads to shard the likelihood over
+    if "threads" in params:
+        if int(params["threads"]) < 0:
+            raise ValueError("The 'threads' parameter must be at least 0")
+        new_params["threads"] = int(params["threads"])
+    else:
+        new_params["threads"] = 1
+    # Check for the floating-point type the chains are stored in
+    if "storage_dtype" in params:
+        if params["storage_dtype"] not in STORAGE_DTYPES:
+            raise ValueError(
+                "The 'storage_dtype' parameter must be one of: "
+                + ", ".join(STORAGE_DTYPES)
+            )
+        new_params["storage_dtype"] = params["storage_dtype"]
+    else:
+        new_params["storage_dtype"] = "float64"
+    # Check for the backend of the adaptive Metropolis-Hastings kernels
+    if "backend" in params:
+        if params["backend"] not in BACKENDS:
+            raise ValueError(
+                "The 'backend' parameter must be one of: " + ", ".join(BACKENDS)
+            )
+        new_params["backend"] = params["backend"]
+    else:
+        new_params["backend"] = "auto"
+    # Several gauges are fitted together by the multisite sampler, which
+    # supports neither the other modes, engines and backends nor warm starts
+    if isinstance(new_params["data"], list) or new_params["combined"]:
+        if new_params["mode"] != "mcmc":
+            raise ValueError("Several gauges can only be fitted in 'mcmc' mode")
+        if new_params["engine"] != "adaptive":
+            raise ValueError("Several gauges can only be fitted with 'adaptive'")
+        if new_params["backend"] == "numba":
+            raise ValueError("Several gauges cannot be fitted with 'numba'")
+        if new_params["proposal"] is not None or new_params["skip_warmup"]:
+            raise ValueError("Several gauges cannot be warm started from a proposal")
+    # Check for a previous output directory to warm-start SMC from
+    if "previous" in params:
+        new_params["previous"] = params["previous"]
+    else:
+        new_params["previous"] = None
+    # Check for the number of new annual maxima since the previous run
+    if "new_observations" in params:
+        new_params["new_observations"] = params["new_observations"]
+    else:
+        new_params["new_observations"] = 1
+    # Check for the number of worker processes
+    if "processes" in params:
+        new_params["processes"] = params["processes"]
+    else:
+        new_params["processes"] = 1
+    # Check for the transition covariance matrix (only needed for MCMC)
     if "transition" in params:
         new_params["transition"] = params["transition"]
-    else:
+    elif new_params["mode"] == "mcmc":
         raise TypeError("You need to pass in a 'transition' parameter!")
+    else:
+        new_params["transition"] = None
     # Check to see if the user wants to plot
     if "plot" in params:
         new_params["plot"] = bool(params["plot"])
@@ -133,80 +307,378 @@ def read_and_clean(
     logger : :class:`logging.Logger`
         updated logger for the command line tool
     """
-    dfSL = pd.read_csv(datafile, header=None)
-    dfSL.rename(
-        columns={0: "year", 1: "month", 2: "day", 3: "hour", 4: "sealevel"},
-        inplace=True,
-    )
-    num_years = len(list(set(dfSL["year"])))
+    sealevel, valid, years, bounds, fill_in, _ = load_record(datafile)
+    num_years = len(years)
+
+    if fill_in is None:
+        logger = log(logger, "there is no fill in value", verbose)
+    else:
+        logger = log(
+            logger, "the fill in value is {0}".format(float(fill_in) / 1000), verbose
+        )
+    max_sl = annual_maxima(sealevel, valid, years, bounds, percentage)
+    data = list(max_sl.values())
 
-    fill_in = dfSL.loc[dfSL["sealevel"] < -5000, "sealevel"].mode()[0]
     logger = log(
-        logger, "the fill in value is {0}".format(float(fill_in) / 1000), verbose
+        logger,
+        "the percentage of years that have enough data to use is {}%".format(
+            round(100 * len(data) / num_years, 2)
+        ),
+        verbose,
     )
 
-    dfSL["sealevel"].replace(fill_in, np.nan, inplace=True)
-    dfSL.dropna(inplace=True)
+    if plot:
+        plot_annual_maxima(max_sl, output_dir)
 
-    n_hours = 365 * 24
-    sl_year = {}
+    return data, logger
 
-    for index, row in dfSL.iterrows():
-        year = row["year"]
-        sl = row["sealevel"]
-        if year in sl_year:
-            sl_year[year].append(sl)
-        else:
-            sl_year[year] = []
-            sl_year[year].append(sl)
 
-    max_sl = {}
+def read_exceedances(
+    datafile,
+    percentage,
+    threshold=0.99,
+    run_length=72,
+    output_dir="output",
+    logger=None,
+    verbose=False,
+    plot=False,
+):
+    """
+    Reads & cleans the dataset like `read_and_clean`, and also extracts the
+    declustered peaks over a threshold of the sea levels (with the mean of
+    each year removed) from the years with enough data
 
-    for year, sealevel in sl_year.items():
-        if len(sealevel) / n_hours >= percentage:
-            max_sl[year] = max(np.array(sealevel) - np.mean(sealevel))
+    Parameters
+    ----------
+    datafile : str
+        where the dataset file is located
+    percentage : float
+        how much data to use in good years
+    threshold : float
+        quantile of the sea levels to use as the threshold
+    run_length : float
+        the shortest gap between clusters of exceedances, in hours
+    output_dir : str
+        where to put the output from the function
+    logger : :class:`logging.Logger`
+        logger that the command line tool uses
+    verbose : bool
+        whether or not to be verbose
+    plot : bool
+        whether or not to plot
 
+    Returns
+    -------
+    data : :class:`numpy.ndarray`
+        cleaned annual maxima
+    exceedances : dict
+        the declustered "peaks", their "threshold" (both in mm), and the
+        number of years they were taken from ("n_years")
+    logger : :class:`logging.Logger`
+        updated logger for the command line tool
+    """
+    sealevel, valid, years, bounds, fill_in, hours = load_record(
+        datafile, with_hours=True
+    )
+    if fill_in is None:
+        logger = log(logger, "there is no fill in value", verbose)
+    else:
+        logger = log(
+            logger, "the fill in value is {0}".format(float(fill_in) / 1000), verbose
+        )
+    max_sl = annual_maxima(sealevel, valid, years, bounds, percentage)
     data = list(max_sl.values())
-
-    if plot:
-        fig, ax = plt.subplots(figsize=(12, 7))
-        vals = []
-        for i in range(len(list(max_sl.values()))):
-            vals.append(list(max_sl.values())[i] / 1000)
-        ax.scatter(list(max_sl.keys()), vals, color="#34495e")
-        ax.set_xlabel("Year", fontsize=14)
-        ax.set_ylabel("Annual Maximum Sea Level [m]", fontsize=14)
-        fig.savefig(output_dir + "plots/cleaned_data.png")
-
     logger = log(
         logger,
         "the percentage of years that have enough data to use is {}%".format(
-            round(100 * len(data) / num_years, 2)
+            round(100 * len(data) / len(years), 2)
+        ),
+        verbose,
+    )
+    # Remove the mean of each good year, and leave out the rest
+    times, levels = [], []
+    good = set(max_sl)
+    for year, start, end in zip(years, bounds[:-1], bounds[1:]):
+        if year in good:
+            kept = valid[start:end]
+            sl = sealevel[start:end][kept]
+            times.append(hours[start:end][kept])
+            levels.append(sl - np.mean(sl))
+    times = np.concatenate(times) if times else np.empty(0)
+    levels = np.concatenate(levels) if levels else np.empty(0)
+    if len(levels) == 0:
+        raise ValueError("There are no years with enough data in " + str(datafile))
+    u = float(np.quantile(levels, threshold))
+    peaks, _ = decluster(times, levels, u, run_length)
+    exceedances = {"peaks": peaks, "threshold": u, "n_years": len(good)}
+    logger = log(
+        logger,
+        "there are {0} declustered peaks over the threshold of {1} m in {2} years "
+        "({3} per year)".format(
+            len(peaks), round(u / 1000, 3), len(good), round(len(peaks) / len(good), 2)
         ),
         verbose,
     )
-
     if plot:
-        fig, ax = plt.subplots(figsize=(12, 7))
-        plot_data = []
-        for i in range(len(data)):
-            plot_data.append(data[i] / 1000)
-        ax.hist(
-            x=plot_data,
-            bins=np.linspace(min(plot_data), max(plot_data)),
-            color="#34495e",
-            edgecolor="white",
+        plot_annual_maxima(max_sl, output_dir)
+    return data, exceedances, logger
+
+
+def load_record(datafile, with_hours=False):
+    """
+    Loads a record, either from the UHSLC hourly CSV format or from a binary
+    file written by `gaugefile.convert_gauge` (which is mapped into memory
+    rather than read), in order of time
+
+    Parameters
+    ----------
+    datafile : str
+        where the dataset file is located
+    with_hours : bool
+        whether the hours of the measurements are needed
+
+    Returns
+    -------
+    sealevel : :class:`numpy.ndarray`
+        the sea levels, in mm
+    valid : :class:`numpy.ndarray`
+        whether each sea level is a measurement, rather than missing
+    years : :class:`numpy.ndarray`
+        the years with measurements
+    bounds : :class:`numpy.ndarray`
+        the measurements of ``years[i]`` are ``bounds[i]:bounds[i + 1]``
+    fill_in : int or None
+        the fill in value
+    hours : :class:`numpy.ndarray`
+        the hours since 1970-01-01T00 of the measurements (None unless
+        `with_hours`)
+    """
+    if is_gauge_file(datafile):
+        # Work directly on the memory-mapped columns of a converted record
+        hours, sealevel, mask, fill_in = open_gauge(datafile)
+        years, bounds = year_bounds(hours)
+        return sealevel, ~mask, years, bounds, fill_in, hours
+    dfSL = pd.read_csv(datafile, header=None)
+    dfSL.rename(
+        columns={0: "year", 1: "month", 2: "day", 3: "hour", 4: "sealevel"},
+        inplace=True,
+    )
+    year = dfSL["year"].to_numpy()
+    sealevel = dfSL["sealevel"].to_numpy()
+    fill_in = fill_value(sealevel)
+    valid = dfSL.notna().all(axis=1).to_numpy() & (sealevel != fill_in)
+    hours = None
+    if with_hours:
+        times = pd.to_datetime(dfSL[["year", "month", "day", "hour"]], errors="coerce")
+        hours = ((times - pd.Timestamp(0)) // pd.Timedelta(hours=1)).to_numpy()
+        valid &= ~np.isnan(hours)
+        hours = np.nan_to_num(hours).astype(np.int64)
+    key = year if hours is None else hours
+    if np.any(np.diff(key) < 0):
+        order = np.argsort(key, kind="stable")
+        year, sealevel, valid = year[order], sealevel[order], valid[order]
+        if hours is not None:
+            hours = hours[order]
+    starts = np.flatnonzero(np.diff(year, prepend=year[:1] - 1))
+    return sealevel, valid, year[starts], np.append(starts, len(year)), fill_in, hours
+
+
+def annual_maxima(sealevel, valid, years, bounds, percentage):
+    """
+    Finds the maximum of the sea levels of each year with enough data, less
+    the mean of that year
+
+    Parameters
+    ----------
+    sealevel : :class:`numpy.ndarray`
+        the sea levels, in mm
+    valid : :class:`numpy.ndarray`
+        whether each sea level is a measurement, rather than missing
+    years : :class:`numpy.ndarray`
+        the years with measurements
+    bounds : :class:`numpy.ndarray`
+        the measurements of ``years[i]`` are ``bounds[i]:bounds[i + 1]``
+    percentage : float
+        how much data to use in good years
+
+    Returns
+    -------
+    max_sl : dict
+        the annual maximum of each good year
+    """
+    n_hours = 365 * 24
+    max_sl = {}
+    for year, start, end in zip(years, bounds[:-1], bounds[1:]):
+        sl = sealevel[start:end][valid[start:end]]
+        if len(sl) > 0 and len(sl) / n_hours >= percentage:
+            max_sl[year] = float(np.max(sl) - np.mean(sl))
+    return max_sl
+
+
+def read_stations(datafile, percentage, logger=None, verbose=False, chunksize=1000000):
+    """
+    Reads & cleans a combined dataset of many stations in a single pass, in
+    chunks of `chunksize` rows. Its first column is the station id, followed by
+    the columns read by `read_and_clean`. Each station's fill in value, years
+    and annual maxima are found as in `read_and_clean`, from running sums kept
+    per station and year, so the records are never split up or held in memory.
+
+    Parameters
+    ----------
+    datafile : str
+        where the combined dataset file is located
+    percentage : float
+        how much data to use in good years
+    logger : :class:`logging.Logger`
+        logger that the command line tool uses
+    verbose : bool
+        whether or not to be verbose
+    chunksize : int
+        number of rows read at a time
+
+    Returns
+    -------
+    stations : dict
+        the annual maxima (a dictionary of year to maximum) of each station, in
+        order of appearance
+    logger : :class:`logging.Logger`
+        updated logger for the command line tool
+    """
+    keys = ["station", "year"]
+    rows, highs, lows = [], [], []
+    for chunk in pd.read_csv(
+        datafile, header=None, dtype={0: str}, chunksize=chunksize
+    ):
+        chunk.columns = ["station", "year", "month", "day", "hour", "sealevel"]
+        rows.append(chunk.groupby(keys, sort=False).size())
+        chunk = chunk.dropna()
+        low = chunk["sealevel"] < -5000
+        # Candidates for the fill in value are counted separately, since it is
+        # only known once every row of the station has been read
+        highs.append(
+            chunk[~low]
+            .groupby(keys, sort=False)["sealevel"]
+            .agg(["count", "sum", "max"])
         )
-        ax.set_xlabel("Annual Max Sea Level [m]", fontsize=14)
-        ax.set_ylabel("Frequency", fontsize=14)
-        fig.savefig(output_dir + "plots/annual_maximum.png")
+        lows.append(chunk[low].groupby(keys + ["sealevel"], sort=False).size())
+    rows = pd.concat(rows).groupby(level=keys, sort=False).sum()
+    lows = pd.concat(lows).groupby(level=keys + ["sealevel"]).sum()
+    lows = lows.rename("count").reset_index()
+    # The fill in value of each station is its most common low value
+    counts = lows.groupby(["station", "sealevel"])["count"].sum().reset_index()
+    fills = counts.loc[counts.groupby("station")["count"].idxmax()]
+    fills = dict(zip(fills["station"], fills["sealevel"]))
+    # Any other low values are measurements
+    lows = lows[lows["sealevel"] != lows["station"].map(fills)]
+    highs.append(
+        pd.DataFrame(
+            {
+                "count": lows["count"].to_numpy(),
+                "sum": (lows["count"] * lows["sealevel"]).to_numpy(),
+                "max": lows["sealevel"].to_numpy(),
+            },
+            index=pd.MultiIndex.from_frame(lows[keys]),
+        )
+    )
+    years = pd.concat(highs).groupby(level=keys, sort=False)
+    years = pd.concat(
+        [years["count"].sum(), years["sum"].sum(), years["max"].max()], axis=1
+    )
 
-    return data, logger
+    n_hours = 365 * 24
+    stations = {}
+    for station, num_years in rows.groupby(level="station", sort=False).size().items():
+        fill_in = fills.get(station)
+        if fill_in is None:
+            logger = log(logger, station + ": there is no fill in value", verbose)
+        else:
+            logger = log(
+                logger,
+                station + ": the fill in value is {0}".format(float(fill_in) / 1000),
+                verbose,
+            )
+        max_sl = {}
+        if station in years.index:
+            station_years = years.loc[station].sort_index()
+            for year, (count, total, maximum) in station_years.iterrows():
+                if count > 0 and count / n_hours >= percentage:
+                    max_sl[year] = float(maximum - total / count)
+        logger = log(
+            logger,
+            station
+            + ": the percentage of years that have enough data to use is {}%".format(
+                round(100 * len(max_sl) / num_years, 2)
+            ),
+            verbose,
+        )
+        stations[station] = max_sl
+    return stations, logger
+
+
+def plot_annual_maxima(max_sl, output_dir="output"):
+    """
+    Plot the annual maxima `max_sl` (a dictionary of year to maximum) against
+    their years, and their histogram, into the plots in `output_dir`.
+    """
+    data = list(max_sl.values())
+    fig, ax = plt.subplots(figsize=(12, 7))
+    vals = []
+    for i in range(len(data)):
+        vals.append(data[i] / 1000)
+    ax.scatter(list(max_sl.keys()), vals, color="#34495e")
+    ax.set_xlabel("Year", fontsize=14)
+    ax.set_ylabel("Annual Maximum Sea Level [m]", fontsize=14)
+    fig.savefig(output_dir + "plots/cleaned_data.png")
+
+    fig, ax = plt.subplots(figsize=(12, 7))
+    ax.hist(
+        x=vals,
+        bins=np.linspace(min(vals), max(vals)),
+        color="#34495e",
+        edgecolor="white",
+    )
+    ax.set_xlabel("Annual Max Sea Level [m]", fontsize=14)
+    ax.set_ylabel("Frequency", fontsize=14)
+    fig.savefig(output_dir + "plots/annual_maximum.png")
+
+
+def year_bounds(hours):
+    """
+    Split a record into its years, from its increasing `hours` since
+    1970-01-01T00.
+
+    Parameters
+    ----------
+    hours : :class:`numpy.ndarray`
+        hours of the measurements
+
+    Returns
+    -------
+    years : :class:`numpy.ndarray`
+        the years with measurements
+    bounds : :class:`numpy.ndarray`
+        the measurements of ``years[i]`` are ``bounds[i]:bounds[i + 1]``
+    """
+    if len(hours) == 0:
+        return np.empty(0, dtype=int), np.zeros(1, dtype=int)
+    first, last = (
+        np.array([hours[0], hours[-1]], dtype="datetime64[h]")
+        .astype("datetime64[Y]")
+        .astype(int)
+    )
+    years = np.arange(first, last + 2)
+    starts = years.astype("datetime64[Y]").astype("datetime64[h]").astype(np.int64)
+    bounds = np.searchsorted(hours, starts)
+    # Leave out the years with no measurements at all
+    keep = np.flatnonzero(np.diff(bounds) > 0)
+    return years[keep] + 1970, np.append(bounds[keep], bounds[-1])
 
 
 def log(logger, message, verbose):
     """
-    A logging function (only to be used by the command line tool tool)
+    A logging function (only to be used by the command line tool tool). The
+    message is only written to the `logger`, marked to be shown on the console
+    if `verbose` (see `events.LogEvents`).
 
     Parameters
     ----------
@@ -222,7 +694,5 @@ def log(logger, message, verbose):
     logger : :class:`logging.Logger`
         updated logger for the command line tool
     """
-    logger.info(message)
-    if verbose:
-        print("INFO :", message)
+    logger.info(message, extra={"verbose": bool(verbose)})
     return logger
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Tests of the analytic gradient of the GEV log-posterior against central
+differences of `gev_utils.batch_logpost`
+"""
+
+import numpy as np
+import pytest
+
+from sspipeline.gev_utils import batch_logpost
+from sspipeline.gev_utils import grad_logpost
+
+# Annual maxima (in mm) drawn from a Gumbel distribution
+DATA = np.sort(np.random.RandomState(0).gumbel(1000, 100, size=50))
+
+
+def central_differences(parameters, data, step=1e-5):
+    """
+    The gradient of `batch_logpost` by central differences, with steps
+    relative to the size of each parameter (absolute for xi)
+    """
+    scale = np.maximum(np.abs(parameters), 1.0)
+    scale[2] = 1.0
+    grad = np.zeros(3)
+    for i in range(3):
+        h = np.zeros(3)
+        h[i] = step * scale[i]
+        grad[i] = (
+            batch_logpost(parameters + h, data) - batch_logpost(parameters - h, data)
+        ) / (2 * h[i])
+    return grad
+
+
+@pytest.mark.parametrize("xi", [0.1, -0.1, 0.0, 1e-8])
+def test_grad_logpost(xi):
+    parameters = np.array([1000.0, 100.0, xi])
+    assert np.isfinite(batch_logpost(parameters, DATA))
+    np.testing.assert_allclose(
+        grad_logpost(parameters, DATA),
+        central_differences(parameters, DATA),
+        rtol=1e-5,
+        atol=1e-6,
+    )
+
+
+def test_grad_logpost_batch():
+    parameters = np.array([[1000.0, 100.0, xi] for xi in [0.1, -0.1, 0.0, 1e-8]])
+    expected = np.array([grad_logpost(p, DATA) for p in parameters])
+    np.testing.assert_allclose(grad_logpost(parameters, DATA), expected)
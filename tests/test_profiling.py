@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 The MUSSLES Developers
+#
+# This file is part of MUSSLES.
+#
+# MUSSLES is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUSSLES is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MUSSLES.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Tests that the Numba compilation is timed as a stage of its own, and not as
+part of the sampling times that the effective samples per second divide by
+"""
+
+from functools import partial
+
+import numpy as np
+import pytest
+
+from sspipeline import gev_utils
+from sspipeline.core import runner
+from sspipeline.kernels import HAVE_NUMBA
+from sspipeline.kernels import compile_kernels
+from sspipeline.priors import compile_prior
+from sspipeline.profiling import Profiler
+
+DATA = np.random.RandomState(0).gumbel(1000, 100, size=34)
+
+
+@pytest.mark.skipif(not HAVE_NUMBA, reason="Numba is not installed")
+@pytest.mark.parametrize("dtype", [None, "float32"])
+def test_compile_stage(dtype):
+    from sspipeline.kernels import jit_adaptive_block
+
+    prior = compile_prior({"xi": {"type": "normal", "loc": 0, "scale": 0.3}})
+    compile_kernels(prior.table, dtype)
+    n_signatures = len(jit_adaptive_block.signatures)
+    profiler = Profiler()
+    np.random.seed(0)
+    runner(
+        2,
+        200,
+        DATA,
+        partial(gev_utils.logpost, prior=prior),
+        t=50,
+        backend="numba",
+        prior=prior,
+        profiler=profiler,
+        dtype=dtype,
+    )
+    stages = [s["stage"] for s in profiler.stages]
+    assert stages == ["compile", "chain 1", "chain 2"]
+    # The chains ran on the signature that the tiny input compiled
+    assert len(jit_adaptive_block.signatures) == n_signatures